@@ -1 +1 @@
-grep -irn --include="*.c" %* *
\ No newline at end of file
+@python3 "%~dp0code_search.py" -G --include="*.c" %*
\ No newline at end of file
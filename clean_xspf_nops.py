@@ -9,35 +9,286 @@
 # don't end up in the right places, and the whole thing tends
 # to say collapsed until the last possible minute).
 #
+# Playlists are streamed through to a temp file (so memory use
+# stays constant, however big the playlist is), which then gets
+# swapped in place of the original. The original is kept as ".old".
+#
 # Date: 8 March 2019
 
 import sys
 import os
+import argparse
+import concurrent.futures
 import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+
+from xml.sax.saxutils import escape, quoteattr
+
+#######################################
+# Line-Based Filtering
+
+# Copy the playlist, skipping all the lines with NOP's
+# (assuming these are all on their own lines, as VLC writes them)
+# < f_in, f_out: (binary file) Files to read/write the playlist from/to
+# > returns: (int) Number of "vlc:node" elements removed
+def strip_vlc_nodes_by_line(f_in, f_out):
+	removed = 0
+	for line in f_in:
+		stripped = line.strip()
+		if stripped.startswith(b"<vlc:node "):
+			removed += 1
+		elif not stripped.startswith(b"</vlc:node>"):
+			f_out.write(line)
+	return removed
+
+#######################################
+# Structural Filtering
+#
+# This removes the "vlc:node" elements wherever they are in the file (not just when
+# they're on their own lines), moving their contents up to replace them. The file
+# gets written out again as it's being parsed, with each element being discarded
+# once it's been written, so that the whole playlist never needs to be in memory.
+#
+# NOTE: Comments + processing instructions in the playlist don't survive this
+
+# Namespace used for VLC's extensions to XSPF
+VLC_NAMESPACE = "http://www.videolan.org/vlc/playlist/ns/0/"
+
+# The tag for the NOP's, as ElementTree names it
+VLC_NODE_TAG = "{%s}node" % (VLC_NAMESPACE)
+
+# Namespace for the "xml:" prefix (e.g. "xml:base"), which is always bound without being declared
+XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+
+
+# Copy the playlist, parsing it as XML, and leaving out any "vlc:node" elements (but not their contents)
+# < f_in, f_out: (binary file) Files to read/write the playlist from/to
+# > returns: (int) Number of "vlc:node" elements removed
+# > throws "ET.ParseError" if the playlist isn't valid XML
+def strip_vlc_nodes_structural(f_in, f_out):
+	ns_bindings = [("xml", XML_NAMESPACE)]  # (prefix, uri) for each namespace declaration in scope (innermost last)
+	new_namespaces = []    # (prefix, uri) for namespaces declared on the next element
+	
+	# [element, is_removed, last_child, has_used_text, num_namespaces, carried_namespaces] for each element we're currently in
+	# NOTE: Namespaces declared on removed elements get "carried" down to the elements written out in their place
+	stack = []
+	tag_open = False       # Whether the last thing written was a start tag which still needs its closing '>'
+	removed = 0
+	
+	def write(text):
+		f_out.write(text.encode('utf-8'))
+	
+	# Get the name used for a tag/attribute in the original file (i.e. with the prefix in scope for its namespace)
+	# < is_attrib: (bool) Whether it's an attribute name (which can't use the default namespace)
+	# > throws "ValueError" if there's no prefix for its namespace
+	def qname(name, is_attrib=False):
+		if name[0] != '{':
+			return name
+		
+		uri, local = name[1:].split('}', 1)
+		for i in range(len(ns_bindings) - 1, -1, -1):
+			prefix, bound_uri = ns_bindings[i]
+			if bound_uri != uri or (is_attrib and not prefix):
+				continue
+			
+			# Make sure that the prefix hasn't been bound to something else further in
+			if all(other_prefix != prefix for other_prefix, _uri in ns_bindings[i + 1:]):
+				return "%s:%s" % (prefix, local) if prefix else local
+		
+		raise ValueError("No prefix in scope for namespace '%s'" % (uri))
+	
+	# Get the text that comes next within the element at the top of the stack
+	# NOTE: Any children that have been written out already get discarded here (after getting their tail)
+	def take_next_text(frame):
+		elem, _is_removed, last_child, has_used_text = frame[:4]
+		frame[3] = True
+		
+		if last_child is not None:
+			frame[2] = None
+			elem.remove(last_child)
+			return last_child.tail or ""
+		elif not has_used_text:
+			return elem.text or ""
+		else:
+			return ""
+	
+	# Write text between tags, finishing off any start tag that came before it
+	def write_text(text):
+		nonlocal tag_open
+		if text:
+			if tag_open:
+				write(">")
+				tag_open = False
+			write(escape(text))
+	
+	write('<?xml version="1.0" encoding="UTF-8"?>\n')
+	
+	for event, item in ET.iterparse(f_in, events=('start-ns', 'start', 'end')):
+		if event == 'start-ns':
+			new_namespaces.append(item)
+			continue
+		
+		elem = item
+		if event == 'start':
+			is_removed = (elem.tag == VLC_NODE_TAG)
+			
+			ns_bindings.extend(new_namespaces)
+			if stack and stack[-1][1]:
+				namespaces = stack[-1][5] + new_namespaces
+			else:
+				namespaces = new_namespaces
+			
+			if stack:
+				text = take_next_text(stack[-1])
+				if is_removed and not text.strip():
+					# Indentation for the tag being removed
+					text = ""
+				write_text(text)
+			
+			if is_removed:
+				removed += 1
+			else:
+				if tag_open:
+					write(">")
+				
+				parts = ["<" + qname(elem.tag)]
+				for prefix, uri in namespaces:
+					parts.append(' xmlns%s=%s' % (":" + prefix if prefix else "", quoteattr(uri)))
+				for key, value in elem.attrib.items():
+					parts.append(' %s=%s' % (qname(key, is_attrib=True), quoteattr(value)))
+				write("".join(parts))
+				tag_open = True
+			
+			stack.append([elem, is_removed, None, False, len(new_namespaces), namespaces if is_removed else []])
+			new_namespaces = []
+		else:
+			frame = stack.pop()
+			is_removed = frame[1]
+			
+			text = take_next_text(frame)
+			if is_removed and not text.strip():
+				# Indentation for the closing tag being removed
+				text = ""
+			write_text(text)
+			
+			if not is_removed:
+				if tag_open:
+					# Nothing inside it
+					write("/>")
+					tag_open = False
+				else:
+					write("</%s>" % (qname(elem.tag)))
+			
+			if frame[4]:
+				del ns_bindings[-frame[4]:]
+			
+			if stack:
+				stack[-1][2] = elem
+	
+	write("\n")
+	return removed
+
+# Unit tests for strip_vlc_nodes_structural()
+def test_structural_namespaces():
+	import io
+	
+	playlist = (b'<playlist xmlns="http://xspf.org/ns/0/" xmlns:vlc="%s" xml:base="file:///music/">'
+	            b'<track xml:lang="en"><x:a xmlns:x="urn:one"><x:b xmlns:x="urn:two" x:c="1"/></x:a></track>'
+	            b'<vlc:node title="A"><vlc:node xmlns:q="urn:q"><q:item q:z="2"/></vlc:node></vlc:node>'
+	            b'</playlist>') % (VLC_NAMESPACE.encode())
+	
+	f_out = io.BytesIO()
+	assert strip_vlc_nodes_structural(io.BytesIO(playlist), f_out) == 2
+	assert f_out.getvalue().decode('utf-8') == (
+		'<?xml version="1.0" encoding="UTF-8"?>\n'
+		'<playlist xmlns="http://xspf.org/ns/0/" xmlns:vlc="%s" xml:base="file:///music/">'
+		'<track xml:lang="en"><x:a xmlns:x="urn:one"><x:b xmlns:x="urn:two" x:c="1"/></x:a></track>'
+		'<q:item xmlns:q="urn:q" q:z="2"/>'
+		'</playlist>\n') % (VLC_NAMESPACE)
+
+#######################################
+# Processing
 
-if len(sys.argv) == 1:
-	print("Usage: $ %s <filenames>" % (os.path.basename(__file__)))
-else:
-	for fileN in sys.argv[1:]:
-		print("Processing ==> '%s'" % (fileN))
+# Ways that the NOP's can be found
+FILTER_MODES = {
+	'line': strip_vlc_nodes_by_line,
+	'structural': strip_vlc_nodes_structural,
+}
+
+
+# Remove the NOP's from the given playlist
+# > returns: ([str], str | None) Messages to show, and details of any error
+def clean_playlist(fileN, mode='line'):
+	messages = ["Processing ==> '%s'" % (fileN)]
+	
+	out_dir = os.path.dirname(os.path.abspath(fileN))
+	fd, tmp_fileN = tempfile.mkstemp(dir=out_dir, prefix="." + os.path.basename(fileN) + ".", suffix=".tmp")
+	
+	try:
+		with open(fileN, 'rb') as f_in, os.fdopen(fd, 'wb') as f_out:
+			removed = FILTER_MODES[mode](f_in, f_out)
 		
-		# Read in entire file
-		with open(fileN) as f:
-			lines = f.readlines()
+		if removed == 0:
+			os.remove(tmp_fileN)
+			messages.append("    No NOP's found. Skipping...")
+			return (messages, None)
 		
-		# Remove offending lines
-		def filter_vlc_playlist_nops(line):
-			line = line.strip()
-			return not (line.startswith("<vlc:node ") or line.startswith("</vlc:node>"))
-		lines = list(filter(filter_vlc_playlist_nops, lines))
+		# NOTE: mkstemp() only makes files readable by the current user
+		shutil.copymode(fileN, tmp_fileN)
 		
-		# Backup the old file in case this goes wrong (or it gets cancelled mid-write)
+		# Keep the original as a backup in case this went wrong
 		backup_fileN = fileN + ".old"
-		shutil.copy(fileN, backup_fileN)
-		print("    Original file backed up to '%s'" % (backup_fileN))
+		os.replace(fileN, backup_fileN)
+		os.replace(tmp_fileN, fileN)
 		
-		# Write out to a new file
-		with open(fileN, 'w') as f:
-			for line in lines:
-				f.write(line)
+		messages.append("    Removed %d NOP's" % (removed))
+		messages.append("    Original file backed up to '%s'" % (backup_fileN))
+		return (messages, None)
+	except Exception as err:
+		if os.path.exists(tmp_fileN):
+			os.remove(tmp_fileN)
+		return (messages, "! Error processing %s: %r" % (fileN, err))
+
+#######################################
+
+# Handle command-line arguments
+def get_config():
+	parser = argparse.ArgumentParser(
+		description = "Strip excess 'vlc:node' playlist NOP's from XSPF playlists")
+	
+	parser.add_argument("files", nargs='+', metavar="playlist.xspf",
+	                    help="Playlists to clean up (in place)")
+	
+	parser.add_argument("-s", "--structural", dest="mode", action="store_const", const='structural', default='line',
+	                    help="Parse the playlists as XML, to remove NOP's even when they aren't on their own lines")
+	
+	parser.add_argument("-j", "--jobs", type=int, default=0,
+	                    help="Number of playlists to process at once (0 = one per core)")
+	
+	return parser.parse_args()
+
+
+def main():
+	if len(sys.argv) == 1:
+		print("Usage: $ %s <filenames>" % (os.path.basename(__file__)))
+		return
+	
+	config = get_config()
+	jobs = min(config.jobs or os.cpu_count(), len(config.files))
+	
+	failed = 0
+	with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+		# NOTE: map() gives the results back in order, so the output is the same as when run one at a time
+		for messages, error in executor.map(clean_playlist, config.files, [config.mode] * len(config.files)):
+			for message in messages:
+				print(message)
+			if error:
+				print(error, file=sys.stderr)
+				failed += 1
+	
+	if failed:
+		sys.exit(1)
 
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,459 @@
+#!/usr/bin/python3 $@
+
+# Indexed code search for large source trees (used by the pygrep/cgrep/hgrep/etc. wrappers)
+#
+# Running "grep -irn" over the whole tree for every lookup gets slow once the tree is big,
+# so instead, this keeps a trigram index for each root that gets searched from. The index
+# maps each 3-byte sequence (lowercased) to the files containing it, so that a query only
+# needs to look at the files containing all the trigrams the match requires. Those candidate
+# files are then actually searched to get the matching lines.
+#
+# The index is brought up to date before each search, by only re-reading files whose mtime
+# or size has changed since the last time.
+#
+# For one-off searches (where building the index isn't worth it), "--no-index" just
+# searches every file instead, using fast_grep.py.
+#
+# Output matches "grep -n", i.e. "file:line:text"
+#
+# Date: 16 October 2026
+
+import sys
+import os
+import argparse
+import array
+import hashlib
+import multiprocessing
+import re
+import sqlite3
+
+try:
+	import re._parser as sre_parse
+	import re._constants as sre_constants
+except ImportError:
+	# Python < 3.11
+	import sre_parse
+	import sre_constants
+
+try:
+	import numpy as np
+	HAVE_NUMPY = True
+except ImportError:
+	HAVE_NUMPY = False
+
+from fast_grep import walk_files, is_binary, matches_include, resolve_pattern_syntax, compile_pattern, grep_files
+
+#######################################
+# Trigrams
+#
+# Trigrams are stored as ints ((b0 << 16) | (b1 << 8) | b2) of the lowercased bytes.
+# Only ASCII gets lowercased, so query trigrams with non-ASCII bytes get left out,
+# instead of risking missing matches on case-insensitive searches.
+
+# Get the set of trigrams in the given file contents
+# < data: (bytes) File contents
+# > returns: (array) Sorted trigram ints
+def extract_trigrams(data):
+	data = data.lower()
+	if len(data) < 3:
+		return array.array('I')
+	
+	if HAVE_NUMPY:
+		buf = np.frombuffer(data, dtype=np.uint8).astype(np.uint32)
+		tris = np.unique((buf[:-2] << 16) | (buf[1:-1] << 8) | buf[2:])
+		return array.array('I', tris.astype(np.uint32).tobytes())
+	else:
+		unique = {data[i:i+3] for i in range(len(data) - 2)}
+		return array.array('I', sorted(int.from_bytes(tri, 'big') for tri in unique))
+
+
+# Combine two sets of trigrams
+# < a, b: (array) Sorted trigram ints (as from extract_trigrams())
+# > returns: (array) Sorted trigram ints that are in either of them
+def merge_trigrams(a, b):
+	if HAVE_NUMPY:
+		tris = np.union1d(np.frombuffer(a, dtype=np.uint32), np.frombuffer(b, dtype=np.uint32))
+		return array.array('I', tris.astype(np.uint32).tobytes())
+	else:
+		return array.array('I', sorted(set(a) | set(b)))
+
+
+# Get the trigrams that any match for the given literal text must contain
+# < text: (str) Text that must be matched exactly (ignoring case)
+# > returns: ({int}) Trigram ints
+def literal_trigrams(text):
+	data = text.lower().encode('utf-8')
+	return {int.from_bytes(data[i:i+3], 'big')
+	        for i in range(len(data) - 2)
+	        if max(data[i:i+3]) < 0x80}
+
+#######################################
+# Query Planning
+#
+# Queries get turned into a tree of requirements on the trigrams a matching file must contain:
+#  * ('tri', {int})     - All of these trigrams
+#  * ('and', [node])    - All of these requirements
+#  * ('or', [node])     - Any of these requirements
+#  * ('all',)           - Nothing is known, so every file needs to be checked
+
+QUERY_ALL = ('all',)
+
+# Operators repeating their contents (with the minimum number of repeats as their first arg)
+REPEAT_OPS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, 'POSSESSIVE_REPEAT'):
+	REPEAT_OPS.add(sre_constants.POSSESSIVE_REPEAT)
+
+
+# Build the requirements for a literal search
+def plan_literal(text):
+	tris = literal_trigrams(text)
+	return ('tri', tris) if tris else QUERY_ALL
+
+
+# Combine requirements, simplifying where possible
+def plan_and(nodes):
+	nodes = [node for node in nodes if node is not QUERY_ALL]
+	if not nodes:
+		return QUERY_ALL
+	elif len(nodes) == 1:
+		return nodes[0]
+	else:
+		return ('and', nodes)
+
+def plan_or(nodes):
+	if not nodes or any(node is QUERY_ALL for node in nodes):
+		return QUERY_ALL
+	elif len(nodes) == 1:
+		return nodes[0]
+	else:
+		return ('or', nodes)
+
+
+# Build the requirements for a sequence of parsed regex items
+# < items: (list) Parsed regex items (i.e. (op, arg) pairs from sre_parse)
+def plan_regex_items(items):
+	nodes = []
+	run = []     # Chars in the current run of literals
+	
+	def flush_run():
+		if run:
+			nodes.append(plan_literal("".join(run)))
+			run.clear()
+	
+	for op, arg in items:
+		if op is sre_constants.LITERAL:
+			run.append(chr(arg))
+			continue
+		
+		flush_run()
+		if op is sre_constants.SUBPATTERN:
+			# (group, add_flags, del_flags, pattern)
+			nodes.append(plan_regex_items(arg[-1]))
+		elif op in REPEAT_OPS:
+			# (min, max, pattern) - Only required if it must appear at least once
+			min_count, _max_count, sub_items = arg
+			if min_count >= 1:
+				nodes.append(plan_regex_items(sub_items))
+		elif op is sre_constants.BRANCH:
+			# (None, [pattern])
+			nodes.append(plan_or([plan_regex_items(branch) for branch in arg[1]]))
+		
+		# Anything else (char classes, anchors, etc.) just splits up the runs of literals
+	
+	flush_run()
+	return plan_and(nodes)
+
+
+# Build the requirements for a regex search
+# > throws "re.error" if the regex is invalid
+def plan_regex(pattern):
+	return plan_regex_items(sre_parse.parse(pattern))
+
+#######################################
+# Index
+#
+# The index for each root lives in an SQLite db in INDEX_DIR (so that the trees being
+# searched don't get cluttered up), named after the hash of the root's absolute path.
+
+INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "code_search")
+
+# Number of changed files to have before bothering to read them in parallel
+PARALLEL_UPDATE_THRESHOLD = 64
+
+# Size of the chunks that files get read in when extracting their trigrams
+# (so that big files don't need to be held in memory all at once)
+INDEX_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+# Read a file and extract its trigrams
+# < rel_path: (str) Path of the file relative to the root
+# > returns: (str, bytes | None) Path, and trigrams (packed as in extract_trigrams()). None = binary/unreadable
+def index_file__task(args):
+	root, rel_path = args
+	try:
+		with open(os.path.join(root, rel_path), 'rb') as f:
+			data = f.read(INDEX_CHUNK_SIZE)
+			if is_binary(data):
+				return (rel_path, None)
+			
+			trigrams = extract_trigrams(data)
+			while True:
+				chunk = f.read(INDEX_CHUNK_SIZE)
+				if not chunk:
+					break
+				
+				# NOTE: The last 2 bytes of the previous chunk are kept, so that trigrams spanning chunks aren't missed
+				data = data[-2:] + chunk
+				trigrams = merge_trigrams(trigrams, extract_trigrams(data))
+	except OSError:
+		return (rel_path, None)
+	
+	return (rel_path, trigrams.tobytes())
+
+
+class TrigramIndex:
+	# < root: (str) Directory to index
+	# < index_dir: (str) Directory to keep the index db in
+	def __init__(self, root, index_dir=INDEX_DIR):
+		self.root = os.path.abspath(root)
+		
+		os.makedirs(index_dir, exist_ok=True)
+		root_hash = hashlib.sha1(self.root.encode('utf-8')).hexdigest()
+		self.db_path = os.path.join(index_dir, root_hash + ".sqlite")
+		
+		self.con = sqlite3.connect(self.db_path)
+		self.con.execute("PRAGMA journal_mode=WAL")
+		self.con.execute("PRAGMA synchronous=NORMAL")
+		self.con.executescript("""
+			CREATE TABLE IF NOT EXISTS meta (
+				key TEXT PRIMARY KEY,
+				value TEXT
+			);
+			CREATE TABLE IF NOT EXISTS files (
+				id INTEGER PRIMARY KEY,
+				path TEXT UNIQUE NOT NULL,
+				mtime_ns INTEGER NOT NULL,
+				size INTEGER NOT NULL,
+				trigrams BLOB            -- NULL = binary file
+			);
+			CREATE TABLE IF NOT EXISTS postings (
+				tri INTEGER NOT NULL,
+				file_id INTEGER NOT NULL,
+				PRIMARY KEY (tri, file_id)
+			) WITHOUT ROWID;
+		""")
+		self.con.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (self.root,))
+		self.con.commit()
+	
+	def close(self):
+		self.con.close()
+	
+	# Throw away everything in the index
+	def clear(self):
+		with self.con:
+			self.con.execute("DELETE FROM postings")
+			self.con.execute("DELETE FROM files")
+	
+	# Bring the index up to date with the files on disk
+	# < jobs: (int) Number of processes to read changed files with (0 = one per core)
+	# > returns: (int, int) Number of files (re)indexed, and the number removed
+	def update(self, jobs=0):
+		known = {path: (file_id, mtime_ns, size)
+		         for file_id, path, mtime_ns, size in self.con.execute("SELECT id, path, mtime_ns, size FROM files")}
+		
+		changed = {}   # path -> (mtime_ns, size)
+		for rel_path, st in walk_files(self.root):
+			info = known.pop(rel_path, None)
+			if (info is None) or (info[1] != st.st_mtime_ns) or (info[2] != st.st_size):
+				changed[rel_path] = (st.st_mtime_ns, st.st_size)
+		
+		# Whatever is left in "known" no longer exists
+		removed = [file_id for file_id, _mtime_ns, _size in known.values()]
+		
+		with self.con:
+			for file_id in removed:
+				self.remove_file(file_id)
+			
+			tasks = [(self.root, rel_path) for rel_path in changed]
+			if len(tasks) >= PARALLEL_UPDATE_THRESHOLD and (jobs or os.cpu_count()) > 1:
+				with multiprocessing.Pool(jobs or None) as pool:
+					for rel_path, trigrams in pool.imap_unordered(index_file__task, tasks, chunksize=16):
+						self.store_file(rel_path, changed[rel_path], trigrams)
+			else:
+				for task in tasks:
+					rel_path, trigrams = index_file__task(task)
+					self.store_file(rel_path, changed[rel_path], trigrams)
+		
+		return (len(changed), len(removed))
+	
+	# Remove a file (and all its postings) from the index
+	def remove_file(self, file_id):
+		row = self.con.execute("SELECT trigrams FROM files WHERE id = ?", (file_id,)).fetchone()
+		if row and row[0]:
+			tris = array.array('I', row[0])
+			self.con.executemany("DELETE FROM postings WHERE tri = ? AND file_id = ?",
+			                     ((tri, file_id) for tri in tris))
+		self.con.execute("DELETE FROM files WHERE id = ?", (file_id,))
+	
+	# Add/replace a file in the index
+	# < stat_info: (int, int) mtime_ns and size of the file
+	# < trigrams: (bytes | None) Packed trigram ints. None = binary file
+	def store_file(self, rel_path, stat_info, trigrams):
+		row = self.con.execute("SELECT id FROM files WHERE path = ?", (rel_path,)).fetchone()
+		if row:
+			self.remove_file(row[0])
+		
+		mtime_ns, size = stat_info
+		cur = self.con.execute("INSERT INTO files (path, mtime_ns, size, trigrams) VALUES (?, ?, ?, ?)",
+		                       (rel_path, mtime_ns, size, trigrams))
+		if trigrams:
+			file_id = cur.lastrowid
+			self.con.executemany("INSERT INTO postings VALUES (?, ?)",
+			                     ((tri, file_id) for tri in array.array('I', trigrams)))
+	
+	# Get the ids of all the files containing the given trigram
+	def files_with_trigram(self, tri):
+		return {file_id for (file_id,) in self.con.execute("SELECT file_id FROM postings WHERE tri = ?", (tri,))}
+	
+	# Get the ids of all the files that could satisfy the given query requirements
+	# > returns: ({int} | None) File ids. None = all files
+	def match_plan(self, plan):
+		kind = plan[0]
+		if kind == 'all':
+			return None
+		elif kind == 'tri':
+			result = None
+			for tri in plan[1]:
+				ids = self.files_with_trigram(tri)
+				result = ids if result is None else (result & ids)
+				if not result:
+					break
+			return result
+		elif kind == 'and':
+			result = None
+			for node in plan[1]:
+				ids = self.match_plan(node)
+				if ids is not None:
+					result = ids if result is None else (result & ids)
+					if not result:
+						break
+			return result
+		else:
+			result = set()
+			for node in plan[1]:
+				ids = self.match_plan(node)
+				if ids is None:
+					return None
+				result |= ids
+			return result
+	
+	# Get the (text) files that could satisfy the given query requirements
+	# > returns: ([str]) Sorted paths of the files, relative to the root
+	def candidates(self, plan):
+		ids = self.match_plan(plan)
+		rows = self.con.execute("SELECT id, path FROM files WHERE trigrams IS NOT NULL")
+		if ids is None:
+			return sorted(path for _file_id, path in rows)
+		else:
+			return sorted(path for file_id, path in rows if file_id in ids)
+	
+	# Get some stats about what's in the index
+	# > returns: (int, int) Number of files, number of postings
+	def stats(self):
+		n_files = self.con.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+		n_postings = self.con.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+		return (n_files, n_postings)
+
+#######################################
+
+# Handle command-line arguments
+def get_config():
+	parser = argparse.ArgumentParser(
+		description = "Search files under a directory for a string, using a persistent trigram index")
+	
+	parser.add_argument("pattern",
+	                    help="Text to search for (matched literally, unless -G or -e is used)")
+	parser.add_argument("root", nargs='?', default=".",
+	                    help="Directory to search under (default: current directory)")
+	
+	parser.add_argument("--include", action="append", metavar="GLOB",
+	                    help="Only search files whose names match GLOB (e.g. '*.py'). Can be used multiple times")
+	
+	# NOTE: The pygrep/cgrep/etc. wrappers pass -G, so that patterns mean the same as with the "grep -irn" they replaced
+	#       (any -F / -e given to them comes after that, so it takes precedence)
+	parser.add_argument("-F", "--fixed-strings", dest="syntax", action="store_const", const='literal', default='literal',
+	                    help="Match the pattern literally (default)")
+	parser.add_argument("-G", "--basic-regex", dest="syntax", action="store_const", const='basic',
+	                    help="Treat the pattern as a basic regular expression, like grep does by default")
+	parser.add_argument("-e", "--regex", dest="syntax", action="store_const", const='regex',
+	                    help="Treat the pattern as a (Python) regular expression")
+	parser.add_argument("-s", "--case-sensitive", dest="ignore_case", action="store_false",
+	                    help="Match case exactly (by default, case is ignored like 'grep -i')")
+	
+	parser.add_argument("--no-index", dest="use_index", action="store_false",
+	                    help="Search every file directly, instead of using (or building) the index")
+	parser.add_argument("--no-update", dest="update", action="store_false",
+	                    help="Don't check for changed files before searching (faster, but may miss recent changes)")
+	parser.add_argument("--reindex", action="store_true",
+	                    help="Throw away the index for this root, and rebuild it from scratch")
+	parser.add_argument("--index-dir", default=INDEX_DIR,
+	                    help="Where to keep the indexes (default: %(default)s)")
+	parser.add_argument("-j", "--jobs", type=int, default=0,
+	                    help="Number of processes to index/search files with (0 = one per core)")
+	
+	parser.add_argument("-v", "--verbose", action="store_true",
+	                    help="Show stats about the index + candidate files")
+	
+	return parser.parse_args()
+
+
+def main():
+	config = get_config()
+	
+	if not os.path.isdir(config.root):
+		print("! '%s' is not a directory" % (config.root), file=sys.stderr)
+		sys.exit(2)
+	
+	try:
+		pattern_text, is_regex = resolve_pattern_syntax(config.pattern, config.syntax)
+		if is_regex:
+			plan = plan_regex(pattern_text)
+		else:
+			plan = plan_literal(pattern_text)
+		pattern = compile_pattern(pattern_text, is_regex, config.ignore_case)
+	except re.error as err:
+		print("! Invalid regex: %s" % (err), file=sys.stderr)
+		sys.exit(2)
+	
+	if config.use_index:
+		index = TrigramIndex(config.root, config.index_dir)
+		try:
+			if config.reindex:
+				index.clear()
+			if config.update or config.reindex:
+				n_changed, n_removed = index.update(config.jobs)
+				if config.verbose:
+					print("# Indexed %d changed files, removed %d" % (n_changed, n_removed), file=sys.stderr)
+			
+			paths = [path for path in index.candidates(plan)
+			         if matches_include(path, config.include)]
+			
+			if config.verbose:
+				n_files, n_postings = index.stats()
+				print("# %d candidate files (of %d indexed, %d postings)" % (len(paths), n_files, n_postings),
+				      file=sys.stderr)
+		finally:
+			index.close()
+	else:
+		paths = sorted(rel_path for rel_path, _st in walk_files(config.root)
+		               if matches_include(rel_path, config.include))
+	
+	# Show paths relative to wherever we were asked to search from (like grep does)
+	prefix = "" if os.path.normpath(config.root) == "." else os.path.join(config.root, "")
+	n_matches = grep_files(config.root, paths, pattern, prefix, config.jobs)
+	
+	# Same exit codes as grep
+	sys.exit(0 if n_matches else 1)
+
+if __name__ == '__main__':
+	main()
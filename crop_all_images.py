@@ -1,64 +1,462 @@
 import sys
 import os
 
+import argparse
+import collections
+import concurrent.futures
+import re
+import time
+
 from PIL import Image
 
+try:
+	# Only needed for auto-cropping
+	import numpy as np
+except ImportError:
+	np = None
+
 PATH = "./"
 OUTDIR = "./cropped_images"
 
-def crop_all(base_path:str, 
+# Convert an (X, Y, W, H) crop rectangle to the (left, upper, right, lower) box that PIL uses
+def rect_to_box(rect: tuple) -> tuple:
+	x, y, w, h = rect
+	return (x, y, x + w, y + h)
+
+# Convert a (left, upper, right, lower) box (i.e. what the 4-value command-line form gives) to an (X, Y, W, H) crop rectangle
+def box_to_rect(box: tuple) -> tuple:
+	left, upper, right, lower = box
+	return (left, upper, right - left, lower - upper)
+
+# Get the crop rectangles for splitting an image into a grid of equally sized cells
+# < image_size: (width, height) of the image
+# < grid: (cols, rows) Number of cells across and down
+# > returns: ({ str : (X, Y, W, H) }) Crop rectangles for each cell, named by their row + column
+def grid_rects(image_size: tuple, grid: tuple) -> dict:
+	width, height = image_size
+	cols, rows = grid
+	
+	rects = {}
+	for row in range(rows):
+		y0 = (row * height) // rows
+		y1 = ((row + 1) * height) // rows
+		for col in range(cols):
+			x0 = (col * width) // cols
+			x1 = ((col + 1) * width) // cols
+			rects["r%02d_c%02d" % (row, col)] = (x0, y0, x1 - x0, y1 - y0)
+	return rects
+
+# Read the named crop rectangles listed in a crop-spec file
+# Each line has the form "name X Y W H". Blank lines and lines starting with '#' are ignored.
+# > returns: ({ str : (X, Y, W, H) }) Crop rectangles, in the order they're listed in the file
+def read_crop_spec(spec_filename: str) -> dict:
+	rects = {}
+	with open(spec_filename) as f:
+		for lineno, line in enumerate(f, 1):
+			line = line.strip()
+			if not line or line.startswith("#"):
+				continue
+			
+			parts = line.split()
+			if len(parts) != 5:
+				raise ValueError("%s:%d: Expected 'name X Y W H', got '%s'" % (spec_filename, lineno, line))
+			
+			name = parts[0]
+			if name in rects:
+				raise ValueError("%s:%d: Duplicate crop name '%s'" % (spec_filename, lineno, name))
+			
+			rects[name] = tuple(int(x) for x in parts[1:])
+	return rects
+
+
+# Crop each of the given regions out of a single image
+# < out_paths_fn: (see crop_all_multi())
+# > returns: (int, [str]) Size of the source file (in bytes), and the filenames of the crops
+def crop_image(fullpath:str,
+               out_basename:str,
+               out_paths_fn,
+               created_dirs:set):
+	out_filenames = []
+	
+	# Close the file as soon as we're done with it, so that we don't run out of handles on big batches
+	with Image.open(fullpath) as im:
+		im.load()
+		
+		for out_path, crop_rect in out_paths_fn(im.size).items():
+			if out_path not in created_dirs:
+				os.makedirs(out_path, exist_ok=True)
+				created_dirs.add(out_path)
+			
+			imCrop = im.crop(rect_to_box(crop_rect))
+			
+			out_filename = os.path.join(out_path, out_basename)
+			imCrop.save(out_filename)
+			out_filenames.append(out_filename)
+	
+	return (os.path.getsize(fullpath), out_filenames)
+
+
+# Crop each of the given regions out of every image in base_path
+# < out_paths_fn: fn(image_size) -> { out_path : (X, Y, W, H) }
+#                 Map from the folder that each crop gets saved to, to the region to crop
+# < jobs: (int) Number of worker threads to use (0 = one per core)
+#
+# Note: Each image only gets decoded once, no matter how many regions are cropped out of it
+# Note: Worker threads are used (instead of processes), as PIL releases the GIL while
+#       decoding/encoding, and out_paths_fn is often a lambda (which can't be pickled)
+def crop_all_multi(base_path:str,
+                   out_paths_fn,
+                   *,
+                   rename_as_seq=False,
+                   jobs=1):
+	# Note: Sequence numbers are the index in the directory listing (including any non-files),
+	#       to be consistent with earlier versions of this script. This means any output folders
+	#       inside base_path must already exist before it gets listed (see crop_all())
+	with os.scandir(base_path) as it:
+		entries = list(it)
+	N = len(entries)
+	
+	created_dirs = set()
+	
+	# Get the crop tasks to perform, in order
+	def tasks():
+		for i, entry in enumerate(entries):
+			if entry.is_file():
+				if rename_as_seq:
+					_, extn = os.path.splitext(entry.name)
+					assert extn[0] == "."
+					
+					out_basename = ("%06d" % (i)) + extn
+				else:
+					out_basename = entry.name
+				
+				yield (i, entry.path, out_basename)
+	
+	# Report the result of cropping an image
+	def report(i, fullpath, out_filenames):
+		print("[% 6d / % 6d]  Cropping '%s'..." % (i+1, N, fullpath))
+		if rename_as_seq:
+			for out_filename in out_filenames:
+				print("    '%s' -> '%s'" % (fullpath, out_filename))
+	
+	num_images = 0
+	num_bytes = 0
+	start_time = time.perf_counter()
+	
+	jobs = jobs or os.cpu_count()
+	if jobs > 1:
+		# Only keep a bounded number of images in flight at once, so that memory use stays
+		# flat on huge folders. Results are collected in order, so the output matches the
+		# serial path.
+		max_in_flight = jobs * 2
+		in_flight = collections.deque()
+		
+		with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+			for (i, fullpath, out_basename) in tasks():
+				if len(in_flight) >= max_in_flight:
+					(done_i, done_path, future) = in_flight.popleft()
+					size, out_filenames = future.result()
+					report(done_i, done_path, out_filenames)
+					num_images += 1
+					num_bytes += size
+				
+				future = executor.submit(crop_image, fullpath, out_basename, out_paths_fn, created_dirs)
+				in_flight.append((i, fullpath, future))
+			
+			for (done_i, done_path, future) in in_flight:
+				size, out_filenames = future.result()
+				report(done_i, done_path, out_filenames)
+				num_images += 1
+				num_bytes += size
+	else:
+		for (i, fullpath, out_basename) in tasks():
+			size, out_filenames = crop_image(fullpath, out_basename, out_paths_fn, created_dirs)
+			report(i, fullpath, out_filenames)
+			num_images += 1
+			num_bytes += size
+	
+	# Report throughput
+	elapsed = max(time.perf_counter() - start_time, 1e-6)
+	print("\nCropped %d images (%.1f MB) in %.2f s  =>  %.1f images/s, %.1f MB/s"
+	      % (num_images, num_bytes / 1e6, elapsed, num_images / elapsed, num_bytes / 1e6 / elapsed))
+
+
+# Crop the same region out of every image in base_path
+def crop_all(base_path:str,
              outdir_name:str,
              crop_rect: tuple,
              *,
-             rename_as_seq=False):
+             rename_as_seq=False,
+             jobs=1):
 	out_path = os.path.join(base_path, outdir_name)
-	if not os.path.exists(out_path):
-		os.mkdir(out_path)
-	
-	files_list = os.listdir(base_path)
-	for i, fileN in enumerate(files_list):
-		fullpath = os.path.join(base_path, fileN)
-		if os.path.isfile(fullpath):
-			print("[% 6d / % 6d]  Cropping '%s'..." % (i+1, len(files_list), fullpath))
+	os.makedirs(out_path, exist_ok=True)
+	
+	out_paths = {out_path: crop_rect}
+	crop_all_multi(base_path, lambda _image_size: out_paths,
+	               rename_as_seq=rename_as_seq,
+	               jobs=jobs)
+
+# Crop several named regions out of every image in base_path,
+# with each region's crops going into its own subfolder of outdir_name
+# < crop_rects_fn: fn(image_size) -> { str : (X, Y, W, H) }  Named crop regions for an image of the given size
+def crop_all_named(base_path:str,
+                   outdir_name:str,
+                   crop_rects_fn,
+                   *,
+                   rename_as_seq=False,
+                   jobs=1):
+	out_path = os.path.join(base_path, outdir_name)
+	# Note: Only the top-level output folder needs to exist before listing base_path (as
+	#       the per-region subfolders go inside it), so those still get created as needed
+	os.makedirs(out_path, exist_ok=True)
+	
+	def out_paths_fn(image_size):
+		return {os.path.join(out_path, name): rect
+		        for name, rect in crop_rects_fn(image_size).items()}
+	
+	crop_all_multi(base_path, out_paths_fn,
+	               rename_as_seq=rename_as_seq,
+	               jobs=jobs)
+
+
+# -------------------------------------
+# Auto-Crop Detection
+#
+# To find the crop region automatically, we find the bounding box of the content
+# (i.e. everything that doesn't match the border colour) in reduced-size copies of
+# each image, then combine these to get a single region to crop the whole batch to.
+
+# Size (longest edge) of the reduced copies of the images used for detecting the content
+AUTO_CROP_PREVIEW_SIZE = 512
+
+# Maximum number of previews kept in memory at once. Previews get reduced to their content
+# bounding boxes in batches of (up to) this many, as they're loaded.
+AUTO_CROP_BATCH_SIZE = 32
+
+# Load a reduced-size copy of an image, for detecting its content bounds
+# > returns: ((int, int), np.ndarray | None) Size of the full image, and (H, W, 3) uint8 array of the preview
+def load_preview(fullpath:str):
+	try:
+		with Image.open(fullpath) as im:
+			full_size = im.size
 			
-			im = Image.open(fullpath)
-			imCrop = im.crop(crop_rect)
+			# Note: For JPEG's, this lets the decoder do most of the downscaling
+			im.thumbnail((AUTO_CROP_PREVIEW_SIZE, AUTO_CROP_PREVIEW_SIZE), reducing_gap=2.0)
+			return (full_size, np.asarray(im.convert('RGB')))
+	except OSError as e:
+		print("  WARNING: Skipping '%s' - %s" % (fullpath, e))
+		return (None, None)
+
+# Find the content bounding boxes for a batch of same-sized previews
+# < previews: (np.ndarray) (N, H, W, 3) uint8 array of previews
+# < tolerance: (int) Maximum difference from the border colour for a pixel to be considered border
+# > returns: (np.ndarray) (N, 4) array of (x0, y0, x1, y1) boxes (exclusive). Images with no content get -1's
+def detect_content_boxes(previews, tolerance:int):
+	# Border colour = median of the corner pixels (so that a single noisy corner doesn't throw it off)
+	corners = previews[:, [0, 0, -1, -1], [0, -1, 0, -1]]
+	border = np.median(corners, axis=1).astype(np.uint8)
+	
+	# Content = anything that differs from the border colour by more than the tolerance in any channel
+	# Note: This goes one channel at a time, using max - min to get the difference without
+	#       overflowing, so that no (N, H, W, 3) temporaries wider than uint8 are needed
+	content = np.zeros(previews.shape[:3], dtype=bool)
+	for channel in range(previews.shape[3]):
+		plane = previews[..., channel]
+		border_value = border[:, None, None, channel]
+		content |= (np.maximum(plane, border_value) - np.minimum(plane, border_value)) > tolerance
+	
+	rows = content.any(axis=2)   # (N, H)
+	cols = content.any(axis=1)   # (N, W)
+	
+	height = rows.shape[1]
+	width = cols.shape[1]
+	
+	boxes = np.stack([
+		cols.argmax(axis=1),
+		rows.argmax(axis=1),
+		width - cols[:, ::-1].argmax(axis=1),
+		height - rows[:, ::-1].argmax(axis=1),
+	], axis=1)
+	boxes[~rows.any(axis=1)] = -1
+	return boxes
+
+# Find the region to crop a whole batch of images to, so that only their content is kept
+# < file_paths: ([str]) Images to check
+# < combine: (str) How the per-image regions get combined - "union" (keeps all content) or "median"
+# < tolerance: (int) See detect_content_boxes()
+# < jobs: (int) Number of worker threads to load the previews with (0 = one per core)
+# > returns: ((int, int, int, int) | None) The (X, Y, W, H) crop region, or None if no content was found
+def find_auto_crop_rect(file_paths,
+                        *,
+                        combine="union",
+                        tolerance=16,
+                        jobs=1):
+	jobs = jobs or os.cpu_count()
+	
+	# Previews waiting to be checked, grouped by size so that each group can be processed as a single batch
+	groups = collections.defaultdict(list)
+	num_pending = 0
+	
+	# Content boxes found so far (in full-size coordinates)
+	boxes = []
+	
+	# Reduce all the pending previews to their content boxes
+	def flush_groups():
+		nonlocal num_pending
+		for (full_size, preview_shape), group in groups.items():
+			group_boxes = detect_content_boxes(np.stack(group), tolerance)
+			group_boxes = group_boxes[group_boxes[:, 0] >= 0]
 			
-			if rename_as_seq:
-				_, extn = os.path.splitext(fileN)
-				assert extn[0] == "."
-				
-				seq_filename = ("%06d" % (i)) + extn
-				out_filename = os.path.join(out_path, seq_filename)
-				print("    '%s' -> '%s'" % (fullpath, out_filename))
-			else:
-				out_filename = os.path.join(out_path, fileN)
-				
-			imCrop.save(out_filename)
+			# Scale back up to full-size coordinates (rounding outwards, so we don't lose any content)
+			scale_x = full_size[0] / preview_shape[1]
+			scale_y = full_size[1] / preview_shape[0]
+			scale = np.array([scale_x, scale_y, scale_x, scale_y])
+			
+			full_boxes = group_boxes * scale
+			full_boxes[:, :2] = np.floor(full_boxes[:, :2])
+			full_boxes[:, 2:] = np.minimum(np.ceil(full_boxes[:, 2:]), full_size)
+			boxes.append(full_boxes)
+		
+		groups.clear()
+		num_pending = 0
+	
+	def add_preview(full_size, preview):
+		nonlocal num_pending
+		if preview is not None:
+			groups[(full_size, preview.shape)].append(preview)
+			num_pending += 1
+			if num_pending >= AUTO_CROP_BATCH_SIZE:
+				flush_groups()
+	
+	# Only keep a bounded number of previews loading at once (like crop_all_multi() does)
+	max_in_flight = jobs * 2
+	in_flight = collections.deque()
+	
+	with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+		for fullpath in file_paths:
+			if len(in_flight) >= max_in_flight:
+				add_preview(*in_flight.popleft().result())
+			in_flight.append(executor.submit(load_preview, fullpath))
+		
+		for future in in_flight:
+			add_preview(*future.result())
+	
+	flush_groups()
+	
+	if not boxes:
+		return None
+	boxes = np.concatenate(boxes)
+	if len(boxes) == 0:
+		return None
+	
+	print("  Found content in %d / %d images" % (len(boxes), len(file_paths)))
+	if combine == "median":
+		x0, y0, x1, y1 = np.median(boxes, axis=0)
+	else:
+		x0, y0 = boxes[:, :2].min(axis=0)
+		x1, y1 = boxes[:, 2:].max(axis=0)
+	
+	x0, y0, x1, y1 = (int(round(v)) for v in (x0, y0, x1, y1))
+	return (x0, y0, x1 - x0, y1 - y0)
+
+
+# -------------------------------------
+
+# Parse a "COLSxROWS" grid size
+def grid_size(value: str) -> tuple:
+	match = re.match(r"^(\d+)[xX](\d+)$", value)
+	if not match or int(match.group(1)) < 1 or int(match.group(2)) < 1:
+		raise argparse.ArgumentTypeError("Expected grid size in the form COLSxROWS (e.g. '4x2'), got '%s'" % (value))
+	return (int(match.group(1)), int(match.group(2)))
 
 if __name__ == "__main__":
-	args = sys.argv[1:]
+	parser = argparse.ArgumentParser(
+		usage = "crop_all_images.py [-i] [-j JOBS] [-f SPEC_FILE | -g COLSxROWS | -a | LEFT TOP RIGHT BOTTOM]",
+		description = "Crop all images in the current directory, saving the crops to '%s'" % (OUTDIR))
 	
-	# Check for options
-	# -i = Re-enumerate
-	if args[0:1] == ["-i"]:
-		print("! Rename using sequence id's...")
-		rename_as_seq = True
-		args = args[1:]
-	else:
-		rename_as_seq = False
+	parser.add_argument("coords", nargs='*', type=int,
+	                    help="Region to crop - either the 'LEFT TOP RIGHT BOTTOM' edges, or just 'W H' (from the top-left corner)")
 	
-	# Get crop coordinates
-	if len(args) == 4:
-		crop_rect = [int(x) for x in args]
-	elif len(args) == 2:
-		crop_rect = [0, 0, int(args[0]), int(args[1])]
-	else:
-		print("Usage: crop_all_images.py [-i] X Y W H")
-		sys.exit(-1)
+	parser.add_argument("-i", dest='rename_as_seq', action='store_true',
+	                    help="Rename using sequence id's")
+	
+	parser.add_argument("-f", "--spec", metavar='SPEC_FILE',
+	                    help="File listing several regions to crop (one 'name X Y W H' per line). "
+	                         "Each region's crops go into its own subfolder.")
+	
+	parser.add_argument("-g", "--grid", type=grid_size, metavar='COLSxROWS',
+	                    help="Split each image into a grid of equally sized tiles. "
+	                         "Each tile's crops go into its own subfolder.")
+	
+	parser.add_argument("-a", "--auto", action='store_true',
+	                    help="Find the region to crop automatically, by detecting the content (i.e. non-border pixels) "
+	                         "in all the images (requires NumPy)")
+	
+	parser.add_argument("--combine", choices=["union", "median"], default="union",
+	                    help="With --auto, how the regions found for each image get combined: "
+	                         "'union' keeps everything, 'median' ignores outliers")
 	
-	# Perform cropping
-	crop_all(PATH, OUTDIR,
-	         crop_rect,
-	         rename_as_seq=rename_as_seq)
+	parser.add_argument("--tolerance", type=int, default=16,
+	                    help="With --auto, how much a pixel can differ from the border colour and still count as border")
 	
+	parser.add_argument("-j", "--jobs", type=int, default=1,
+	                    help="Number of worker threads to crop images with (0 = one per core)")
+	
+	args = parser.parse_args()
+	
+	if args.rename_as_seq:
+		print("! Rename using sequence id's...")
+	
+	if sum([bool(args.spec), bool(args.grid), args.auto, bool(args.coords)]) > 1:
+		parser.error("Only one of -f, -g, -a, or crop coordinates can be used at a time")
+	
+	if args.spec or args.grid:		
+		# Get named crop regions
+		if args.spec:
+			crop_rects = read_crop_spec(args.spec)
+			print("! Cropping %d regions from '%s'..." % (len(crop_rects), args.spec))
+			crop_rects_fn = lambda _image_size: crop_rects
+		else:
+			print("! Cropping %dx%d grid of tiles..." % args.grid)
+			crop_rects_fn = lambda image_size: grid_rects(image_size, args.grid)
+		
+		# Perform cropping
+		crop_all_named(PATH, OUTDIR,
+		               crop_rects_fn,
+		               rename_as_seq=args.rename_as_seq,
+		               jobs=args.jobs)
+	else:
+		# Get crop coordinates
+		if args.auto:
+			if np is None:
+				print("ERROR: NumPy is needed for auto-cropping", file=sys.stderr)
+				sys.exit(-1)
+			
+			print("! Detecting crop region...")
+			with os.scandir(PATH) as it:
+				file_paths = [entry.path for entry in it if entry.is_file()]
+			
+			crop_rect = find_auto_crop_rect(file_paths,
+			                                combine=args.combine,
+			                                tolerance=args.tolerance,
+			                                jobs=args.jobs)
+			if crop_rect is None:
+				print("ERROR: Couldn't find any content to crop to", file=sys.stderr)
+				sys.exit(-1)
+			
+			print("! Cropping to LEFT TOP RIGHT BOTTOM = %d %d %d %d" % rect_to_box(crop_rect))
+		elif len(args.coords) == 4:
+			# Note: These are the edges of the region (as they've always been), not X Y W H like in spec files
+			crop_rect = box_to_rect(args.coords)
+		elif len(args.coords) == 2:
+			crop_rect = [0, 0, args.coords[0], args.coords[1]]
+		else:
+			parser.print_usage()
+			sys.exit(-1)
+		
+		# Perform cropping
+		crop_all(PATH, OUTDIR,
+		         crop_rect,
+		         rename_as_seq=args.rename_as_seq,
+		         jobs=args.jobs)
+
@@ -0,0 +1,525 @@
+#!/usr/bin/python3 $@
+
+# Index-free parallel grep (for one-off searches where building an index isn't worth it)
+#
+# This is a replacement for the "grep -irn --include=..." that the pygrep/cgrep/etc. wrappers
+# used to run, which also knows to skip whatever the tree's .gitignore files say to.
+# Files get searched in a process pool, over mmap'ed buffers (so that files with no matches
+# never need to be copied into Python), with line numbers only being worked out for the
+# lines that actually match.
+#
+# Output matches "grep -n", i.e. "file:line:text", with the files in sorted order.
+#
+# NOTE: code_search.py uses the file discovery + searching from here too
+#
+# Date: 16 October 2026
+
+import sys
+import os
+import argparse
+import fnmatch
+import mmap
+import multiprocessing
+import re
+
+#######################################
+# .gitignore Handling
+#
+# This covers the commonly used parts of the .gitignore syntax:
+#  * "#" comments, and "!" to re-include things
+#  * Trailing "/" to only match directories
+#  * Patterns with a "/" (apart from at the end) are relative to the .gitignore's dir,
+#    otherwise they match the name anywhere below it
+#  * "*", "?", "[...]", and "**" wildcards
+
+# Convert a .gitignore glob to a regex (matching the path relative to the .gitignore's dir)
+# < pattern: (str) Glob (with any "!", leading "/", and trailing "/" already removed)
+# < anchored: (bool) Whether the glob must match from the .gitignore's dir, instead of any name below it
+def gitignore_glob_to_regex(pattern, anchored):
+	parts = []
+	i = 0
+	n = len(pattern)
+	while i < n:
+		c = pattern[i]
+		if pattern.startswith("**/", i):
+			parts.append("(?:.*/)?")
+			i += 3
+			continue
+		elif pattern.startswith("**", i):
+			parts.append(".*")
+			i += 2
+			continue
+		elif c == '*':
+			parts.append("[^/]*")
+		elif c == '?':
+			parts.append("[^/]")
+		elif c == '[':
+			end = pattern.find(']', i + 2)
+			if end < 0:
+				parts.append(re.escape(c))
+			else:
+				body = pattern[i+1:end]
+				if body.startswith('!'):
+					body = '^' + body[1:]
+				parts.append("[%s]" % (body.replace('\\', '\\\\')))
+				i = end
+		elif c == '\\' and i + 1 < n:
+			i += 1
+			parts.append(re.escape(pattern[i]))
+		else:
+			parts.append(re.escape(c))
+		i += 1
+	
+	prefix = "" if anchored else "(?:.*/)?"
+	return re.compile(prefix + "".join(parts) + r"\Z", re.DOTALL)
+
+
+# Read the rules from a .gitignore file
+# < fileN: (str) Path to the .gitignore file
+# < base_dir: (str) Dir the .gitignore is in (relative to the root being searched)
+# > returns: ([(str, re.Pattern, bool, bool)]) (base_dir, regex, is_negated, is_dir_only) for each rule
+def read_gitignore(fileN, base_dir):
+	rules = []
+	try:
+		with open(fileN, 'r', encoding='utf-8', errors='replace') as f:
+			lines = f.read().splitlines()
+	except OSError:
+		return rules
+	
+	for line in lines:
+		line = line.rstrip()
+		if not line or line.startswith('#'):
+			continue
+		
+		is_negated = line.startswith('!')
+		if is_negated:
+			line = line[1:]
+		
+		is_dir_only = line.endswith('/')
+		line = line.rstrip('/')
+		
+		anchored = '/' in line
+		line = line.lstrip('/')
+		if line:
+			rules.append((base_dir, gitignore_glob_to_regex(line, anchored), is_negated, is_dir_only))
+	
+	return rules
+
+
+# Check whether the given path is ignored by the .gitignore rules
+# < rules: ([rule]) Rules from read_gitignore() for this dir + all the dirs above it (outermost first)
+# < rel_path: (str) Path relative to the root being searched
+def is_ignored(rules, rel_path, is_dir):
+	rel_path = rel_path.replace(os.sep, '/')
+	
+	# The last rule that matches wins
+	ignored = False
+	for base_dir, regex, is_negated, is_dir_only in rules:
+		if is_dir_only and not is_dir:
+			continue
+		if ignored == (not is_negated):
+			# Can't change anything
+			continue
+		
+		if base_dir:
+			if not rel_path.startswith(base_dir + '/'):
+				continue
+			path = rel_path[len(base_dir) + 1:]
+		else:
+			path = rel_path
+		
+		if regex.match(path):
+			ignored = not is_negated
+	
+	return ignored
+
+#######################################
+# File Discovery
+
+# Directories that never get searched
+# NOTE: Apart from these (and whatever .gitignore files say), everything that "grep -r"
+#       would search gets searched too, including hidden files/dirs and big files
+SKIP_DIRS = {'.git', '.svn', '.hg', '__pycache__', 'node_modules'}
+
+# Number of bytes checked for NUL's when deciding whether a file is binary (same as grep)
+BINARY_CHECK_SIZE = 8192
+
+
+# Find all the files under the given root that could be searched
+# < root: (str) Directory to search from
+# < use_gitignore: (bool) Whether to skip files that .gitignore files say to
+# > yields: (str, os.stat_result) Path of each file (relative to root), and its stat info
+def walk_files(root, use_gitignore=True):
+	pending = [("", [])]    # (dir relative to the root, .gitignore rules that apply to it)
+	while pending:
+		rel_dir, rules = pending.pop()
+		dir_path = os.path.join(root, rel_dir) if rel_dir else root
+		try:
+			entries = list(os.scandir(dir_path))
+		except OSError:
+			continue
+		
+		if use_gitignore and any(entry.name == ".gitignore" for entry in entries):
+			rules = rules + read_gitignore(os.path.join(dir_path, ".gitignore"), rel_dir.replace(os.sep, '/'))
+		
+		for entry in entries:
+			rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+			try:
+				if entry.is_dir(follow_symlinks=False):
+					if (entry.name not in SKIP_DIRS) and not (rules and is_ignored(rules, rel_path, True)):
+						pending.append((rel_path, rules))
+				elif entry.is_file():
+					if rules and is_ignored(rules, rel_path, False):
+						continue
+					
+					yield (rel_path, entry.stat())
+			except OSError:
+				pass
+
+
+# Check whether the given file contents look like a binary file
+# < data: (bytes-like) File contents (or at least the start of them)
+def is_binary(data):
+	return data.find(b'\0', 0, BINARY_CHECK_SIZE) >= 0
+
+
+# Check whether the given file path matches any of the "--include" globs
+# < include: ([str] | None) Globs to match the filename against (e.g. "*.py"). None = all files
+def matches_include(rel_path, include):
+	if not include:
+		return True
+	
+	name = os.path.basename(rel_path)
+	return any(fnmatch.fnmatch(name, pattern) for pattern in include)
+
+#######################################
+# Pattern Syntax
+#
+# Patterns can be given as literal text, Python regexes, or the "basic" regexes that grep uses
+# by default (which is what the pygrep/cgrep/etc. wrappers use, as they replaced "grep -irn").
+# Basic regexes get converted to Python regexes:
+#  * ".", "*", "[...]", "^" (at the start), and "$" (at the end) mean the same as in Python
+#  * "+", "?", "|", "(", ")", "{", and "}" are literal, unless they're escaped (GNU extensions)
+#  * "\<" and "\>" match the start/end of words
+#  * "[[:alpha:]]" etc. can be used in bracket expressions, where backslashes are literal
+#  * Nothing matches line breaks (as grep only ever looks at one line at a time)
+
+# Ways that the pattern can be given
+PATTERN_SYNTAXES = ('literal', 'basic', 'regex')
+
+# POSIX character classes (for bracket expressions in basic regexes), as Python set contents
+POSIX_CHAR_CLASSES = {
+	'alpha': 'a-zA-Z',
+	'digit': '0-9',
+	'alnum': 'a-zA-Z0-9',
+	'upper': 'A-Z',
+	'lower': 'a-z',
+	'xdigit': '0-9A-Fa-f',
+	'space': r' \t\r\v\f',
+	'blank': r' \t',
+	'punct': r'!-/:-@\[-`{-~',
+	'cntrl': r'\x00-\x09\x0b-\x1f\x7f',
+	'print': r' -~',
+	'graph': r'!-~',
+}
+
+
+# Convert a grep "basic" regex to the equivalent Python regex
+# > throws "re.error" if there's an unterminated bracket expression
+def basic_regex_to_python(pattern):
+	out = []
+	i = 0
+	n = len(pattern)
+	
+	while i < n:
+		c = pattern[i]
+		if c == '\\' and i + 1 < n:
+			escaped = pattern[i + 1]
+			if escaped in '(){}|+?':
+				# GNU extensions for the operators that are otherwise literal
+				out.append(escaped)
+			elif escaped in '<>':
+				out.append(r'\b')
+			elif escaped in 'sW':
+				# Python's versions of these match line breaks too
+				out.append(r'[^\S\n]' if escaped == 's' else r'[^\w\n]')
+			else:
+				out.append(c + escaped)
+			i += 2
+		elif c == '[':
+			j = i + 1
+			body = []
+			if pattern.startswith('^', j):
+				body.append(r'^\n')
+				j += 1
+			if pattern.startswith(']', j):
+				# A ']' straight after the '[' is part of the set
+				body.append(r'\]')
+				j += 1
+			
+			while j < n and pattern[j] != ']':
+				if pattern.startswith('[:', j):
+					end = pattern.find(':]', j + 2)
+					name = pattern[j + 2:end] if end >= 0 else None
+					if name in POSIX_CHAR_CLASSES:
+						body.append(POSIX_CHAR_CLASSES[name])
+						j = end + 2
+						continue
+				
+				body.append('\\' + pattern[j] if pattern[j] in '\\[' else pattern[j])
+				j += 1
+			
+			if j >= n:
+				raise re.error("Unterminated [ in pattern", pattern, i)
+			out.append('[' + ''.join(body) + ']')
+			i = j + 1
+		elif c == '*' and (not out or out[-1] in ('^', '(', '|')):
+			# Nothing to repeat, so it's literal
+			out.append(r'\*')
+			i += 1
+		elif c == '^' and out and out[-1] not in ('(', '|'):
+			# Only an anchor at the start
+			out.append(r'\^')
+			i += 1
+		elif c == '$' and i + 1 < n and pattern[i + 1:i + 3] not in ('\\)', '\\|'):
+			# Only an anchor at the end
+			out.append(r'\$')
+			i += 1
+		elif c in '+?|(){}':
+			out.append('\\' + c)
+			i += 1
+		else:
+			out.append(c)
+			i += 1
+	
+	return ''.join(out)
+
+
+# Get the pattern to search for, given the way it was written
+# < syntax: (str) One of PATTERN_SYNTAXES
+# > returns: (str, bool) Pattern, and whether it's a (Python) regex
+# > throws "re.error" if the pattern is invalid
+def resolve_pattern_syntax(pattern, syntax):
+	if syntax == 'basic':
+		return (basic_regex_to_python(pattern), True)
+	else:
+		return (pattern, syntax == 'regex')
+
+
+#######################################
+# Searching
+
+# Size of the chunks that file contents get copied out in (when lowercasing them, or counting lines)
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+# What to search for in each file
+class SearchPattern:
+	# < pattern: (str) Text/regex to search for
+	# < is_regex: (bool) Whether pattern is a regex (otherwise it's matched literally)
+	# < ignore_case: (bool) Whether to ignore case (like "grep -i")
+	# > throws "re.error" if the regex is invalid
+	def __init__(self, pattern, is_regex, ignore_case):
+		flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+		if is_regex:
+			self.regex = re.compile(pattern.encode('utf-8'), flags)
+			self.literal = None
+		else:
+			self.regex = re.compile(re.escape(pattern).encode('utf-8'), flags)
+			self.literal = pattern.encode('utf-8')
+		
+		# NOTE: Only ASCII case gets ignored for bytes regexes, which is what bytes.lower() does too
+		self.fold_case = ignore_case and (self.literal is not None) and (self.literal.lower() != self.literal.upper())
+		if self.fold_case:
+			self.literal = self.literal.lower()
+	
+	# Quickly check whether the file contents could match, before running the (much slower) regex over them
+	# < data: (bytes | mmap) File contents
+	def could_match(self, data):
+		if not self.literal:
+			return True
+		elif self.fold_case:
+			# NOTE: Even with lowercasing a copy of each chunk, this is several times faster than an IGNORECASE regex.
+			#       Chunks overlap by len(literal) - 1 bytes, so that matches spanning two chunks aren't missed.
+			overlap = len(self.literal) - 1
+			for start in range(0, len(data), SCAN_CHUNK_SIZE):
+				if data[start:start + SCAN_CHUNK_SIZE + overlap].lower().find(self.literal) >= 0:
+					return True
+			return False
+		else:
+			return data.find(self.literal) >= 0
+
+
+# Compile the pattern to match file contents with (see SearchPattern)
+# > throws "re.error" if the regex is invalid
+def compile_pattern(pattern, is_regex, ignore_case):
+	return SearchPattern(pattern, is_regex, ignore_case)
+
+
+# Count the line breaks in part of the file contents
+# NOTE: mmap doesn't have count(), so this goes through slices of it (a chunk at a time, so big files don't get copied)
+def count_newlines(data, start, end):
+	return sum(data[pos:min(pos + SCAN_CHUNK_SIZE, end)].count(b'\n')
+	           for pos in range(start, end, SCAN_CHUNK_SIZE))
+
+
+# Find the lines matching the pattern in the given file contents
+# < data: (bytes | mmap) File contents
+# < regex: (re.Pattern) Regex to find (i.e. SearchPattern.regex)
+# > yields: (int, bytes) Line number, and the text of the line (without the line ending)
+def search_data(data, regex):
+	line_no = 1
+	pos = 0          # Where line_no was counted up to
+	next_line = 0    # Where the next line that hasn't been output yet starts
+	
+	for match in regex.finditer(data):
+		start = match.start()
+		if start < next_line:
+			# Another match on a line that's already been output
+			continue
+		
+		# NOTE: Line numbers are only counted up to the matches
+		line_start = data.rfind(b'\n', pos, start)
+		if line_start >= 0:
+			line_start += 1
+			line_no += count_newlines(data, pos, line_start)
+		else:
+			line_start = pos
+		pos = line_start
+		
+		line_end = data.find(b'\n', start)
+		if line_end < 0:
+			line_end = len(data)
+		
+		yield (line_no, data[line_start:line_end].rstrip(b'\r'))
+		
+		next_line = line_end + 1
+
+
+# Search a file, getting the output lines for its matches
+# < fileN: (str) Path to the file
+# < pattern: (SearchPattern) Compiled pattern from compile_pattern()
+# < label: (str) Name to show for the file in the output
+# > returns: (str, str | None) Output lines for the file, and details of any error
+def search_file(fileN, pattern, label):
+	try:
+		with open(fileN, 'rb') as f:
+			try:
+				data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			except ValueError:
+				# Empty file
+				return ("", None)
+			
+			with data:
+				if is_binary(data) or not pattern.could_match(data):
+					return ("", None)
+				return ("".join("%s:%d:%s\n" % (label, line_no, text.decode('utf-8', 'replace'))
+				                for line_no, text in search_data(data, pattern.regex)),
+				        None)
+	except OSError as err:
+		return ("", "! Couldn't read %s: %s" % (fileN, err))
+
+
+# The pattern being searched for, in each of the pool's processes
+_pool_pattern = None
+
+def init_search_pool(pattern):
+	global _pool_pattern
+	_pool_pattern = pattern
+
+def search_file__task(args):
+	fileN, label = args
+	return search_file(fileN, _pool_pattern, label)
+
+
+# Number of files to have before bothering to search them in parallel
+PARALLEL_SEARCH_THRESHOLD = 32
+
+
+# Search the given files, writing out the matching lines like "grep -n"
+# < root: (str) Root directory the paths are relative to
+# < paths: ([str]) Files to search (relative to root). The output is in the same order as these
+# < pattern: (SearchPattern) Compiled pattern from compile_pattern()
+# < prefix: (str) Prefix to show on the filenames in the output
+# < jobs: (int) Number of processes to search with (0 = one per core)
+# > returns: (int) Number of matching lines
+def grep_files(root, paths, pattern, prefix="", jobs=0, out=sys.stdout):
+	tasks = [(os.path.join(root, rel_path), prefix + rel_path) for rel_path in paths]
+	jobs = jobs or os.cpu_count()
+	
+	n_matches = 0
+	def show_results(results):
+		nonlocal n_matches
+		for text, error in results:
+			if error:
+				print(error, file=sys.stderr)
+			if text:
+				out.write(text)
+				n_matches += text.count("\n")
+	
+	if jobs > 1 and len(tasks) >= PARALLEL_SEARCH_THRESHOLD:
+		with multiprocessing.Pool(jobs, initializer=init_search_pool, initargs=(pattern,)) as pool:
+			# NOTE: imap() keeps the results in order, so the output is the same however many processes there are
+			show_results(pool.imap(search_file__task, tasks, chunksize=16))
+	else:
+		show_results(search_file(fileN, pattern, label) for fileN, label in tasks)
+	
+	return n_matches
+
+#######################################
+
+# Handle command-line arguments
+def get_config():
+	parser = argparse.ArgumentParser(
+		description = "Search files under a directory for a string (in parallel, without an index)")
+	
+	parser.add_argument("pattern",
+	                    help="Text to search for (matched literally, unless -G or -e is used)")
+	parser.add_argument("root", nargs='?', default=".",
+	                    help="Directory to search under (default: current directory)")
+	
+	parser.add_argument("--include", action="append", metavar="GLOB",
+	                    help="Only search files whose names match GLOB (e.g. '*.py'). Can be used multiple times")
+	parser.add_argument("--no-ignore", dest="use_gitignore", action="store_false",
+	                    help="Search files even if a .gitignore says to ignore them")
+	
+	parser.add_argument("-F", "--fixed-strings", dest="syntax", action="store_const", const='literal', default='literal',
+	                    help="Match the pattern literally (default)")
+	parser.add_argument("-G", "--basic-regex", dest="syntax", action="store_const", const='basic',
+	                    help="Treat the pattern as a basic regular expression, like grep does by default")
+	parser.add_argument("-e", "--regex", dest="syntax", action="store_const", const='regex',
+	                    help="Treat the pattern as a (Python) regular expression")
+	parser.add_argument("-s", "--case-sensitive", dest="ignore_case", action="store_false",
+	                    help="Match case exactly (by default, case is ignored like 'grep -i')")
+	
+	parser.add_argument("-j", "--jobs", type=int, default=0,
+	                    help="Number of processes to search with (0 = one per core)")
+	
+	return parser.parse_args()
+
+
+def main():
+	config = get_config()
+	
+	if not os.path.isdir(config.root):
+		print("! '%s' is not a directory" % (config.root), file=sys.stderr)
+		sys.exit(2)
+	
+	try:
+		pattern_text, is_regex = resolve_pattern_syntax(config.pattern, config.syntax)
+		pattern = compile_pattern(pattern_text, is_regex, config.ignore_case)
+	except re.error as err:
+		print("! Invalid regex: %s" % (err), file=sys.stderr)
+		sys.exit(2)
+	
+	paths = sorted(rel_path for rel_path, _st in walk_files(config.root, config.use_gitignore)
+	               if matches_include(rel_path, config.include))
+	
+	# Show paths relative to wherever we were asked to search from (like grep does)
+	prefix = "" if os.path.normpath(config.root) == "." else os.path.join(config.root, "")
+	n_matches = grep_files(config.root, paths, pattern, prefix, config.jobs)
+	
+	# Same exit codes as grep
+	sys.exit(0 if n_matches else 1)
+
+if __name__ == '__main__':
+	main()
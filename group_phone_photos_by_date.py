@@ -11,9 +11,18 @@ import sys
 import os
 
 import argparse
+import bisect
+import concurrent.futures
+import csv
 import datetime
+import errno
+import hashlib
+import json
+import pathlib
 import re
 import shutil
+import sqlite3
+import struct
 import time
 
 try:
@@ -28,48 +37,117 @@ except:
 # Help text for the "datespec" property
 DATESPEC_DESCRIPTION = """\
 Defines the date ranges that are considered for copying.
+Dates can be given as "yyyyMMdd", "yyyyMM" (whole month), or "yyyy" (whole year).
 
  (1) "all" = All dates are considered
  
  (2) "yyyyMMdd" = All dates starting from that date
  
- (3) "[yyyyMMdd] = Only that date
+ (3) "[yyyyMMdd]" = Only that date (or month/year)
+ 
+ (4) "from..to" = All dates between these (inclusive). Either end can be left off
+     (e.g. "20200101..20200131", "201905..201908", "2019..", "..20180630")
+ 
+ (5) "a,b,c" = Any of the given dates/ranges
+     NOTE: In lists, plain dates only mean that date (or month/year), not "starting from"
+     (e.g. "20190519,20190601..20190605,[202001]")
 """
-# TODO: More to come if needed
 
-# Get datespec interpreter given the datespec specifier string
-# NOTE: It is assumed that this is only execute once
-#
-# > returns: fn(date_string: str = "yyyyMMdd") -> bool
-def get_datespec_handler(datespec_format):
-	if re.match(r"^(\d{4}\d{2}\d{2})|(\d{4}\d{2})|(\d{4})$", datespec_format):
-		# Only those after the given date will be included
-		def compare_newer_only(date_string):
-			# Assume that the string sorting will work
-			# e.g. "2011"   < "20110222" == true,
-			#      "201212" < "20121212" == true,
-			#      "201711" > "20171011 == true"
-			return date_string > datespec_format
-			
-		print("Using 'NEWER_ONLY' datespec")
-		return compare_newer_only
-	
-	elif re.match(r"^\[\d{4}\d{2}\d{2}\]$", datespec_format):
-		# Absolute date format
-		def compare_absolute_date(date_string):
-			# Full date string must match. Just chop off the brackets on either side...
-			return date_string == datespec_format[1 : -1]
-			
-		print("Using 'ABSOLUTE_DATE' datespec")
-		return compare_absolute_date
+# Regular expression for a date (or month/year) in a datespec
+RE_DATESPEC_DATE = r"\d{4}(?:\d{2}(?:\d{2})?)?"
+
+# Lowest/highest possible date strings (for open-ended ranges)
+DATESPEC_MIN = "00000000"
+DATESPEC_MAX = "99999999"
+
+# Get the first/last "yyyyMMdd" date-strings covered by a (possibly partial) date in a datespec
+# e.g. "201905" -> "20190500" (first) or "20190599" (last). This works fine with string comparisons.
+def datespec_first_date(date_string):
+	return date_string.ljust(8, "0")
+
+def datespec_last_date(date_string):
+	return date_string.ljust(8, "9")
+
+# Parse the datespec specifier string into the date ranges that it covers
+# > returns: ([(str, str)]) Sorted, non-overlapping list of inclusive (first, last) "yyyyMMdd" date-string ranges
+# > throws "ValueError" if the datespec is invalid
+def parse_datespec(datespec_format):
+	if datespec_format in ("all", "."):
+		return [(DATESPEC_MIN, DATESPEC_MAX)]
 	
-	else:
-		# All - No filtering
-		def compare_all(_date_string):
-			return True
+	items = datespec_format.split(",")
+	ranges = []
+	
+	for item in items:
+		item = item.strip()
 		
-		print("Using 'ALL' files")
-		return compare_all
+		if re.match(rf"^{RE_DATESPEC_DATE}$", item):
+			if len(items) == 1:
+				# Only those from the given date onwards will be included
+				ranges.append((datespec_first_date(item), DATESPEC_MAX))
+			else:
+				# In a list - Only that date
+				ranges.append((datespec_first_date(item), datespec_last_date(item)))
+		elif match := re.match(rf"^\[({RE_DATESPEC_DATE})\]$", item):
+			# Absolute date
+			date_string = match.group(1)
+			ranges.append((datespec_first_date(date_string), datespec_last_date(date_string)))
+		elif match := re.match(rf"^({RE_DATESPEC_DATE})?\.\.({RE_DATESPEC_DATE})?$", item):
+			# Range of dates
+			first = datespec_first_date(match.group(1)) if match.group(1) else DATESPEC_MIN
+			last = datespec_last_date(match.group(2)) if match.group(2) else DATESPEC_MAX
+			if first > last:
+				raise ValueError(f"Invalid datespec range '{item}' - Start is after the end")
+			ranges.append((first, last))
+		else:
+			raise ValueError(f"Invalid datespec '{item}'")
+	
+	# Merge overlapping ranges, so that no files get visited twice
+	merged = []
+	for first, last in sorted(ranges):
+		if merged and first <= merged[-1][1]:
+			merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+		else:
+			merged.append((first, last))
+	return merged
+
+# Find all the files that fall within the given date ranges
+# < dated_files: ([(str, str)]) (date_string, filename) pairs, sorted by date
+# < date_ranges: ([(str, str)]) Date ranges from parse_datespec()
+# > returns: ([(str, str)]) The (date_string, filename) pairs within the date ranges, in date order
+#
+# NOTE: Only the matching parts of dated_files get visited (using binary searches to find them)
+def select_files_by_datespec(dated_files, date_ranges):
+	keys = [date_string for (date_string, _fileN) in dated_files]
+	
+	selected = []
+	for first, last in date_ranges:
+		start = bisect.bisect_left(keys, first)
+		end = bisect.bisect_right(keys, last)
+		selected += dated_files[start:end]
+	return selected
+
+# Unit tests for parse_datespec() and select_files_by_datespec()
+def test_datespec():
+	assert parse_datespec("all") == [(DATESPEC_MIN, DATESPEC_MAX)]
+	assert parse_datespec("20190519") == [("20190519", DATESPEC_MAX)]
+	assert parse_datespec("2019") == [("20190000", DATESPEC_MAX)]
+	assert parse_datespec("[20190519]") == [("20190519", "20190519")]
+	assert parse_datespec("[201905]") == [("20190500", "20190599")]
+	assert parse_datespec("201905..201908") == [("20190500", "20190899")]
+	assert parse_datespec("..2018") == [(DATESPEC_MIN, "20189999")]
+	assert parse_datespec("20190519,20190601..20190605,[2019]") == [("20190000", "20199999")]
+	assert parse_datespec("20190519,20190601..20190605") == [("20190519", "20190519"), ("20190601", "20190605")]
+	
+	with pytest.raises(ValueError):
+		parse_datespec("2019-05")
+	with pytest.raises(ValueError):
+		parse_datespec("2020..2019")
+	
+	dated_files = [("20190518", "a"), ("20190519", "b"), ("20190519", "c"), ("20190601", "d"), ("20200101", "e")]
+	assert select_files_by_datespec(dated_files, parse_datespec("20190519")) == dated_files[1:]
+	assert select_files_by_datespec(dated_files, parse_datespec("[20190519],2020")) == [dated_files[1], dated_files[2], dated_files[4]]
+	assert select_files_by_datespec(dated_files, parse_datespec("..201905")) == dated_files[:3]
 
 
 #######################################
@@ -99,6 +177,25 @@ def get_config():
 	parser.add_argument("-p", "--postfix", type=str, default="n9",
 	                    help='Postfix to use when the directory in question already exists')
 	
+	parser.add_argument("-m", "--mode", choices=TRANSFER_MODES, default="copy",
+	                    help="How files get added to the collection. 'hardlink' and 'reflink' need the input + output "
+	                         "folders to be on the same drive ('reflink' falls back to copying if unsupported).")
+	
+	parser.add_argument("-j", "--jobs", type=int, default=4,
+	                    help="Number of files to copy at once")
+	
+	parser.add_argument("--no-dedupe", dest="dedupe", action="store_false",
+	                    help="Don't skip files that are already in the collection")
+	
+	parser.add_argument("--rescan", action="store_true",
+	                    help="Rescan the collection for files added/removed by other means, "
+	                         f"updating its index ('{COLLECTION_INDEX_FILENAME}' in the output folder)")
+	
+	parser.add_argument("--verify", action="store_true",
+	                    help="Hash each file as it gets copied, and check that the copy matches. "
+	                         f"Results are saved to '{VERIFY_MANIFEST_DIR}' in the output folder, "
+	                         "so files verified on previous runs don't get checked again. Only for 'copy' mode.")
+	
 	parser.add_argument("-d", "--dry_run", type=bool, default=False,
 	                    help="If true, don't actually perform any file copying. For testing that the path handling will be correct.")
 	
@@ -140,6 +237,216 @@ def test_dateinfo_extraction():
 	assert extract_dateinfo_from_filename("20191211_164729.mp4") == ("20191211", datetime.date(2019, 12, 11))
 	assert extract_dateinfo_from_filename("20191211_180009~2.mp4") == ("20191211", datetime.date(2019, 12, 11))
 
+# -------------------------------------
+# Header Date Extraction
+#
+# For files that aren't named by date, we fall back to the date stored in the file itself.
+# Only the headers are read: the EXIF data at the start of JPEGs, and the "mvhd" box
+# in MP4/MOV files (seeking past the media data, instead of reading it).
+
+# Filename of the cache of dates extracted from file headers (stored in the input directory)
+DATE_CACHE_FILENAME = ".photo_dates_cache.json"
+
+# EXIF tags of interest
+EXIF_IFD_TAG = 0x8769
+EXIF_DATETIME_ORIGINAL_TAG = 0x9003
+TIFF_DATETIME_TAG = 0x0132
+
+# Offset between the QuickTime epoch (1904-01-01) and the Unix epoch (1970-01-01), in seconds
+QUICKTIME_EPOCH_OFFSET = 2082844800
+
+# Get the EXIF data from the header of a JPEG file
+# > returns: (bytes | None) The EXIF data (starting from the TIFF header)
+def read_jpeg_exif(f):
+	if f.read(2) != b'\xFF\xD8':
+		return None
+	
+	while True:
+		marker = f.read(2)
+		if len(marker) < 2 or marker[0] != 0xFF or marker[1] in (0xD9, 0xDA):
+			# Reached the image data (or something's wrong) - No EXIF here
+			return None
+		
+		length = struct.unpack('>H', f.read(2))[0] - 2
+		if marker[1] == 0xE1:
+			data = f.read(length)
+			if data.startswith(b'Exif\x00\x00'):
+				return data[6:]
+		else:
+			f.seek(length, os.SEEK_CUR)
+
+# Get the "DateTimeOriginal" (or failing that, "DateTime") from EXIF data
+# > returns: (str | None) The EXIF date string - "yyyy:MM:dd HH:mm:ss"
+def exif_datetime(tiff):
+	endian = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+	if endian is None:
+		return None
+	
+	# Get the value of each ASCII/LONG tag in an IFD
+	def read_ifd(offset):
+		values = {}
+		num_entries = struct.unpack_from(endian + 'H', tiff, offset)[0]
+		for i in range(num_entries):
+			tag, field_type, count, value = struct.unpack_from(endian + 'HHII', tiff, offset + 2 + (i * 12))
+			if field_type == 2 and count > 4:
+				values[tag] = tiff[value : value + count].rstrip(b'\x00').decode('ascii', 'replace')
+			elif field_type == 4:
+				values[tag] = value
+		return values
+	
+	ifd0 = read_ifd(struct.unpack_from(endian + 'I', tiff, 4)[0])
+	if EXIF_IFD_TAG in ifd0:
+		exif_ifd = read_ifd(ifd0[EXIF_IFD_TAG])
+		if EXIF_DATETIME_ORIGINAL_TAG in exif_ifd:
+			return exif_ifd[EXIF_DATETIME_ORIGINAL_TAG]
+	return ifd0.get(TIFF_DATETIME_TAG)
+
+# Get the creation time from the "mvhd" box of an MP4/MOV file
+# > returns: (datetime.datetime | None) The creation time (in local time)
+def read_quicktime_creation_time(f):
+	file_size = os.fstat(f.fileno()).st_size
+	
+	# Walk the boxes, looking for "moov" at the top level, then "mvhd" inside that
+	pos = 0
+	end = file_size
+	while pos + 8 <= end:
+		f.seek(pos)
+		size, box_type = struct.unpack('>I4s', f.read(8))
+		header_size = 8
+		if size == 1:
+			# 64-bit size
+			size = struct.unpack('>Q', f.read(8))[0]
+			header_size = 16
+		elif size == 0:
+			# Extends to end of file
+			size = end - pos
+		
+		if size < header_size:
+			return None
+		
+		if box_type == b'moov':
+			# Descend into this box
+			end = pos + size
+			pos += header_size
+		elif box_type == b'mvhd':
+			version = f.read(4)[0]
+			if version == 1:
+				creation_time = struct.unpack('>Q', f.read(8))[0]
+			else:
+				creation_time = struct.unpack('>I', f.read(4))[0]
+			
+			if creation_time == 0:
+				return None
+			
+			# NOTE: These are stored in UTC
+			timestamp = creation_time - QUICKTIME_EPOCH_OFFSET
+			return datetime.datetime.fromtimestamp(timestamp)
+		else:
+			# Skip (e.g. "mdat" = the actual media data)
+			pos += size
+	
+	return None
+
+# Get the date a photo/video was taken from its headers
+# < full_path: (str) Path to the file
+# > returns: (str | None) The date-string (yyyyMMdd), or None if it couldn't be found
+def extract_datestring_from_headers(full_path):
+	try:
+		with open(full_path, 'rb') as f:
+			head = f.read(12)
+			f.seek(0)
+			
+			if head.startswith(b'\xFF\xD8'):
+				exif = read_jpeg_exif(f)
+				date_time = exif_datetime(exif) if exif else None
+				if date_time and re.match(r"^\d{4}:\d{2}:\d{2}", date_time):
+					return date_time[0:4] + date_time[5:7] + date_time[8:10]
+			elif head[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip'):
+				creation_time = read_quicktime_creation_time(f)
+				if creation_time:
+					return creation_time.strftime("%Y%m%d")
+	except (OSError, struct.error, IndexError, ValueError, OverflowError):
+		pass
+	
+	return None
+
+# Load the cache of dates extracted from file headers
+# > returns: ({ str : [int, int, str | None] }) Map from filenames to [size, mtime_ns, date_string]
+def load_date_cache(input_dir):
+	try:
+		with open(os.path.join(input_dir, DATE_CACHE_FILENAME)) as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return {}
+
+# Save the cache of dates extracted from file headers
+# NOTE: The cache is only an optimisation, so failing to save it (e.g. read-only input folder) just gives a warning
+def save_date_cache(input_dir, date_cache):
+	cache_filename = os.path.join(input_dir, DATE_CACHE_FILENAME)
+	tmp_filename = cache_filename + ".tmp"
+	try:
+		with open(tmp_filename, 'w') as f:
+			json.dump(date_cache, f)
+		os.replace(tmp_filename, cache_filename)
+	except OSError as e:
+		print(f"WARNING: Could not save date cache to '{cache_filename}' - {e}", file=sys.stderr)
+		try:
+			os.remove(tmp_filename)
+		except OSError:
+			pass
+
+# Extract a datetime.date() for a given file, from its filename or failing that, its headers
+# < input_dir: (str) Folder containing the file
+# < fileN: (str) Just the filename
+# <> date_cache: ({ str : list }) Cache of dates extracted from headers (see load_date_cache())
+# > returns: (str, datetime.date) The date-string (yyyyMMdd), followed by a decomposed version of that date
+# > throws "ValueError" if a date couldn't be extracted...
+def extract_dateinfo_for_file(input_dir, fileN, date_cache):
+	try:
+		return extract_dateinfo_from_filename(fileN)
+	except ValueError as e:
+		filename_error = e
+	
+	full_path = os.path.join(input_dir, fileN)
+	st = os.stat(full_path)
+	
+	cached = date_cache.get(fileN)
+	if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+		date_string = cached[2]
+	else:
+		date_string = extract_datestring_from_headers(full_path)
+		date_cache[fileN] = [st.st_size, st.st_mtime_ns, date_string]
+	
+	if date_string is None:
+		raise ValueError(f"{filename_error}, and no date found in file headers")
+	
+	return extract_dateinfo_from_filename(date_string)
+
+# Unit tests for extract_datestring_from_headers()
+def test_header_date_extraction(tmp_path):
+	# JPEG with EXIF DateTimeOriginal
+	date_value = b"2021:07:04 12:34:56\x00"
+	tiff = b"II*\x00" + struct.pack('<I', 8)
+	tiff += struct.pack('<H', 1) + struct.pack('<HHII', EXIF_IFD_TAG, 4, 1, 26) + struct.pack('<I', 0)
+	tiff += struct.pack('<H', 1) + struct.pack('<HHII', EXIF_DATETIME_ORIGINAL_TAG, 2, len(date_value), 44) + struct.pack('<I', 0)
+	tiff += date_value
+	app1 = b"Exif\x00\x00" + tiff
+	jpeg = b"\xFF\xD8" + b"\xFF\xE1" + struct.pack('>H', len(app1) + 2) + app1 + b"\xFF\xDA" + b"\x00" * 100
+	(tmp_path / "IMG_0001.jpg").write_bytes(jpeg)
+	assert extract_datestring_from_headers(str(tmp_path / "IMG_0001.jpg")) == "20210704"
+	
+	# MP4 with the "moov" after a large "mdat" (as is common for phone videos)
+	timestamp = datetime.datetime(2020, 2, 29, 12, 0, 0).timestamp()
+	mvhd = struct.pack('>I4sB3xII', 8 + 12, b'mvhd', 0, int(timestamp) + QUICKTIME_EPOCH_OFFSET, 0)
+	mp4 = struct.pack('>I4s', 16, b'ftyp') + b"isom\x00\x00\x00\x00"
+	mp4 += struct.pack('>I4s', 8 + 100000, b'mdat') + b"\x00" * 100000
+	mp4 += struct.pack('>I4s', 8 + len(mvhd), b'moov') + mvhd
+	(tmp_path / "VID_0001.mp4").write_bytes(mp4)
+	assert extract_datestring_from_headers(str(tmp_path / "VID_0001.mp4")) == "20200229"
+	
+	(tmp_path / "notes.txt").write_bytes(b"nothing to see here")
+	assert extract_datestring_from_headers(str(tmp_path / "notes.txt")) is None
+
 # -------------------------------------
 
 # Figure out folder that a given file should go to
@@ -170,7 +477,7 @@ def folder_path_for_file(date_to_folder_map, date_string, date_info, out_dir, co
 	if not os.path.exists(folder_name):
 		print("    Creating directory: '%s'" % (folder_name))
 		if not is_dry_run:
-			os.makedirs(folder_name) # NOTE: This will create the intermediate paths
+			os.makedirs(folder_name, exist_ok=True) # NOTE: This will create the intermediate paths
 			print("   Folder Created? %s" % os.path.exists(folder_name))
 		else:
 			print("    Not creating folder...")
@@ -182,6 +489,495 @@ def folder_path_for_file(date_to_folder_map, date_string, date_info, out_dir, co
 	return folder_name
 
 
+#######################################
+# File Transfer
+
+# Ways that files can be added to the collection
+TRANSFER_MODES = ("copy", "hardlink", "reflink", "move")
+
+# Throughput (bytes/sec) assumed when estimating how long copying will take
+ASSUMED_COPY_SPEED = 100 * 1024 * 1024
+
+# Size of the blocks to copy at a time with copy_file_range() / sendfile()
+COPY_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Errors which mean that copy_file_range() / sendfile() can't be used for the given files
+COPY_UNSUPPORTED_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSOCK)
+
+# ioctl to make a reflink (Linux only - on Btrfs/XFS/etc.)
+FICLONE = 0x40049409
+
+# Copy the contents of one file to another, letting the OS do the work where possible
+# (i.e. without needing to shuffle all the data through Python buffers)
+def fast_copy_file(src_fileN, dst_fileN):
+	with open(src_fileN, 'rb') as fsrc, open(dst_fileN, 'wb') as fdst:
+		src_fd = fsrc.fileno()
+		dst_fd = fdst.fileno()
+		
+		# NOTE: Only Linux's sendfile() can write to files (on macOS/BSD, the destination has to be a socket)
+		copy_fns = [getattr(os, 'copy_file_range', None)]
+		if sys.platform.startswith('linux'):
+			copy_fns.append(getattr(os, 'sendfile', None))
+		
+		for copy_fn in copy_fns:
+			if copy_fn is None:
+				continue
+			
+			copied_any = False
+			try:
+				if copy_fn is os.sendfile:
+					copy_block = lambda: os.sendfile(dst_fd, src_fd, None, COPY_BLOCK_SIZE)
+				else:
+					copy_block = lambda: os.copy_file_range(src_fd, dst_fd, COPY_BLOCK_SIZE)
+				
+				while copy_block() > 0:
+					copied_any = True
+				return
+			except OSError as e:
+				# Not supported for these files - Try the next method (from wherever we got to)
+				# Note: Anything that fails before a single byte was copied can't have done any harm,
+				#       so it's treated as not being supported too
+				if copied_any and e.errno not in COPY_UNSUPPORTED_ERRORS:
+					raise
+		
+		# Fallback - Plain buffered copy
+		shutil.copyfileobj(fsrc, fdst, COPY_BLOCK_SIZE)
+
+# Make a copy-on-write clone of a file (where the filesystem supports it)
+# > returns: (bool) True if the file was cloned, or False if it had to be copied instead
+def reflink_file(src_fileN, dst_fileN):
+	try:
+		import fcntl
+	except ImportError:
+		# Not supported on Windows
+		fast_copy_file(src_fileN, dst_fileN)
+		return False
+	
+	with open(src_fileN, 'rb') as fsrc, open(dst_fileN, 'wb') as fdst:
+		try:
+			fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+			return True
+		except OSError:
+			pass
+	
+	fast_copy_file(src_fileN, dst_fileN)
+	return False
+
+# Add a file to the collection, using the given transfer mode
+# < mode: (str) One of TRANSFER_MODES
+# > returns: (bool) False if a reflink had to fall back to copying
+def transfer_file(src_fileN, dst_fileN, mode):
+	if mode == "copy":
+		fast_copy_file(src_fileN, dst_fileN)
+	elif mode == "hardlink":
+		os.link(src_fileN, dst_fileN)
+	elif mode == "reflink":
+		return reflink_file(src_fileN, dst_fileN)
+	elif mode == "move":
+		shutil.move(src_fileN, dst_fileN)
+	else:
+		raise ValueError(f"Unknown transfer mode: '{mode}'")
+	return True
+
+# Copy a file, hashing its contents on the way through, then check that the copy matches
+# > returns: (str) Hash of the file's contents (same as full_hash_file())
+# > throws "OSError" if the copy doesn't match the original
+#
+# NOTE: The source only gets read once - The hash is computed from the same buffers that get written out.
+#       The copy then gets read back to check it (which will usually come straight from the OS's cache).
+def verified_copy_file(src_fileN, dst_fileN):
+	h = hashlib.sha1()
+	buf = bytearray(COPY_BLOCK_SIZE)
+	view = memoryview(buf)
+	
+	with open(src_fileN, 'rb') as fsrc, open(dst_fileN, 'wb') as fdst:
+		while True:
+			n = fsrc.readinto(buf)
+			if not n:
+				break
+			h.update(view[:n])
+			fdst.write(view[:n])
+	
+	digest = h.hexdigest()
+	if full_hash_file(dst_fileN) != digest:
+		raise OSError(errno.EIO, f"Copy doesn't match original (expected {digest})", dst_fileN)
+	return digest
+
+# Format a number of bytes for display
+def format_size(num_bytes):
+	for unit in ("B", "KB", "MB", "GB"):
+		if num_bytes < 1024:
+			break
+		num_bytes /= 1024
+	else:
+		unit = "TB"
+	return f"{num_bytes:.1f} {unit}"
+
+
+#######################################
+# Collection Index (for skipping duplicates)
+#
+# An SQLite database in the root of the collection records the size of each
+# file in it, along with hashes of their contents (which are only computed
+# when needed - i.e. when there's another file with the same size).
+# This lets us skip files that are already in the collection (no matter which
+# folder they ended up in) without having to rescan the whole thing every time.
+
+# Filename of the index (stored in the root of the collection)
+COLLECTION_INDEX_FILENAME = ".photo_collection_index.sqlite"
+
+# Number of bytes from the start and end of the file used for the "partial" hash
+PARTIAL_HASH_SIZE = 64 * 1024
+
+# Compute a cheap hash of a file, using only its size + the first/last few KB
+def partial_hash_file(fileN):
+	h = hashlib.sha1()
+	with open(fileN, 'rb') as f:
+		size = os.fstat(f.fileno()).st_size
+		h.update(str(size).encode())
+		h.update(f.read(PARTIAL_HASH_SIZE))
+		if size > PARTIAL_HASH_SIZE:
+			f.seek(max(PARTIAL_HASH_SIZE, size - PARTIAL_HASH_SIZE))
+			h.update(f.read(PARTIAL_HASH_SIZE))
+	return h.hexdigest()
+
+# Compute a hash of a file's full contents
+def full_hash_file(fileN, block_size=1024 * 1024):
+	h = hashlib.sha1()
+	with open(fileN, 'rb') as f:
+		for block in iter(lambda: f.read(block_size), b''):
+			h.update(block)
+	return h.hexdigest()
+
+
+# Index of all the files in the collection
+# NOTE: This should only be used from the main thread
+class CollectionIndex:
+	# Number of changes to make before committing them
+	COMMIT_INTERVAL = 100
+	
+	# < read_only: (bool) Only look things up in an existing index, without ever writing to it (e.g. for dry runs)
+	def __init__(self, out_dir, read_only=False):
+		self.out_dir = out_dir
+		self.db_filename = os.path.join(out_dir, COLLECTION_INDEX_FILENAME)
+		self.read_only = read_only
+		
+		self.pending_changes = 0
+		self.pending_sources = {}  # { path : src_fileN } for files that have been added, but may not have been written yet
+		
+		if read_only:
+			# NOTE: Hashes computed while looking things up just don't get saved
+			self.db = sqlite3.connect(pathlib.Path(self.db_filename).absolute().as_uri() + "?mode=ro", uri=True)
+			return
+		
+		is_new = not os.path.exists(self.db_filename)
+		
+		self.db = sqlite3.connect(self.db_filename)
+		self.db.execute("""
+			CREATE TABLE IF NOT EXISTS files (
+				path         TEXT PRIMARY KEY,  -- Relative to out_dir
+				size         INTEGER NOT NULL,
+				mtime_ns     INTEGER NOT NULL,
+				partial_hash TEXT,              -- Only computed when needed
+				full_hash    TEXT               -- Only computed when needed
+			)""")
+		self.db.execute("CREATE INDEX IF NOT EXISTS files_by_size ON files (size)")
+		self.db.commit()
+		
+		if is_new:
+			print(f"Building index of collection in '{self.db_filename}' (only done once)...")
+			self.rescan()
+	
+	# Walk the whole collection, adding any files that aren't in the index, and removing those that no longer exist
+	def rescan(self):
+		known = {path: (size, mtime_ns)
+		         for (path, size, mtime_ns) in self.db.execute("SELECT path, size, mtime_ns FROM files")}
+		seen = set()
+		added = 0
+		
+		for dirpath, dirnames, filenames in os.walk(self.out_dir):
+			if dirpath == self.out_dir and VERIFY_MANIFEST_DIR in dirnames:
+				# Not part of the collection
+				dirnames.remove(VERIFY_MANIFEST_DIR)
+			
+			for fileN in filenames:
+				full_path = os.path.join(dirpath, fileN)
+				path = os.path.relpath(full_path, self.out_dir)
+				if path.startswith(COLLECTION_INDEX_FILENAME):
+					# The index itself (+ its journal)
+					continue
+				
+				seen.add(path)
+				st = os.stat(full_path)
+				if known.get(path) != (st.st_size, st.st_mtime_ns):
+					self.db.execute("INSERT OR REPLACE INTO files (path, size, mtime_ns) VALUES (?, ?, ?)",
+					                (path, st.st_size, st.st_mtime_ns))
+					added += 1
+		
+		removed = [(path,) for path in known if path not in seen]
+		self.db.executemany("DELETE FROM files WHERE path = ?", removed)
+		self.db.commit()
+		
+		print(f"  Index updated: {len(seen)} files in collection ({added} added/changed, {len(removed)} removed)")
+	
+	# Get the hashes for an indexed file, computing (and storing) any that are needed but haven't been computed yet
+	# < row: (tuple) (path, size, mtime_ns, partial_hash, full_hash) from the index
+	# < need_full: (bool) Whether the full hash is needed
+	# > returns: (str, str | None) The partial hash and full hash, or None if the file no longer exists / has changed
+	def _hashes_for(self, row, need_full):
+		path, size, mtime_ns, partial_hash, full_hash = row
+		full_path = os.path.join(self.out_dir, path)
+		
+		if path in self.pending_sources:
+			# Added this run, but may not have been written yet - Use the original file while it's still there.
+			# Note: With "--mode move", the original is gone once it has been moved, but by then the
+			#       file in the collection is complete, so that gets used instead.
+			for fileN in (self.pending_sources[path], full_path):
+				try:
+					return self._compute_hashes(path, fileN, partial_hash, full_hash, need_full)
+				except FileNotFoundError:
+					pass
+			
+			# Neither exists (i.e. the transfer failed) - Not a match, but the row gets removed once the failure is reported
+			return None
+		
+		try:
+			st = os.stat(full_path)
+		except FileNotFoundError:
+			self._update("DELETE FROM files WHERE path = ?", (path,))
+			return None
+		
+		if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+			# Changed since it was indexed - Update the record, but it's not a match for this size anymore
+			self._update("UPDATE files SET size = ?, mtime_ns = ?, partial_hash = NULL, full_hash = NULL WHERE path = ?",
+			             (st.st_size, st.st_mtime_ns, path))
+			return None
+		
+		return self._compute_hashes(path, full_path, partial_hash, full_hash, need_full)
+	
+	# Compute (and store) any of the hashes for an indexed file that are needed but haven't been computed yet
+	# < path: (str) Path of the file in the index
+	# < fileN: (str) File to read the contents from
+	# > returns: (str, str | None) The partial hash and full hash
+	def _compute_hashes(self, path, fileN, partial_hash, full_hash, need_full):
+		if partial_hash is None:
+			partial_hash = partial_hash_file(fileN)
+			self._update("UPDATE files SET partial_hash = ? WHERE path = ?", (partial_hash, path))
+		
+		if need_full and full_hash is None:
+			full_hash = full_hash_file(fileN)
+			self._update("UPDATE files SET full_hash = ? WHERE path = ?", (full_hash, path))
+		
+		return (partial_hash, full_hash)
+	
+	# Check whether a file is already in the collection
+	# < src_info: ({ str : any }) Info about the file being checked - Any hashes computed here get added to this
+	#                             (must have 'size' set already)
+	# > returns: (str | None) Path (relative to out_dir) of the file in the collection with the same contents
+	def find_duplicate(self, src_fileN, src_info):
+		rows = self.db.execute("SELECT path, size, mtime_ns, partial_hash, full_hash FROM files WHERE size = ?",
+		                       (src_info['size'],)).fetchall()
+		if not rows:
+			# Fast path - Nothing is the same size, so it can't be a duplicate
+			return None
+		
+		if src_info.get('partial_hash') is None:
+			src_info['partial_hash'] = partial_hash_file(src_fileN)
+		
+		for row in rows:
+			hashes = self._hashes_for(row, need_full=False)
+			if hashes is None or hashes[0] != src_info['partial_hash']:
+				continue
+			
+			# Partial hashes match - Check the full contents to be sure
+			if src_info.get('full_hash') is None:
+				src_info['full_hash'] = full_hash_file(src_fileN)
+			
+			hashes = self._hashes_for(row, need_full=True)
+			if hashes is not None and hashes[1] == src_info['full_hash']:
+				return row[0]
+		
+		return None
+	
+	# Record that a file is being added to the collection
+	# < src_fileN: (str) The file it's being copied from (used for hashing until the copy is done)
+	# < src_info: ({ str : any }) Size and any hashes of its contents that are known already
+	def add(self, out_fileN, src_fileN, src_info):
+		path = os.path.relpath(out_fileN, self.out_dir)
+		
+		# Note: The mtime gets filled in by update_mtime() once the file has actually been written.
+		#       If that never happens, mtime_ns = -1 means that it gets rechecked if it's ever a candidate.
+		self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+		                (path, src_info['size'], -1, src_info.get('partial_hash'), src_info.get('full_hash')))
+		self.pending_sources[path] = src_fileN
+		self._changed()
+	
+	# Update the recorded mtime of a file, after it has been written
+	# < full_hash: (str | None) Hash of the file's contents, if it was computed while writing it
+	def update_mtime(self, out_fileN, full_hash=None):
+		path = os.path.relpath(out_fileN, self.out_dir)
+		self.db.execute("UPDATE files SET mtime_ns = ?, full_hash = COALESCE(?, full_hash) WHERE path = ?",
+		                (os.stat(out_fileN).st_mtime_ns, full_hash, path))
+		self.pending_sources.pop(path, None)
+		self._changed()
+	
+	# Remove a file from the index (e.g. if adding it failed)
+	def remove(self, out_fileN):
+		path = os.path.relpath(out_fileN, self.out_dir)
+		self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+		self.pending_sources.pop(path, None)
+		self._changed()
+	
+	# Make a change to the index (unless it's read-only)
+	def _update(self, sql, params):
+		if not self.read_only:
+			self.db.execute(sql, params)
+			self._changed()
+	
+	def _changed(self):
+		self.pending_changes += 1
+		if self.pending_changes >= self.COMMIT_INTERVAL:
+			self.db.commit()
+			self.pending_changes = 0
+	
+	def close(self):
+		if not self.read_only:
+			self.db.commit()
+		self.db.close()
+
+# Unit tests for CollectionIndex
+def test_collection_index(tmp_path):
+	collection = tmp_path / "photos"
+	(collection / "2019" / "2019_05_19").mkdir(parents=True)
+	(collection / "2019" / "2019_05_19" / "20190519_105307.jpg").write_bytes(b"a" * 1000)
+	
+	src_dir = tmp_path / "Camera"
+	src_dir.mkdir()
+	(src_dir / "dup.jpg").write_bytes(b"a" * 1000)
+	(src_dir / "same_size.jpg").write_bytes(b"b" * 1000)
+	(src_dir / "new.jpg").write_bytes(b"c" * 10)
+	
+	index = CollectionIndex(str(collection))
+	
+	def check(fileN):
+		src_fileN = str(src_dir / fileN)
+		return index.find_duplicate(src_fileN, {'size': os.path.getsize(src_fileN)})
+	
+	assert check("dup.jpg") == os.path.join("2019", "2019_05_19", "20190519_105307.jpg")
+	assert check("same_size.jpg") is None
+	assert check("new.jpg") is None
+	
+	# Files added later should be found too (even after reopening the index)
+	out_fileN = str(collection / "2019" / "2019_05_19-n9" / "new.jpg")
+	os.makedirs(os.path.dirname(out_fileN))
+	shutil.copyfile(str(src_dir / "new.jpg"), out_fileN)
+	index.add(out_fileN, str(src_dir / "new.jpg"), {'size': 10})
+	index.update_mtime(out_fileN)
+	index.close()
+	
+	index = CollectionIndex(str(collection))
+	assert check("new.jpg") == os.path.join("2019", "2019_05_19-n9", "new.jpg")
+	
+	# Files that have been moved into the collection (but not recorded as written yet) should still be found
+	(src_dir / "moved.jpg").write_bytes(b"d" * 10)
+	(src_dir / "moved_dup.jpg").write_bytes(b"d" * 10)
+	out_fileN = str(collection / "2019" / "2019_05_19-n9" / "moved.jpg")
+	index.add(out_fileN, str(src_dir / "moved.jpg"), {'size': 10})
+	shutil.move(str(src_dir / "moved.jpg"), out_fileN)
+	assert check("moved_dup.jpg") == os.path.join("2019", "2019_05_19-n9", "moved.jpg")
+	index.update_mtime(out_fileN)
+	assert check("moved_dup.jpg") == os.path.join("2019", "2019_05_19-n9", "moved.jpg")
+	index.close()
+	
+	# Read-only indexes (for dry runs) should still find duplicates, without writing anything
+	db_filename = str(collection / COLLECTION_INDEX_FILENAME)
+	with open(db_filename, 'rb') as f:
+		db_contents = f.read()
+	(collection / "2019" / "2019_05_19" / "20190519_105307.jpg").write_bytes(b"e" * 1000)
+	
+	index = CollectionIndex(str(collection), read_only=True)
+	assert check("dup.jpg") is None
+	assert check("moved_dup.jpg") == os.path.join("2019", "2019_05_19-n9", "moved.jpg")
+	index.close()
+	
+	with open(db_filename, 'rb') as f:
+		assert f.read() == db_contents
+
+
+#######################################
+# Verification Manifests
+#
+# When verifying copies, each run writes a CSV manifest listing the files that were
+# copied + verified, along with the hash of their contents. Later runs use these to
+# skip files that were already copied + verified (and haven't changed since).
+
+# Folder (in the root of the collection) where the manifests are kept
+VERIFY_MANIFEST_DIR = ".photo_copy_manifests"
+
+# Columns in the manifest files
+VERIFY_MANIFEST_FIELDS = ("source", "size", "mtime_ns", "sha1", "dest")
+
+# Load the manifests from all previous runs
+# > returns: ({ str : { str : str } }) Map from source filenames to their most recent manifest entry
+def load_verify_manifests(out_dir):
+	manifest_dir = os.path.join(out_dir, VERIFY_MANIFEST_DIR)
+	if not os.path.isdir(manifest_dir):
+		return {}
+	
+	entries = {}
+	for manifest_fileN in sorted(os.listdir(manifest_dir)):
+		if manifest_fileN.endswith(".csv"):
+			with open(os.path.join(manifest_dir, manifest_fileN), newline='') as f:
+				for row in csv.DictReader(f):
+					entries[row['source']] = row
+	return entries
+
+# Check whether a file was already copied + verified on a previous run, and is still intact
+# < entry: ({ str : str } | None) The file's entry from load_verify_manifests()
+# > returns: (str | None) The path where it was copied to, if so
+def previously_verified_path(entry, src_fileN, out_dir):
+	if entry is None:
+		return None
+	
+	st = os.stat(src_fileN)
+	if (str(st.st_size), str(st.st_mtime_ns)) != (entry['size'], entry['mtime_ns']):
+		return None
+	
+	dest_fileN = os.path.join(out_dir, entry['dest'])
+	if not os.path.exists(dest_fileN) or os.path.getsize(dest_fileN) != st.st_size:
+		return None
+	
+	return entry['dest']
+
+# Create the manifest for this run
+# > returns: (file, csv.writer) The open file, and a writer to add entries to it with
+def create_verify_manifest(out_dir):
+	manifest_dir = os.path.join(out_dir, VERIFY_MANIFEST_DIR)
+	os.makedirs(manifest_dir, exist_ok=True)
+	
+	now = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+	f = open(os.path.join(manifest_dir, f"{now}.csv"), 'w', newline='')
+	writer = csv.writer(f)
+	writer.writerow(VERIFY_MANIFEST_FIELDS)
+	return (f, writer)
+
+
+def test_verified_copy(tmp_path):
+	src = tmp_path / "src.jpg"
+	src.write_bytes(os.urandom(COPY_BLOCK_SIZE * 2 + 123))
+	
+	digest = verified_copy_file(str(src), str(tmp_path / "dst.jpg"))
+	assert digest == full_hash_file(str(src))
+	assert (tmp_path / "dst.jpg").read_bytes() == src.read_bytes()
+	
+	entry = {'source': "src.jpg", 'size': str(src.stat().st_size), 'mtime_ns': str(src.stat().st_mtime_ns),
+	         'sha1': digest, 'dest': "dst.jpg"}
+	assert previously_verified_path(entry, str(src), str(tmp_path)) == "dst.jpg"
+	
+	(tmp_path / "dst.jpg").write_bytes(b"truncated")
+	assert previously_verified_path(entry, str(src), str(tmp_path)) is None
+
+
 #######################################
 # Main App
 
@@ -203,19 +999,59 @@ def main():
 	is_dry_run = config.dry_run
 	is_verbose = config.verbose
 	
+	transfer_mode = config.mode
+	jobs = max(1, config.jobs)
+	
+	is_verify = config.verify
+	if is_verify and transfer_mode != "copy":
+		print(f"ERROR: --verify only works with 'copy' mode (not '{transfer_mode}')", file=sys.stderr)
+		sys.exit(4)
+	
 	conflict_postfix = config.postfix
 	# TODO: Verify that there's nothing offensive here
 	
 	# Parse datespec
 	datespec = config.datespec
 	
-	can_use_file_fn = get_datespec_handler(datespec)
-	assert (can_use_file_fn is not None)
+	try:
+		date_ranges = parse_datespec(datespec)
+	except ValueError as e:
+		print(f"ERROR: {e}", file=sys.stderr)
+		sys.exit(3)
+	print(f"Using datespec ranges: {date_ranges}")
+	
+	# Files without a date can't be placed within a range, so only include them when there's no end date
+	include_undated = (date_ranges[-1][1] == DATESPEC_MAX)
 	
-	# Process each file
+	# Get the files to process
 	# NOTE: Assumes that these are all files - there are no nested folders here
-	source_files = sorted(os.listdir(input_dir))
-	N = len(source_files)
+	with os.scandir(input_dir) as it:
+		source_files = sorted(entry.name for entry in it
+		                      if entry.is_file() and entry.name != DATE_CACHE_FILENAME)
+	
+	date_cache = load_date_cache(input_dir)
+	
+	# Key all the files by date, so that only those in the ranges we want need to be visited
+	# NOTE: For files named by date, this doesn't need to touch the files at all
+	dated_files = []         # (date_string, fileN) for all files with a known date
+	undated_files = []       # (fileN, error) for files with no date
+	
+	for fileN in source_files:
+		match = RE_DATEINFO_FROM_FILENAME.match(fileN)
+		if match:
+			dated_files.append((match.group(0), fileN))
+		else:
+			try:
+				date_string, _date_info = extract_dateinfo_for_file(input_dir, fileN, date_cache)
+				dated_files.append((date_string, fileN))
+			except ValueError as e:
+				undated_files.append((fileN, e))
+	
+	# NOTE: Files named by date are mostly in order already, so this is cheap
+	dated_files.sort()
+	
+	selected_files = select_files_by_datespec(dated_files, date_ranges)
+	N = len(selected_files)
 	
 	date_to_folder_map = {}  # Map from date-strings (yyyyMMdd) to folder names for those images
 	unsorted_files = []      # Files that were not handled the standard way
@@ -225,50 +1061,204 @@ def main():
 	
 	last_processed = ""      # Filename of the last processed file
 	
-	print(f"\nProcessing {N} files:")
-	for i, fileN in enumerate(source_files):
-		# Check if processing or skipping this file
-		if can_use_file_fn(fileN):
-			print(f"  [{i}/{N}] Processing ==> '{fileN}'...")
+	duplicate_count = 0      # Number of files that were already in the collection
+	
+	total_bytes = 0          # Size of all the files being transferred
+	transfers = []           # (fileN, out_fileN, future) for each of the transfers in progress
+	
+	# NOTE: Dry runs only use an existing index (read-only), so that nothing gets written to the collection
+	collection_index = None
+	if config.dedupe:
+		if not is_dry_run:
+			collection_index = CollectionIndex(out_dir)
+		elif os.path.exists(os.path.join(out_dir, COLLECTION_INDEX_FILENAME)):
+			collection_index = CollectionIndex(out_dir, read_only=True)
 		else:
-			if is_verbose: print(f"  [{i}/{N}] Skip ==> '{fileN}'...")
-			skipped_count += 1
-			continue
+			print("NOTE: No collection index yet (it gets built on the first real run), so duplicates won't be detected")
+	
+	if collection_index and config.rescan:
+		if collection_index.read_only:
+			print("NOTE: Not rescanning the collection on a dry run")
+		else:
+			print("Rescanning collection...")
+			collection_index.rescan()
+	
+	verified_files = {}      # Manifest entries for files copied + verified on previous runs
+	verify_manifest = None   # (file, csv.writer) for the manifest for this run
+	if is_verify:
+		verified_files = load_verify_manifests(out_dir)
+		if not is_dry_run:
+			verify_manifest = create_verify_manifest(out_dir)
+	
+	# Copy a file, using the method chosen
+	# > returns: (bool, str | None) Whether the requested method was used, and the hash of the file (if verifying)
+	def do_transfer(src_fileN, dst_fileN):
+		if is_verify:
+			return (True, verified_copy_file(src_fileN, dst_fileN))
+		else:
+			return (transfer_file(src_fileN, dst_fileN, transfer_mode), None)
+	
+	# Note that a file has been copied + verified in this run's manifest
+	def record_verified(src_fileN, out_fileN, digest):
+		st = os.stat(src_fileN)
+		verify_manifest[1].writerow((os.path.basename(src_fileN), st.st_size, st.st_mtime_ns, digest,
+		                             os.path.relpath(out_fileN, out_dir)))
+		verify_manifest[0].flush()
+	
+	# NOTE: Only the transfers themselves happen on the worker threads. Working out
+	#       (and creating) the folders happens here, so there are no races over that.
+	executor = concurrent.futures.ThreadPoolExecutor(jobs)
+	start_time = time.perf_counter()
+	
+	skipped_count = len(dated_files) - N
+	if include_undated:
+		for fileN, date_error in undated_files:
+			print(f"  Unsorted ==> '{fileN}'")
+			print(f"    ERROR: {date_error}", file=sys.stderr)
+			unsorted_files.append(fileN)
+	else:
+		skipped_count += len(undated_files)
+	
+	if is_verbose:
+		# NOTE: This is the only case where the files outside the datespec get visited
+		selected_names = set(fileN for (_date_string, fileN) in selected_files)
+		unsorted_names = set(unsorted_files)
+		for fileN in source_files:
+			if fileN not in selected_names and (include_undated is False or fileN not in unsorted_names):
+				print(f"  Skip ==> '{fileN}'...")
+	
+	print(f"\nProcessing {N} files (skipping {skipped_count} files outside the datespec):")
+	for i, (_date_string, fileN) in enumerate(selected_files):
+		print(f"  [{i}/{N}] Processing ==> '{fileN}'...")
 		
-		# Get date info from filename
+		# Get date info from filename (or failing that, the file's headers)
 		try:
-			date_string, date_info = extract_dateinfo_from_filename(fileN)
+			date_string, date_info = extract_dateinfo_for_file(input_dir, fileN, date_cache)
 		except ValueError as e:
+			# e.g. Invalid dates
 			print(f"    ERROR: {e}", file=sys.stderr)
 			unsorted_files.append(fileN)
 			continue;
 		
+		# Skip files that are already in the collection
+		full_source_fileN = os.path.join(input_dir, fileN)
+		src_info = {'size': os.path.getsize(full_source_fileN)}
+		
+		if is_verify:
+			verified_fileN = previously_verified_path(verified_files.get(fileN), full_source_fileN, out_dir)
+			if verified_fileN:
+				print(f"    Already copied + verified as '{verified_fileN}'. Skipping...")
+				duplicate_count += 1
+				continue
+		
+		if collection_index:
+			existing_fileN = collection_index.find_duplicate(full_source_fileN, src_info)
+			if existing_fileN:
+				print(f"    Already in collection as '{existing_fileN}'. Skipping...")
+				duplicate_count += 1
+				continue
+		
 		# Figure out folder that this file will get added to
 		folder_name = folder_path_for_file(date_to_folder_map, date_string, date_info, out_dir, conflict_postfix, is_dry_run)
 		out_fileN = os.path.join(folder_name, fileN)
 		print(f"    Copying to '{out_fileN}...")
 		
 		# Perform copying...
+		total_bytes += src_info['size']
+		
 		if not is_dry_run:
-			full_source_fileN = os.path.join(input_dir, fileN)
-			shutil.copyfile(full_source_fileN, out_fileN)
+			future = executor.submit(do_transfer, full_source_fileN, out_fileN)
+			transfers.append((fileN, out_fileN, future))
+			
+			# Add to the index straight away, so that duplicates within this batch get caught too
+			if collection_index:
+				collection_index.add(out_fileN, full_source_fileN, src_info)
 		
 		# Note that this was the most recent file processed...
 		last_processed = fileN
 		processed_count += 1
 	
+	# Wait for all the transfers to finish
+	error_count = 0
+	fallback_count = 0
+	for fileN, out_fileN, future in transfers:
+		try:
+			used_mode, digest = future.result()
+			if not used_mode:
+				fallback_count += 1
+			if verify_manifest:
+				record_verified(os.path.join(input_dir, fileN), out_fileN, digest)
+			if collection_index:
+				collection_index.update_mtime(out_fileN, digest)
+		except OSError as e:
+			print(f"    ERROR: Could not {transfer_mode} '{fileN}' - {e}", file=sys.stderr)
+			error_count += 1
+			if collection_index:
+				collection_index.remove(out_fileN)
+	executor.shutdown()
+	
+	if collection_index:
+		collection_index.close()
+	
+	# Note: Dry runs shouldn't write anything (even into the input folder)
+	if not is_dry_run:
+		save_date_cache(input_dir, date_cache)
+	
+	elapsed = time.perf_counter() - start_time
+	
+	if is_dry_run:
+		# Unsorted files get copied too (below), so they need to be in the estimate
+		for fileN in unsorted_files:
+			full_source_fileN = os.path.join(input_dir, fileN)
+			if is_verify and previously_verified_path(verified_files.get(fileN), full_source_fileN, out_dir):
+				continue
+			total_bytes += os.path.getsize(full_source_fileN)
+		
+		if transfer_mode == "copy":
+			estimate = f"~{total_bytes / ASSUMED_COPY_SPEED:.1f} s at {format_size(ASSUMED_COPY_SPEED)}/s"
+		else:
+			estimate = "near-instant if on the same drive"
+		print(f"\nDry Run: Would {transfer_mode} {format_size(total_bytes)} ({estimate})")
+	else:
+		print(f"\nTransferred {format_size(total_bytes)} in {elapsed:.2f} s ({format_size(total_bytes / max(elapsed, 1e-6))}/s) using '{transfer_mode}' mode")
+		if fallback_count:
+			print(f"NOTE: Reflinks not supported for {fallback_count} files, so they were copied instead")
+		if is_verify:
+			print(f"Verified {processed_count - error_count} copies")
+		if error_count:
+			print(f"WARNING: {error_count} files could not be transferred", file=sys.stderr)
+	
 	# Handle the unsorted files
 	U = len(unsorted_files)
 	
-	print("\n\n%d files copied + sorted (to %d folders). Skipped %d files. Adding %d files to 'unsorted' directory" 
-	      % (processed_count, len(date_to_folder_map), skipped_count, U))
+	print("\n\n%d files copied + sorted (to %d folders). Skipped %d files (+ %d already in collection). Adding %d files to 'unsorted' directory" 
+	      % (processed_count, len(date_to_folder_map), skipped_count, duplicate_count, U))
 	if U:
 		# Create directory for unsorted files
-		unsorted_dir = config['unsorted']
+		unsorted_dir = config.unsorted
+		if not is_dry_run:
+			os.makedirs(unsorted_dir, exist_ok=True)
 		
 		# Perform the copying
 		for fileN in unsorted_files:
-			pass
+			if is_verify:
+				verified_fileN = previously_verified_path(verified_files.get(fileN), os.path.join(input_dir, fileN), out_dir)
+				if verified_fileN:
+					print(f"    Already copied + verified '{fileN}' as '{verified_fileN}'. Skipping...")
+					continue
+			
+			out_fileN = os.path.join(unsorted_dir, fileN)
+			print(f"    Copying '{fileN}' to '{out_fileN}'...")
+			if not is_dry_run:
+				try:
+					_used_mode, digest = do_transfer(os.path.join(input_dir, fileN), out_fileN)
+					if verify_manifest:
+						record_verified(os.path.join(input_dir, fileN), out_fileN, digest)
+				except OSError as e:
+					print(f"    ERROR: Could not {transfer_mode} '{fileN}' - {e}", file=sys.stderr)
+	
+	if verify_manifest:
+		verify_manifest[0].close()
 	
 	# Log the last processed file (assuming they're all in order)
 	# XXX: This only works best when just processing the whole dump
@@ -1 +1 @@
-grep -irn --include="*.h" %* *
\ No newline at end of file
+@python3 "%~dp0code_search.py" -G --include="*.h" %*
\ No newline at end of file
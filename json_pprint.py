@@ -3,28 +3,729 @@
 # Reformat all JSON files given on the command-line
 # to be human-readable.
 #
-# NOTE: This may mangle any values, as we have to
-# first parse to Python, then write them out again.
+# By default, this works directly on the stream of tokens in the file
+# (instead of parsing everything into Python objects first), so values
+# are passed through exactly as they are, and memory use only depends
+# on how deeply nested the data is (not how big the file is).
+#
+# The old behaviour (parse to Python, then write back out again) is
+# still available with "--parse", though this may mangle some values
+# (e.g. floats / unicode escapes), and needs the whole file in memory.
+#
+# JSON Lines files (.jsonl) are checked record-by-record instead, and can
+# also be converted to/from JSON arrays.
 
 import sys
+import os
+import argparse
+import io
 import json
+import multiprocessing
+import re
+import shutil
+import tempfile
+import time
 import traceback
 
-if len(sys.argv) <= 1:
-	print("USAGE:")
-	print("$ json_pprint.py <file_1.json> ... <file_N.json>")
-	sys.exit(0)
+###########################################
+# Streaming Reformatter
+
+# Size of the chunks files get read in
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Indentation used for each level of nesting
+INDENT = b'\t'
+
+# Tokens in a JSON file (with any leading whitespace skipped)
+# NOTE: This matches anything that could be a scalar (numbers / true / false / null), which
+#       then gets checked by check_json_values() when it's used as a value.
+#       Strings which don't end before the end of the buffer are matched too (so that they can be
+#       carried over to the next chunk), but those will always be the last token.
+RE_JSON_TOKENS = re.compile(rb'[ \t\r\n]*('
+                            rb'[{}\[\]:,]|'
+                            rb'"[^"\\]*(?:\\.[^"\\]*)*"|'
+                            rb'[^ \t\r\n{}\[\]:,"]+|'
+                            rb'"[^"\\]*(?:\\.[^"\\]*)*\\?\Z'
+                            rb')', re.DOTALL)
+
+# A complete string
+RE_JSON_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+# Things that json.load() doesn't allow in strings (i.e. control chars), and the escapes it does allow
+RE_JSON_CONTROL_CHARS = re.compile(rb'[\x00-\x1f]')
+RE_JSON_VALID_ESCAPES = re.compile(rb'\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})')
+
+# A valid number / true / false / null (+ the non-standard values json.load() accepts too)
+RE_JSON_SCALAR = rb'(?:-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?|true|false|null|NaN|-?Infinity)'
+
+# A run of scalars separated by spaces (so that all the ones from a chunk can be checked at once)
+RE_JSON_SCALARS = re.compile(rb'%s(?: %s)*' % (RE_JSON_SCALAR, RE_JSON_SCALAR))
+
+# Matching brackets for each kind of container
+JSON_CLOSING_BRACKET = {ord('{'): ord('}'), ord('['): ord(']')}
+
+
+# Check whether a token may continue on in the next chunk
+def is_incomplete_token(token):
+	if token[0] == 0x22:  # '"'
+		return RE_JSON_STRING.fullmatch(token) is None
+	else:
+		return token[0] not in b'{}[]:,'
+
+
+# Read the tokens from a stream of JSON, a chunk at a time
+# > yields: (list[bytes]) The complete tokens from each chunk (without any whitespace)
+# > throws "ValueError" if there's an unterminated string
+def iter_json_tokens(f_in, chunk_size=READ_CHUNK_SIZE):
+	buf = b''
+	at_eof = False
+	
+	while not at_eof:
+		# NOTE: Huge tokens (i.e. long strings) get read in increasingly large chunks,
+		#       so that they don't end up getting re-scanned over and over again
+		chunk = f_in.read(max(chunk_size, len(buf)))
+		at_eof = not chunk
+		buf += chunk
+		
+		tokens = RE_JSON_TOKENS.findall(buf)
+		# NOTE: Scalars followed by whitespace are already complete, so only tokens right at the end can be cut off
+		if tokens and buf.endswith(tokens[-1]) and is_incomplete_token(tokens[-1]):
+			if at_eof:
+				if tokens[-1][0] == 0x22:
+					raise ValueError("Unterminated string: %r" % (tokens[-1][:40]))
+				buf = b''
+			else:
+				# Keep the last token around for next time, in case it gets cut off partway
+				buf = tokens.pop()
+		else:
+			buf = b''
+		
+		yield tokens
+
+
+# Check whether a string token (or several joined together) only has things json.load() allows
+def is_valid_json_string(data):
+	if RE_JSON_CONTROL_CHARS.search(data):
+		return False
+	# NOTE: Any backslashes left after removing the valid escapes are invalid escapes
+	return (b'\\' not in data) or (b'\\' not in RE_JSON_VALID_ESCAPES.sub(b'', data))
+
+
+# Check that the strings + scalars (numbers / true / false / null) from a chunk are valid
+# NOTE: Checking them all at once like this is much faster than checking each one separately
+# > throws "ValueError" for the first invalid one
+def check_json_values(strings, scalars):
+	if strings and not is_valid_json_string(b''.join(strings)):
+		for token in strings:
+			if not is_valid_json_string(token):
+				raise ValueError("Invalid string: %r" % (token[:40]))
+	
+	if scalars and not RE_JSON_SCALARS.fullmatch(b' '.join(set(scalars))):
+		for token in scalars:
+			if not RE_JSON_SCALARS.fullmatch(token):
+				raise ValueError("Invalid value: %r" % (token[:40]))
+
+
+# What can come next in the JSON (in the container we're currently in)
+EXPECT_VALUE = 0       # Start of the file, after '[', ':', or ',' in an array
+EXPECT_KEY = 1         # After '{', or ',' in an object
+EXPECT_COLON = 2       # After a key
+EXPECT_SEPARATOR = 3   # After a value in a container (i.e. ',' or the closing bracket)
+EXPECT_END = 4         # After the top-level value (i.e. only whitespace)
+
+JSON_EXPECTED_NAMES = {
+	EXPECT_VALUE: "a value",
+	EXPECT_KEY: "a key",
+	EXPECT_COLON: "':'",
+	EXPECT_SEPARATOR: "',' or a closing bracket",
+	EXPECT_END: "the end of the file",
+}
+
+
+# Re-indent a stream of JSON, writing out the results as it goes
+# < f_in: (binary file) File to read the JSON from
+# < f_out: (binary file) File to write the reformatted JSON to
+# > throws "ValueError" if the JSON isn't well-formed
+#
+# NOTE: The output is the same as json.dump(indent='\t') gives, except that
+#       strings and numbers are written out exactly as they were in the original.
+# NOTE: Anything written out before an error is found is incomplete, so f_out should be a temp file
+def reformat_json_stream(f_in, f_out, chunk_size=READ_CHUNK_SIZE):
+	stack = bytearray()      # Opening bracket for each container we're currently in
+	pending_open = False     # Whether we've just opened a container (so it may be empty)
+	expect = EXPECT_VALUE    # What can come next
+	
+	def unexpected(token):
+		return ValueError("Expected %s, but found %r (at depth %d)" % (JSON_EXPECTED_NAMES[expect], token[:40], len(stack)))
+	
+	# Separators to use at each depth
+	newlines = [b'\n']
+	commas = [b',\n']
+	
+	for tokens in iter_json_tokens(f_in, chunk_size):
+		out = []
+		strings = []   # Strings + scalars in this chunk (which get checked before it's written out)
+		scalars = []
+		emit = out.append
+		
+		for token in tokens:
+			c = token[0]
+			
+			if pending_open:
+				pending_open = False
+				if c == JSON_CLOSING_BRACKET[stack[-1]]:
+					# Empty container
+					stack.pop()
+					expect = EXPECT_SEPARATOR if stack else EXPECT_END
+					emit(token)
+					continue
+				else:
+					emit(newlines[len(stack)])
+			
+			if c == 0x22:                 # '"'
+				strings.append(token)
+				if expect == EXPECT_KEY:
+					expect = EXPECT_COLON
+				elif expect == EXPECT_VALUE:
+					expect = EXPECT_SEPARATOR if stack else EXPECT_END
+				else:
+					raise unexpected(token)
+				emit(token)
+			elif c == 0x2C:               # ','
+				if expect != EXPECT_SEPARATOR:
+					raise unexpected(token)
+				expect = EXPECT_KEY if stack[-1] == 0x7B else EXPECT_VALUE
+				emit(commas[len(stack)])
+			elif c == 0x3A:               # ':'
+				if expect != EXPECT_COLON:
+					raise unexpected(token)
+				expect = EXPECT_VALUE
+				emit(b': ')
+			elif c == 0x7B or c == 0x5B:  # '{' or '['
+				if expect != EXPECT_VALUE:
+					raise unexpected(token)
+				expect = EXPECT_KEY if c == 0x7B else EXPECT_VALUE
+				stack.append(c)
+				pending_open = True
+				emit(token)
+				
+				if len(stack) == len(newlines):
+					newlines.append(b'\n' + INDENT * len(stack))
+					commas.append(b',\n' + INDENT * len(stack))
+			elif c == 0x7D or c == 0x5D:  # '}' or ']'
+				if expect != EXPECT_SEPARATOR or JSON_CLOSING_BRACKET[stack[-1]] != c:
+					raise unexpected(token)
+				stack.pop()
+				expect = EXPECT_SEPARATOR if stack else EXPECT_END
+				emit(newlines[len(stack)])
+				emit(token)
+			else:
+				# Number / true / false / null
+				if expect != EXPECT_VALUE:
+					raise unexpected(token)
+				expect = EXPECT_SEPARATOR if stack else EXPECT_END
+				scalars.append(token)
+				emit(token)
+		
+		check_json_values(strings, scalars)
+		f_out.write(b''.join(out))
+	
+	if expect != EXPECT_END:
+		raise ValueError("Unexpected end of JSON (expected %s, with %d containers still open)"
+		                 % (JSON_EXPECTED_NAMES[expect], len(stack)))
+
+
+# Reformat the given file by streaming through its tokens
+def reformat_file_streaming(fileN, out_fileN):
+	with open(fileN, 'rb') as f_in, open(out_fileN, 'wb') as f_out:
+		reformat_json_stream(f_in, f_out)
+
+
+# Re-indent a single JSON value held in memory
+def reformat_json_bytes(data):
+	out = io.BytesIO()
+	reformat_json_stream(io.BytesIO(data), out)
+	return out.getvalue()
+
+
+# Remove all the whitespace between the tokens of a single (already checked) JSON value held in memory
+# NOTE: Values are written out exactly as they were, unlike json.dumps(json.loads(data))
+def minify_json_bytes(data):
+	return b''.join(RE_JSON_TOKENS.findall(data))
+
+
+###########################################
+# Parsing Reformatter
+
+# Reformat the given file by loading it all into Python objects, and writing them back out
+def reformat_file_parsed(fileN, out_fileN):
+	with open(fileN) as f:
+		data = json.load(f)
+	with open(out_fileN, 'w') as f:
+		json.dump(data, f, indent='\t')
+
+
+# Methods that can be used to reformat files
+REFORMATTERS = {
+	'stream': reformat_file_streaming,
+	'parse': reformat_file_parsed,
+}
+
+###########################################
+# JSON Lines
+#
+# JSONL files have one JSON value per line. Large files get split into
+# chunks (on line boundaries), which can be checked + reformatted in
+# parallel, before getting written out again in the original order.
+
+# File extensions for JSON Lines files
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson')
+
+# Approximate size of the chunks that JSONL files get split into
+JSONL_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Ways that each record in a JSONL file can be written out
+# - pretty: Each record re-indented (i.e. no longer valid JSONL, so it's written to a .pretty.json file instead)
+# - compact: Each record written out on a single line, without any whitespace (values are left unchanged)
+# - array: All the records combined into a single JSON array (written to a .json file)
+JSONL_FORMATS = ('pretty', 'compact', 'array')
+
 
-else:
-	for fileN in sys.argv[1:]:
+# Check whether a file is a JSON Lines file (going by its name)
+def is_jsonl_file(fileN):
+	return fileN.lower().endswith(JSONL_EXTENSIONS)
+
+
+# Split a file into chunks that start + end on line boundaries
+# > returns: (list[(int, int)]) Start + end offsets of each chunk
+def find_line_chunks(fileN, chunk_size=JSONL_CHUNK_SIZE):
+	size = os.path.getsize(fileN)
+	chunks = []
+	
+	with open(fileN, 'rb') as f:
+		start = 0
+		while start < size:
+			f.seek(min(start + chunk_size, size))
+			f.readline()  # Skip to the end of the line we landed in
+			end = min(f.tell(), size)
+			
+			chunks.append((start, end))
+			start = end
+	
+	return chunks
+
+
+# Check + reformat the records in part of a JSONL file
+# < task: (str, int, int, str) Filename, start + end offsets, and JSONL_FORMATS entry to use
+# > returns: (bytes, int, list[(int, str)]) The reformatted records, number of lines in the chunk,
+#            and the (chunk-relative) line number + error for any invalid records
+def process_jsonl_chunk(task):
+	fileN, start, end, fmt = task
+	
+	with open(fileN, 'rb') as f:
+		f.seek(start)
+		lines = f.read(end - start).split(b'\n')
+	
+	if lines and not lines[-1]:
+		# Nothing after the last newline
+		lines.pop()
+	
+	out = []
+	errors = []
+	
+	for i, line in enumerate(lines):
+		line = line.strip()
+		if not line:
+			continue
+		
+		try:
+			json.loads(line)
+		except ValueError as e:
+			errors.append((i, str(e)))
+			continue
+		
+		if fmt == 'compact':
+			out.append(minify_json_bytes(line))
+		elif fmt == 'pretty':
+			out.append(reformat_json_bytes(line))
+		else:
+			out.append(INDENT + line)
+	
+	if fmt == 'array':
+		data = b',\n'.join(out)
+	else:
+		data = b''.join(record + b'\n' for record in out)
+	
+	return (data, len(lines), errors)
+
+
+# Check + reformat a JSONL file, using a pool of worker processes (if one is given)
+# < pool: (multiprocessing.Pool | None) Pool to process the chunks with
+# > throws "ValueError" if any of the records aren't valid JSON
+def reformat_jsonl_file(fileN, out_fileN, fmt, pool=None):
+	tasks = [(fileN, start, end, fmt) for (start, end) in find_line_chunks(fileN)]
+	
+	if pool and len(tasks) > 1:
+		# NOTE: imap() gives the results back in order, so they can be written out as they arrive
+		results = pool.imap(process_jsonl_chunk, tasks)
+	else:
+		results = map(process_jsonl_chunk, tasks)
+	
+	line_count = 0
+	record_errors = []
+	wrote_record = False
+	
+	with open(out_fileN, 'wb') as f_out:
+		if fmt == 'array':
+			f_out.write(b'[\n')
+		
+		for data, n_lines, errors in results:
+			record_errors += [(line_count + i + 1, err) for (i, err) in errors]
+			line_count += n_lines
+			
+			if data:
+				if fmt == 'array' and wrote_record:
+					f_out.write(b',\n')
+				f_out.write(data)
+				wrote_record = True
+		
+		if fmt == 'array':
+			f_out.write(b'\n]\n' if wrote_record else b']\n')
+	
+	if record_errors:
+		details = "".join("\n    Line %d: %s" % (line_no, err) for (line_no, err) in record_errors[:10])
+		raise ValueError("%d invalid records (out of %d lines):%s" % (len(record_errors), line_count, details))
+
+
+# Convert a stream containing a JSON array into JSON Lines (one line per array element)
+# > throws "ValueError" if the input isn't a JSON array
+#
+# NOTE: Values are written out as they were in the original, just without any whitespace
+def json_array_to_jsonl_stream(f_in, f_out, chunk_size=READ_CHUNK_SIZE):
+	depth = 0
+	started = False
+	has_records = False
+	
+	for tokens in iter_json_tokens(f_in, chunk_size):
+		out = []
+		for token in tokens:
+			c = token[0]
+			
+			if depth == 0:
+				if started or c != 0x5B:
+					raise ValueError("Expected a single JSON array (found %r)" % (token[:40]))
+				started = True
+				depth = 1
+				continue
+			
+			if c == 0x7B or c == 0x5B:    # '{' or '['
+				depth += 1
+			elif c == 0x7D or c == 0x5D:  # '}' or ']'
+				depth -= 1
+				if depth == 0:
+					# End of the array
+					if has_records:
+						out.append(b'\n')
+					continue
+			elif c == 0x2C and depth == 1:
+				# Between records
+				token = b'\n'
+			
+			out.append(token)
+			has_records = True
+		
+		f_out.write(b''.join(out))
+	
+	if depth != 0 or not started:
+		raise ValueError("Unexpected end of JSON")
+
+
+# Convert a file containing a JSON array into a JSONL file
+# NOTE: json_array_to_jsonl_stream() only looks at the brackets/commas, so the
+#       whole file gets checked first (otherwise "[1 2]" would become "12")
+def json_array_to_jsonl_file(fileN, out_fileN):
+	with open(fileN, 'rb') as f_in, open(out_fileN, 'wb') as f_out:
+		reformat_json_stream(f_in, DiscardingWriter())
+		f_in.seek(0)
+		json_array_to_jsonl_stream(f_in, f_out)
+
+###########################################
+# Safe Writing
+#
+# Files are never written to directly. Instead, the new version is written to a
+# temp file in the same folder, which only replaces the original once it's complete.
+# Files which are already formatted correctly are left untouched.
+
+# Raised when the reformatted output doesn't match what's in the file already
+class NeedsReformatting(Exception):
+	pass
+
+
+# Stand-in for an output file, which checks that everything written to it matches the given file
+class ComparingWriter:
+	def __init__(self, f_orig):
+		self.f_orig = f_orig
+	
+	def write(self, data):
+		if self.f_orig.read(len(data)) != data:
+			raise NeedsReformatting()
+
+
+# Stand-in for an output file, which throws away everything written to it
+class DiscardingWriter:
+	def write(self, data):
+		pass
+
+
+# Quickly check whether a JSON file is already formatted the way the streaming reformatter would do it
+# NOTE: This stops as soon as there's a difference, so it's only slow for files that are already formatted
+def is_formatted_json(fileN):
+	with open(fileN, 'rb') as f_in, open(fileN, 'rb') as f_orig:
 		try:
-			print("Reformatting JSON File => '%s'..." % fileN)
-			with open(fileN) as f:
-				data = json.load(f)
-			with open(fileN, 'w') as f:
-				json.dump(data, f, indent='\t')
-		except Exception as err:
-			print("! Error processing %s" % (fileN), file=sys.stderr)
-			print(repr(err), file=sys.stderr)
-			traceback.print_tb(err.__traceback__, file=sys.stderr)
+			reformat_json_stream(f_in, ComparingWriter(f_orig))
+		except (NeedsReformatting, ValueError):
+			# NOTE: Invalid files get reported when they're reformatted properly
+			return False
+		
+		return f_orig.read(1) == b''
+
+
+# Check whether two files have the same contents
+def files_identical(fileA, fileB):
+	if os.path.getsize(fileA) != os.path.getsize(fileB):
+		return False
+	
+	with open(fileA, 'rb') as fa, open(fileB, 'rb') as fb:
+		while True:
+			a = fa.read(READ_CHUNK_SIZE)
+			if a != fb.read(READ_CHUNK_SIZE):
+				return False
+			if not a:
+				return True
+
+
+# Write a new version of a file via a temp file, only replacing the old version once that's done
+# < convert: (fn(fileN, out_fileN)) Function which writes the new version of the file
+# > returns: (bool) Whether the file was changed
+def replace_file_safely(fileN, out_fileN, convert):
+	out_dir = os.path.dirname(os.path.abspath(out_fileN))
+	fd, tmp_fileN = tempfile.mkstemp(dir=out_dir, prefix="." + os.path.basename(out_fileN) + ".", suffix=".tmp")
+	os.close(fd)
+	
+	try:
+		convert(fileN, tmp_fileN)
+		
+		if os.path.exists(out_fileN):
+			if files_identical(out_fileN, tmp_fileN):
+				os.remove(tmp_fileN)
+				return False
+			
+			# NOTE: mkstemp() only makes files readable by the current user
+			shutil.copymode(out_fileN, tmp_fileN)
+		
+		os.replace(tmp_fileN, out_fileN)
+		return True
+	except BaseException:
+		os.remove(tmp_fileN)
+		raise
+
+
+###########################################
+# Batch Processing
+
+# Reformat/convert one of the files given on the command-line
+# < pool: (multiprocessing.Pool | None) Pool to process chunks of JSONL files with
+# > returns: (str, int, list[str], str | None) Status ('reformatted', 'clean', or 'failed'),
+#            size of the file, messages to show, and details of any error
+def process_file(fileN, config, pool=None):
+	messages = []
+	
+	try:
+		size = os.path.getsize(fileN)
+		
+		if config.to_jsonl:
+			messages.append("Converting JSON File to JSON Lines => '%s'..." % fileN)
+			out_fileN = os.path.splitext(fileN)[0] + '.jsonl'
+			convert = json_array_to_jsonl_file
+		elif config.jsonl or is_jsonl_file(fileN):
+			messages.append("Reformatting JSON Lines File => '%s'..." % fileN)
+			if config.jsonl_format == 'array':
+				out_fileN = os.path.splitext(fileN)[0] + '.json'
+			elif config.jsonl_format == 'pretty':
+				# NOTE: The original is left alone, as the re-indented records aren't valid JSONL anymore
+				out_fileN = os.path.splitext(fileN)[0] + '.pretty.json'
+			else:
+				out_fileN = fileN
+			convert = lambda fileN, out_fileN: reformat_jsonl_file(fileN, out_fileN, config.jsonl_format, pool)
+		else:
+			messages.append("Reformatting JSON File => '%s'..." % fileN)
+			out_fileN = fileN
+			convert = REFORMATTERS[config.method]
+			
+			if config.method == 'stream' and is_formatted_json(fileN):
+				messages.append("    Already formatted. Skipping...")
+				return ('clean', size, messages, None)
+		
+		if replace_file_safely(fileN, out_fileN, convert):
+			if out_fileN != fileN:
+				messages.append("    Saved to '%s'" % (out_fileN))
+			return ('reformatted', size, messages, None)
+		else:
+			messages.append("    Already formatted. Skipping...")
+			return ('clean', size, messages, None)
+	except Exception as err:
+		error = "! Error processing %s\n%r\n%s" % (fileN, err, "".join(traceback.format_tb(err.__traceback__)))
+		return ('failed', 0, messages, error)
+
+
+# Wrapper for process_file() for use with multiprocessing.Pool
+def process_file__task(args):
+	return process_file(*args)
+
+
+###########################################
+# Benchmarking
+
+# Run a reformatter in its own process
+# > returns: (float) Time taken
+def run_timed(method, fileN, out_fileN):
+	t0 = time.perf_counter()
+	REFORMATTERS[method](fileN, out_fileN)
+	return time.perf_counter() - t0
+
+
+# Compare how the reformatting methods perform on the given file
+# NOTE: Each method gets run in a fresh process, so that the peak memory usage can be compared too
+def benchmark_file(fileN):
+	import concurrent.futures
+	try:
+		import resource
+	except ImportError:
+		# Windows
+		resource = None
+	
+	size = os.path.getsize(fileN)
+	print("%s (%.1f MB):" % (fileN, size / 1e6))
+	
+	outputs = {}
+	for method in ('stream', 'parse'):
+		out_fileN = "%s.%s.benchmark" % (fileN, method)
+		with concurrent.futures.ProcessPoolExecutor(1) as executor:
+			elapsed = executor.submit(run_timed, method, fileN, out_fileN).result()
+		
+		# NOTE: This is the peak of all the child processes so far, so the methods
+		#       using less memory need to go first for these numbers to be meaningful
+		peak_mem = ""
+		if resource:
+			peak_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+			peak_mem = "  (peak memory ~%.0f MB)" % (peak_kb / 1024)
+		
+		print("   %-6s  %8.2f s  %8.1f MB/s%s" % (method, elapsed, size / 1e6 / elapsed, peak_mem))
+		outputs[method] = out_fileN
+	
+	with open(outputs['stream'], 'rb') as f1, open(outputs['parse'], 'rb') as f2:
+		same = True
+		while same:
+			a = f1.read(READ_CHUNK_SIZE)
+			b = f2.read(READ_CHUNK_SIZE)
+			same = (a == b)
+			if not a:
+				break
+	print("   Output identical: %s\n" % ("yes" if same else "no (e.g. differences in number/string formatting)"))
+	
+	for out_fileN in outputs.values():
+		os.remove(out_fileN)
+
+
+###########################################
+
+# Handle command-line arguments
+def get_config():
+	parser = argparse.ArgumentParser(
+		description = "Reformat JSON files to be human-readable")
+	
+	parser.add_argument("files", nargs='+', metavar="file.json",
+	                    help="JSON files to reformat (in place). "
+	                         "Files ending in %s are treated as JSON Lines files" % (" / ".join(JSONL_EXTENSIONS)))
+	
+	parser.add_argument("--jsonl", action="store_true",
+	                    help="Treat all the files as JSON Lines files (i.e. one JSON value per line)")
+	
+	parser.add_argument("--jsonl-format", choices=JSONL_FORMATS, default='compact',
+	                    help="How to write out the records in JSON Lines files: 'pretty' = re-indent each record "
+	                         "(saved as a .pretty.json file alongside the original), "
+	                         "'compact' = one record per line, with any extra whitespace removed, "
+	                         "'array' = convert to a JSON array (saved as a .json file alongside the original)")
+	
+	parser.add_argument("--to-jsonl", action="store_true",
+	                    help="Convert files containing a JSON array to JSON Lines "
+	                         "(saved as a .jsonl file alongside the original)")
+	
+	parser.add_argument("-j", "--jobs", type=int, default=0,
+	                    help="Number of worker processes to use (0 = one per core). When there are several files, "
+	                         "these work on separate files, otherwise they work on chunks of JSON Lines files")
+	
+	parser.add_argument("--parse", dest="method", action="store_const", const='parse', default='stream',
+	                    help="Reformat by parsing the whole file into Python objects first (old behaviour)")
+	
+	parser.add_argument("--benchmark", action="store_true",
+	                    help="Compare the time/memory taken by the reformatting methods on the given files "
+	                         "(files are left unchanged)")
+	
+	return parser.parse_args()
+
+
+def main():
+	if len(sys.argv) <= 1:
+		print("USAGE:")
+		print("$ json_pprint.py <file_1.json> ... <file_N.json>")
+		sys.exit(0)
+	
+	config = get_config()
+	
+	if config.benchmark:
+		for fileN in config.files:
+			benchmark_file(fileN)
+		return
+	
+	jobs = config.jobs or os.cpu_count()
+	files = config.files
+	
+	# NOTE: Worker processes can't have pools of their own, so when several files are being
+	#       processed in parallel, any JSONL files get handled in a single process each
+	pool = None
+	if jobs > 1 and len(files) > 1:
+		pool = multiprocessing.Pool(min(jobs, len(files)))
+		results = pool.imap(process_file__task, [(fileN, config) for fileN in files])
+	else:
+		if jobs > 1 and (config.jsonl or any(map(is_jsonl_file, files))):
+			pool = multiprocessing.Pool(jobs)
+		results = (process_file(fileN, config, pool) for fileN in files)
+	
+	start_time = time.perf_counter()
+	counts = {'reformatted': 0, 'clean': 0, 'failed': 0}
+	total_bytes = 0
+	
+	for status, size, messages, error in results:
+		for message in messages:
+			print(message)
+		if error:
+			print(error, file=sys.stderr)
+		
+		counts[status] += 1
+		total_bytes += size
+	
+	if pool:
+		pool.close()
+		pool.join()
+	
+	elapsed = time.perf_counter() - start_time
+	print("\n%d files (%d reformatted, %d already formatted, %d failed) - %.1f MB in %.2f s (%.1f MB/s)"
+	      % (len(files), counts['reformatted'], counts['clean'], counts['failed'],
+	         total_bytes / 1e6, elapsed, total_bytes / 1e6 / max(elapsed, 1e-6)))
+	
+	if counts['failed']:
+		sys.exit(1)
 
+if __name__ == '__main__':
+	main()
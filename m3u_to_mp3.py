@@ -4,73 +4,580 @@
 m3u_to_mp3.py - Convert m3u playlist's contents to mp3's in the target folder
 
 Usage:
-$ m3u_to_mp3.py [IN_FILE.m3u] [OUT_DIR/]
+$ m3u_to_mp3.py [IN_FILE.m3u] [OUT_DIR/] [-j JOBS] [--cache-dir CACHE_DIR] [--sync [--prune]]
+
+Converted files are kept in a cache (shared between runs), so that tracks
+which appear on several playlists only ever need to be converted once.
+
+With --sync, only tracks which are new/changed since the last run get
+copied/converted (e.g. for keeping a device's copy of a playlist up to date).
 """
 
 import sys
 import os
+import argparse
+import concurrent.futures
+import errno
+import hashlib
+import json
 import subprocess
 import shutil
+import threading
+import time
 
 from urllib.parse import unquote
 
-# Get input and output destinations
-try:
-	args = sys.argv[1:]
-	
-	IN_FILE = args[0]
-	OUT_DIR = args[1]
-except IndexError:
-	print(__doc__)
-	sys.exit(-1)
+#######################################
+# Playlist Handling
+
+# Read the list of files in a playlist
+# > returns: ([(str, [str])]) Filename of each entry in the playlist (in order),
+#            along with any comments before it (e.g. "#EXTINF" lines with the track's info)
+# FIXME: Has issues with 'ú' in filenames (FFMPEG + Others)
+def read_playlist(in_fileN):
+	entries = []
+	comments = []
+	with open(in_fileN) as f:
+		for line in f:
+			line = line.strip()
+			
+			if len(line) == 0 or line == "#EXTM3U":
+				# Blank Line / Header
+				continue
+			elif line[0] == "#":
+				# Comment / Track Info
+				comments.append(line)
+				continue
+			
+			# Note: If this was a "proper" m3u file, this may in fact be an encoded URL in places...
+			entries.append((unquote(line), comments))
+			comments = []
+	return entries
 
-# List of all the new filenames (to be saved into the new m3u file)
-newFilenames = []
+# Save out the new playlist
+# < entries: ([(str, [str])]) Filename of each entry, along with the comments to write before it
+def write_playlist(out_fileN, entries):
+	with open(out_fileN, 'w') as f:
+		# Mandatory header
+		f.write("#EXTM3U\n")
+		
+		# Write files
+		for fileN, comments in entries:
+			for comment in comments:
+				f.write("%s\n" % comment)
+			f.write("%s\n" % fileN)
 
-# Create output directory
-if not os.path.exists(OUT_DIR):
-	print("Creating '%s'..." % (OUT_DIR))
-	os.makedirs(OUT_DIR)
-	print("  OutDir Exists?   %s" % os.path.exists(OUT_DIR))
+#######################################
+# Conversion Jobs
 
-# Process each file
-# FIXME: Has issues with 'ú' in filenames (FFMPEG + Others)
-with open(IN_FILE) as f:
-	for line in f:
-		# Note: If this was a "proper" m3u file, this may in fact be an encoded URL in places...
-		line = unquote(line.strip())
+# Extra arguments given to ffmpeg when converting files
+FFMPEG_ARGS = ['-vn']
+
+# Number of copies to run at once
+# NOTE: Copies are just I/O, so they get their own lane instead of competing with the conversions
+COPY_LANE_WORKERS = 2
+
+
+# Get the name to give a playlist entry in the output folder (relative to the output folder)
+# NOTE: Entries which would end up outside the output folder (i.e. absolute paths, or ones going
+#       up out of the playlist's folder with "..") just go straight into the output folder instead
+# < entry: (str) The file's name, as given in the playlist
+def output_name_for(entry):
+	name = os.path.normpath(entry)
+	if os.path.isabs(name) or os.path.splitdrive(name)[0] or name.split(os.sep)[0] == os.pardir:
+		name = os.path.basename(name)
+	return name
+
+
+# A file that needs to be copied/converted to get it into the output folder
+class TrackJob:
+	# < entry: (str) The file's name, as given in the playlist
+	# < playlist_dir: (str) Folder that the playlist is in (i.e. that the entries are relative to)
+	def __init__(self, entry, playlist_dir, out_dir):
+		self.src_fileN = os.path.join(playlist_dir, entry)
 		
-		if len(line) == 0 or line[0] == "#":
-			# Blank / Comment Line
-			continue
+		name = output_name_for(entry)
 		
-		# XXX: This assumes that all the files are in the same directory as the playlist!
-		if line.endswith(".mp3"):
+		if entry.endswith(".mp3"):
 			# Just Copy... Already in target format
-			old_filename = new_filename = line
-			new_filepath = os.path.join(OUT_DIR, line)
-			
-			print("Copying '%s' => '%s'" % (old_filename, new_filepath))
-			shutil.copy2(old_filename, new_filepath)
+			self.kind = 'copy'
+			self.new_filename = name
 		else:
 			# Convert file formats
-			old_filename = line
-			new_filename = os.path.splitext(line)[0] + '.mp3'
-			new_filepath = os.path.join(OUT_DIR, new_filename)
+			self.kind = 'convert'
+			self.new_filename = os.path.splitext(name)[0] + '.mp3'
+		
+		self.out_fileN = os.path.join(out_dir, self.new_filename)
+		
+		self.error = None     # Reason this failed (if it did)
+		self.elapsed = 0.0    # Time taken to copy/convert the file
+		self.cache_hit = False  # Whether the converted file came from the cache
+	
+	def __repr__(self):
+		return "TrackJob(%s, %r => %r)" % (self.kind, self.src_fileN, self.out_fileN)
+	
+	# Copy/convert the file
+	# < cache: (TranscodeCache | None) Cache to fetch/store converted files from/in
+	# > throws "OSError" if the file couldn't be copied, or "RuntimeError" if the conversion failed
+	def run(self, cache=None):
+		t0 = time.perf_counter()
+		os.makedirs(os.path.dirname(self.out_fileN), exist_ok=True)
+		
+		if self.kind == 'copy':
+			# NOTE: The old output file may be a hardlink to a file in the cache, which must not be written over
+			if os.path.lexists(self.out_fileN):
+				os.remove(self.out_fileN)
+			shutil.copy2(self.src_fileN, self.out_fileN)
+		elif cache:
+			key = cache.key_for(self.src_fileN)
+			self.cache_hit = cache.fetch(key, self.out_fileN)
+			if not self.cache_hit:
+				transcode_file(self.src_fileN, self.out_fileN)
+				cache.store(key, self.out_fileN)
+		else:
+			transcode_file(self.src_fileN, self.out_fileN)
+		self.elapsed = time.perf_counter() - t0
+
+
+# Convert a file to mp3 using ffmpeg
+# > throws "RuntimeError" if ffmpeg fails
+def transcode_file(src_fileN, out_fileN):
+	# NOTE: The conversion is written to a temporary file first, which then replaces the output file.
+	#       As the old output file may be a hardlink to a file in the cache, letting ffmpeg write
+	#       over it directly would change (or on failure, truncate) the cached file too
+	tmp_fileN = "%s.%d.tmp.mp3" % (out_fileN, threading.get_ident())
+	
+	# NOTE: "-nostdin" + "-y" stop ffmpeg from waiting for input (e.g. to ask about overwriting files),
+	#       which would otherwise block the job forever
+	cmd = ['ffmpeg', '-nostdin', '-y', '-i', src_fileN] + FFMPEG_ARGS + [tmp_fileN]
+	result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+	
+	if result.returncode != 0:
+		if os.path.exists(tmp_fileN):
+			# Don't leave partially converted files around
+			os.remove(tmp_fileN)
+		
+		# The last line is usually the most useful bit
+		lines = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+		raise RuntimeError("ffmpeg failed (exit code %d): %s" % (result.returncode, lines[-1] if lines else "<no output>"))
+	
+	os.replace(tmp_fileN, out_fileN)
+
+
+# Get the version of ffmpeg that will be used
+# > returns: (str | None) The version line reported by ffmpeg, or None if it couldn't be run
+def get_ffmpeg_version():
+	try:
+		result = subprocess.run(['ffmpeg', '-version'], stdin=subprocess.DEVNULL,
+		                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+	except OSError:
+		return None
+	
+	lines = result.stdout.decode('utf-8', 'replace').splitlines()
+	return lines[0].strip() if (result.returncode == 0 and lines) else None
+
+#######################################
+# Transcode Cache
+#
+# Converted files are stored by a hash of everything that affects what they contain:
+# the contents of the source file, the arguments given to ffmpeg, and ffmpeg's version.
+# This means that the same track on different playlists (or under a different name)
+# only gets converted once, while changing any of these forces it to be converted again.
+#
+# Files are hardlinked from the cache into the output folder where possible (so they
+# don't take up any extra space), falling back to copying them (e.g. for other drives).
+#
+# The cache is trimmed back to its size limit after each run, by removing the files
+# which haven't been used for the longest. When they were last used is recorded in the
+# cache's own records (instead of by touching the files), as the files are shared with
+# the output folders, where their mtimes are what syncing tools look at.
+
+# Default location for the cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "m3u_to_mp3")
+
+# Default size limit for the cache (in GB)
+DEFAULT_CACHE_SIZE = 10
+
+# Size of the blocks that source files get read in when hashing them
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class TranscodeCache:
+	# Name of the file (in the cache folder) that the hashes of source files are remembered in
+	SOURCE_HASHES_FILENAME = "source_hashes.json"
+	
+	# Name of the file (in the cache folder) that the times each file was last used are remembered in
+	LAST_USED_FILENAME = "last_used.json"
+	
+	def __init__(self, cache_dir, max_bytes, ffmpeg_version):
+		self.cache_dir = cache_dir
+		self.objects_dir = os.path.join(cache_dir, "objects")
+		self.max_bytes = max_bytes
+		self.ffmpeg_version = ffmpeg_version
+		
+		os.makedirs(self.objects_dir, exist_ok=True)
+		
+		# Map from source files' absolute paths to [size, mtime_ns, hash], so that unchanged
+		# files don't need to be read again to find their hash
+		self.source_hashes = {}
+		self.lock = threading.Lock()
+		
+		try:
+			with open(os.path.join(cache_dir, self.SOURCE_HASHES_FILENAME)) as f:
+				self.source_hashes = json.load(f)
+		except (OSError, ValueError):
+			pass
+		
+		# Map from keys to when their file was last fetched/stored (as a time.time() timestamp)
+		# NOTE: Files without a record (e.g. from older versions) go by their mtime instead
+		self.last_used = {}
+		try:
+			with open(os.path.join(cache_dir, self.LAST_USED_FILENAME)) as f:
+				self.last_used = json.load(f)
+		except (OSError, ValueError):
+			pass
+	
+	# Get the hash of a source file's contents
+	def source_hash(self, src_fileN):
+		path = os.path.abspath(src_fileN)
+		st = os.stat(path)
+		
+		with self.lock:
+			known = self.source_hashes.get(path)
+		if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+			return known[2]
+		
+		h = hashlib.sha1()
+		with open(path, 'rb') as f:
+			for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+				h.update(block)
+		digest = h.hexdigest()
+		
+		with self.lock:
+			self.source_hashes[path] = [st.st_size, st.st_mtime_ns, digest]
+		return digest
+	
+	# Get the key that the converted version of a source file is stored under
+	def key_for(self, src_fileN):
+		h = hashlib.sha1()
+		h.update(self.source_hash(src_fileN).encode('ascii'))
+		h.update(b"\0" + "\0".join(FFMPEG_ARGS).encode('utf-8'))
+		h.update(b"\0" + self.ffmpeg_version.encode('utf-8'))
+		return h.hexdigest()
+	
+	# Get the path where the file for a key is stored
+	def path_for(self, key):
+		return os.path.join(self.objects_dir, key[:2], key + ".mp3")
+	
+	# Get the converted file from the cache, if it's there
+	# > returns: (bool) Whether the file was in the cache
+	def fetch(self, key, out_fileN):
+		cached_fileN = self.path_for(key)
+		if not os.path.exists(cached_fileN):
+			return False
+		
+		if os.path.exists(out_fileN):
+			os.remove(out_fileN)
+		link_or_copy(cached_fileN, out_fileN)
+		
+		# Mark it as recently used (for deciding what to evict)
+		# NOTE: The file itself isn't touched, as it may be hardlinked into output folders
+		with self.lock:
+			self.last_used[key] = time.time()
+		return True
+	
+	# Add a newly converted file to the cache
+	def store(self, key, out_fileN):
+		cached_fileN = self.path_for(key)
+		os.makedirs(os.path.dirname(cached_fileN), exist_ok=True)
+		
+		# NOTE: Added under a temporary name first, so that other jobs never see a partial file
+		tmp_fileN = "%s.%d.tmp" % (cached_fileN, threading.get_ident())
+		link_or_copy(out_fileN, tmp_fileN)
+		os.replace(tmp_fileN, cached_fileN)
+		
+		with self.lock:
+			self.last_used[key] = time.time()
+	
+	# Remove the least recently used files, until the cache is back within its size limit
+	# > returns: (int, int) Number of files + bytes removed
+	def evict(self):
+		entries = []
+		total = 0
+		with self.lock:
+			last_used = dict(self.last_used)
+		
+		for dirpath, _dirnames, filenames in os.walk(self.objects_dir):
+			for fileN in filenames:
+				path = os.path.join(dirpath, fileN)
+				key = os.path.splitext(fileN)[0]
+				st = os.stat(path)
+				entries.append((last_used.get(key, st.st_mtime), st.st_size, path, key))
+				total += st.st_size
+		
+		removed_count = removed_bytes = 0
+		for _last_used, size, path, key in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			os.remove(path)
+			total -= size
+			removed_count += 1
+			removed_bytes += size
 			
-			print("Converting '%s' => '%s'..." % (old_filename, new_filepath))
-			result = subprocess.run(['ffmpeg', '-i', line, '-vn', new_filepath], stdout=subprocess.PIPE)
-			print("   %s" % result)
+			with self.lock:
+				self.last_used.pop(key, None)
+		
+		return (removed_count, removed_bytes)
+	
+	# Save the hashes of the source files + when each file was last used, for next time
+	def save(self):
+		with self.lock:
+			records = {
+				self.SOURCE_HASHES_FILENAME: dict(self.source_hashes),
+				self.LAST_USED_FILENAME: dict(self.last_used),
+			}
 		
-		newFilenames.append(new_filename)
+		for filename, data in records.items():
+			records_fileN = os.path.join(self.cache_dir, filename)
+			with open(records_fileN + ".tmp", 'w') as f:
+				json.dump(data, f)
+			os.replace(records_fileN + ".tmp", records_fileN)
 
-# Save out the new playlist
-# XXX: All comments have been stripped!
-with open(os.path.join(OUT_DIR, IN_FILE), 'w') as f:
-	# Mandatory header
-	f.write("#EXTM3U\n")
+
+# Hardlink a file to a new location, or copy it if that's not possible (e.g. it's on another drive)
+def link_or_copy(src_fileN, dst_fileN):
+	try:
+		os.link(src_fileN, dst_fileN)
+	except OSError as e:
+		if e.errno == errno.EEXIST:
+			raise
+		shutil.copy2(src_fileN, dst_fileN)
+
+#######################################
+# Syncing
+#
+# A record is kept in each output folder of the files that were put there for each playlist
+# (along with the size + mtime that their source files had at the time), so that later runs
+# can tell which files are still up to date, and which ones are no longer needed.
+
+# Name of the file (in the output folder) that the records are kept in
+SYNC_MANIFEST_FILENAME = ".m3u_to_mp3_sync.json"
+
+
+# Load the records of which files were put in the output folder for each playlist
+# > returns: ({ str : { str : [int, int, int] } }) Map from playlist names, to a map from
+#            output filenames to the [size, mtime_ns] of their source file + their own size
+def load_sync_manifest(out_dir):
+	try:
+		with open(os.path.join(out_dir, SYNC_MANIFEST_FILENAME)) as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return {}
+
+# Save the records of which files were put in the output folder
+def save_sync_manifest(out_dir, manifest):
+	manifest_fileN = os.path.join(out_dir, SYNC_MANIFEST_FILENAME)
+	with open(manifest_fileN + ".tmp", 'w') as f:
+		json.dump(manifest, f, indent='\t')
+	os.replace(manifest_fileN + ".tmp", manifest_fileN)
+
+# Get the record to keep for a file that was just put in the output folder
+def sync_record_for(job):
+	st = os.stat(job.src_fileN)
+	return [st.st_size, st.st_mtime_ns, os.path.getsize(job.out_fileN)]
+
+# Check whether the output file for a job is still up to date
+# < record: ([int, int, int] | None) The record kept for the output file last time
+def is_up_to_date(job, record):
+	if record is None:
+		return False
+	try:
+		return sync_record_for(job) == record
+	except OSError:
+		# Missing source/output file
+		return False
+
+#######################################
+# Scheduling
+
+# Run all the copies/conversions
+# < jobs: ([TrackJob]) Jobs to run. Any failures are stored in their "error" attributes
+# < n_workers: (int) Number of conversions to run at once
+# < cache: (TranscodeCache | None) Cache to fetch/store converted files from/in
+def run_track_jobs(jobs, n_workers, cache=None):
+	N = len(jobs)
+	
+	with concurrent.futures.ThreadPoolExecutor(n_workers) as convert_lane, \
+	     concurrent.futures.ThreadPoolExecutor(COPY_LANE_WORKERS) as copy_lane:
+		futures = {}
+		for job in jobs:
+			lane = copy_lane if job.kind == 'copy' else convert_lane
+			futures[lane.submit(job.run, cache)] = job
+		
+		for i, future in enumerate(concurrent.futures.as_completed(futures), 1):
+			job = futures[future]
+			try:
+				future.result()
+				action = "Copied" if job.kind == 'copy' else ("Cached" if job.cache_hit else "Converted")
+				print("  [%d/%d] %s '%s' => '%s' (%.1f s)" % (i, N, action, job.src_fileN, job.out_fileN, job.elapsed))
+			except (OSError, RuntimeError) as e:
+				job.error = e
+				print("  [%d/%d] ERROR: Could not %s '%s' - %s" % (i, N, job.kind, job.src_fileN, e), file=sys.stderr)
+
+#######################################
+
+# Handle command-line arguments
+def get_config():
+	parser = argparse.ArgumentParser(
+		description = "Convert m3u playlist's contents to mp3's in the target folder")
+	
+	parser.add_argument("in_file", metavar="IN_FILE.m3u",
+	                    help="Playlist to convert")
+	parser.add_argument("out_dir", metavar="OUT_DIR",
+	                    help="Folder to put the converted files (and playlist) into")
+	
+	parser.add_argument("-j", "--jobs", type=int, default=0,
+	                    help="Number of ffmpeg processes to run at once (0 = one per core, the default)")
+	
+	parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+	                    help="Folder to keep converted files in, for reuse on later runs (default: %(default)s)")
+	parser.add_argument("--cache-size", type=float, default=DEFAULT_CACHE_SIZE,
+	                    help="Maximum size of the cache, in GB (default: %(default)s)")
+	parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+	                    help="Don't use the cache (i.e. convert everything from scratch)")
+	
+	parser.add_argument("--sync", action="store_true",
+	                    help="Only copy/convert files which are new, or have changed since the last run")
+	parser.add_argument("--prune", action="store_true",
+	                    help="When syncing, also remove files from previous runs which are no longer on the playlist")
 	
-	# Write files
-	for fileN in newFilenames:
-		f.write("%s\n" % fileN)
+	return parser.parse_args()
+
+
+def main():
+	if len(sys.argv) < 3:
+		print(__doc__)
+		sys.exit(-1)
+	
+	config = get_config()
+	
+	IN_FILE = config.in_file
+	OUT_DIR = config.out_dir
+	
+	# Create output directory
+	if not os.path.exists(OUT_DIR):
+		print("Creating '%s'..." % (OUT_DIR))
+		os.makedirs(OUT_DIR)
+		print("  OutDir Exists?   %s" % os.path.exists(OUT_DIR))
+	
+	if config.prune and not config.sync:
+		print("ERROR: --prune can only be used with --sync", file=sys.stderr)
+		sys.exit(-1)
+	
+	# Work out what needs doing for each file
+	# NOTE: Entries in the playlist are relative to where the playlist is
+	entries = read_playlist(IN_FILE)
+	playlist_dir = os.path.dirname(os.path.abspath(IN_FILE))
+	playlist_name = os.path.basename(IN_FILE)
+	
+	jobs = []
+	job_for_output = {}      # Map from output files to the job creating them (in case of duplicates in the playlist)
+	playlist_jobs = []       # Job for each entry in the playlist (in order)
+	
+	for entry, _comments in entries:
+		job = TrackJob(entry, playlist_dir, OUT_DIR)
+		if job.out_fileN in job_for_output:
+			job = job_for_output[job.out_fileN]
+		else:
+			job_for_output[job.out_fileN] = job
+			jobs.append(job)
+		playlist_jobs.append(job)
+	
+	sync_manifest = load_sync_manifest(OUT_DIR)
+	old_records = sync_manifest.get(playlist_name, {})
+	new_records = {}         # Records for the files in the output folder after this run
+	
+	if config.sync:
+		# Only the files which have changed need to be done again
+		for job in jobs:
+			record = old_records.get(job.new_filename)
+			if is_up_to_date(job, record):
+				new_records[job.new_filename] = record
+		
+		jobs = [job for job in jobs if job.new_filename not in new_records]
+		print("Syncing with '%s': %d files already up to date" % (OUT_DIR, len(new_records)))
 	
+	n_workers = config.jobs if config.jobs > 0 else (os.cpu_count() or 1)
+	n_converts = sum(1 for job in jobs if job.kind == 'convert')
+	print("Processing %d files (%d to convert, %d to copy) using %d ffmpeg processes..."
+	      % (len(jobs), n_converts, len(jobs) - n_converts, n_workers))
+	
+	cache = None
+	if config.use_cache and n_converts:
+		ffmpeg_version = get_ffmpeg_version()
+		if ffmpeg_version:
+			cache = TranscodeCache(config.cache_dir, int(config.cache_size * 1e9), ffmpeg_version)
+		else:
+			print("WARNING: Couldn't get ffmpeg's version, so the cache won't be used", file=sys.stderr)
+	
+	start_time = time.perf_counter()
+	run_track_jobs(jobs, n_workers, cache)
+	elapsed = time.perf_counter() - start_time
+	
+	if cache:
+		removed_count, removed_bytes = cache.evict()
+		cache.save()
+		
+		n_hits = sum(1 for job in jobs if job.cache_hit)
+		print("\nCache: %d of %d conversions reused from '%s'" % (n_hits, n_converts, config.cache_dir))
+		if removed_count:
+			print("Cache: Removed %d old files (%.1f MB) to stay within %.1f GB"
+			      % (removed_count, removed_bytes / 1e6, config.cache_size))
+	
+	for job in jobs:
+		if not job.error:
+			new_records[job.new_filename] = sync_record_for(job)
+	
+	if config.prune:
+		# Remove files which were only there for entries that have since been removed from this playlist
+		# NOTE: Files which other playlists synced to the same folder still need are kept
+		still_needed = set(new_records) | set(job.new_filename for job in playlist_jobs)
+		for other_name, other_records in sync_manifest.items():
+			if other_name != playlist_name:
+				still_needed.update(other_records)
+		
+		for fileN in sorted(set(old_records) - still_needed):
+			if output_name_for(fileN) != fileN:
+				# Never delete anything outside the output folder (e.g. from a manifest written by an older version)
+				continue
+			out_fileN = os.path.join(OUT_DIR, fileN)
+			if os.path.exists(out_fileN):
+				print("Removing '%s' (no longer on the playlist)" % (out_fileN))
+				os.remove(out_fileN)
+	else:
+		# Keep track of the files that weren't pruned, so that they can be pruned later
+		for fileN, record in old_records.items():
+			new_records.setdefault(fileN, record)
+	
+	sync_manifest[playlist_name] = new_records
+	save_sync_manifest(OUT_DIR, sync_manifest)
+	
+	failed = [job for job in jobs if job.error]
+	total_bytes = sum(os.path.getsize(job.src_fileN) for job in jobs if not job.error)
+	print("\nProcessed %d files (%.1f MB of source files) in %.1f s (%.2f files/s, %.1f MB/s)"
+	      % (len(jobs) - len(failed), total_bytes / 1e6, elapsed,
+	         (len(jobs) - len(failed)) / max(elapsed, 1e-6), total_bytes / 1e6 / max(elapsed, 1e-6)))
+	
+	# Save out the new playlist (leaving out anything that failed)
+	write_playlist(os.path.join(OUT_DIR, playlist_name),
+	               [(job.new_filename, comments)
+	                for (job, (_entry, comments)) in zip(playlist_jobs, entries) if not job.error])
+	
+	if failed:
+		print("\nWARNING: %d files failed:" % (len(failed)), file=sys.stderr)
+		for job in failed:
+			print("  %s - %s" % (job.src_fileN, job.error), file=sys.stderr)
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
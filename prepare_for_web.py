@@ -4,6 +4,14 @@ import sys
 import os
 import tempfile
 
+import argparse
+import functools
+import hashlib
+import json
+import multiprocessing
+import struct
+import time
+
 try:
 	# Py 3 only
 	import pathlib
@@ -16,18 +24,11 @@ from PIL import Image
 from PIL import ImageCms
 #from PIL import ExifTags
 
-def is_adobe_rgb(img):
-	# Note: Canon JPG's don't usually have embedded icc_profile data set.
-	#      Instead, they only set the "Color Space" EXIF tag, but only in MarkerNote
-	#return 'Adobe RGB' in img.info.get('icc_profile', '')
-	MAKERNOTE_TAG = 37500
-	CANON_CS_TAG = 0x00b4 # Exif.Canon.ColorSpace
-	
-	exif = img._getexif()
-	makernote = exif[MAKERNOTE_TAG]
-
-	return makernote[CANON_CS_TAG] == "Adobe RGB"  # XXX: This still doesn't work!
-
+try:
+	# Only needed for the "lut" colour conversion backend
+	import numpy as np
+except ImportError:
+	np = None
 
 # Colorspace conversion magic
 def adobe_to_srgb(img):
@@ -68,79 +69,775 @@ def adobe_to_srgb__fast(img):
 	return img
 
 
-# Helper to find files...
-def find_images(path):
-	# Find raw camera exports and picasa exports
-	# FIXME: The stored filenames break if path != curdir
-	images = [f for f in os.listdir(path) 
-			  if f.startswith("_MG_") and (f.endswith(".JPG") or f.endswith('.jpg'))]
-	return images
+# Prebuilt colour transforms, keyed by image mode
+# NOTE: profileToProfile() rebuilds the transform on every call, which is the
+#       expensive part, so we build it only once per process and reuse it.
+COLOR_TRANSFORMS = {}
 
+# Colorspace conversion magic (using a cached transform)
+def adobe_to_srgb__cached(img):
+	global COLOR_PROFILES, COLOR_TRANSFORMS
+	
+	transform = COLOR_TRANSFORMS.get(img.mode)
+	if transform is None:
+		transform = ImageCms.buildTransform(COLOR_PROFILES['argb'], COLOR_PROFILES['srgb'],
+		                                    img.mode, img.mode)
+		COLOR_TRANSFORMS[img.mode] = transform
+	
+	return ImageCms.applyTransform(img, transform)
 
-if len(sys.argv) > 1:
-	# Check on each path supplied...
-	print("Checking supplied paths...")
-	images = []
+
+# -------------------------------------
+# 3D-LUT Backend (NumPy)
+#
+# Instead of running every image through LittleCMS, we run every possible
+# 8-bit colour through it once, cache the result on disk, and then convert
+# whole images with a single table lookup per pixel.
+#
+# Note: The table covers all 256^3 input colours, so no interpolation is needed
+#       and the output is identical to the CMS path. A coarse grid + trilinear
+#       interpolation was tried first, but was both slower (8 gathers + lerps
+#       per pixel) and up to ~20 levels off in the shadows.
+
+# Number of image rows to process at a time (to keep the temporary arrays small)
+LUT_ROWS_PER_CHUNK = 256
+
+# Cached LUT - (256 ** 3) uint32 array, indexed by 0xRRGGBB, with the output packed as 0x00BBGGRR
+COLOR_LUT = None
+
+# Get the path to the cached LUT file
+def lut_cache_filename():
+	return os.path.join(ICC_DATA_DIR, "AdobeRGB_to_sRGB_lut.npy")
+
+# Bake the AdobeRGB -> sRGB conversion into a LUT, by running every colour through ImageCms
+# > returns: (np.ndarray) (256 ** 3) uint32 array (see COLOR_LUT)
+def bake_color_lut():
+	# Build an image containing all the colours (in 0xRRGGBB order)
+	colors = np.arange(256 ** 3, dtype=np.uint32)
+	grid = np.empty((4096, 4096, 3), dtype=np.uint8)
+	grid[..., 0].flat = colors >> 16
+	grid[..., 1].flat = colors >> 8
+	grid[..., 2].flat = colors
+	
+	converted = np.asarray(adobe_to_srgb__cached(Image.fromarray(grid, 'RGB')))
 	
-	for path in sys.argv[1:]:
-		if os.path.isdir(path):
-			# Directory - Find everything interesting there to convert
-			# TODO: Make this recursive?
-			images += find_images(path)
-		elif path.isdigit():
-			# Partial filename - just the digits, for convenience
-			# TODO: Check that a corresponding file actually exists..
-			path = "_MG_%s.JPG" % (path)
-			if not os.path.exists(path):
-				print("   ERROR: '%s' does not exist" % (path))
+	# Pack the results so that the lookups can be written straight out as RGBX pixels
+	lut = np.zeros((4096, 4096, 4), dtype=np.uint8)
+	lut[..., :3] = converted
+	return lut.view(np.uint32).reshape(256 ** 3)
+
+# Get the LUT to use, baking + caching it on disk if it doesn't exist or is out of date
+def get_color_lut():
+	global COLOR_LUT
+	
+	if COLOR_LUT is None:
+		lut_filename = lut_cache_filename()
+		icc_filename = os.path.join(ICC_DATA_DIR, 'AdobeRGB.icc')
+		
+		if not (os.path.exists(lut_filename) and
+		        os.path.getmtime(lut_filename) >= os.path.getmtime(icc_filename)):
+			print("Baking colour conversion LUT => '%s'..." % (lut_filename))
+			lut = bake_color_lut()
+			
+			# Write to a tempfile first, so that other processes never see a half-written file
+			fd, tmp_filename = tempfile.mkstemp(suffix=".npy", dir=os.path.dirname(lut_filename))
+			with os.fdopen(fd, 'wb') as f:
+				np.save(f, lut)
+			os.replace(tmp_filename, lut_filename)
+		
+		# Memory-map it, so that worker processes all share the same pages
+		COLOR_LUT = np.load(lut_filename, mmap_mode='r')
+	
+	return COLOR_LUT
+
+# Apply the LUT to an array of RGB pixels
+# < pixels: (np.ndarray) uint8 array with shape (H, W, 3)
+# > returns: (np.ndarray) uint32 array with shape (H, W), containing the packed RGBX results
+def apply_color_lut(lut, pixels):
+	pixels = pixels.astype(np.uint32)
+	index = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+	return lut[index]
+
+# Colorspace conversion magic (using a LUT)
+# Note: Falls back to the CMS path for anything that isn't a plain RGB image
+def adobe_to_srgb__lut(img):
+	if img.mode != 'RGB':
+		return adobe_to_srgb__cached(img)
+	
+	lut = get_color_lut()
+	pixels = np.asarray(img)
+	out = np.empty(pixels.shape[:2], dtype=np.uint32)
+	
+	for y in range(0, pixels.shape[0], LUT_ROWS_PER_CHUNK):
+		rows = slice(y, y + LUT_ROWS_PER_CHUNK)
+		out[rows] = apply_color_lut(lut, pixels[rows])
+	
+	return Image.frombytes('RGB', img.size, out, 'raw', 'RGBX')
+
+
+# Available colour conversion backends
+COLOR_BACKENDS = {
+	'cms': adobe_to_srgb__cached,
+	'lut': adobe_to_srgb__lut,
+}
+
+
+# -------------------------------------
+# Colour Space Detection
+#
+# To figure out which images need converting, we only read the JPEG header
+# segments (stopping before the image data), instead of decoding the whole file.
+#
+# Note: Canon JPG's don't usually have embedded icc_profile data set.
+#       Instead, they set the "Color Space" EXIF tag (to "Uncalibrated" for Adobe RGB),
+#       the Interop Index ("R03" for Adobe RGB), and the Canon MakerNote ColorSpace tag.
+
+COLOR_SPACE_SRGB = 'sRGB'
+COLOR_SPACE_ADOBE_RGB = 'Adobe RGB'
+
+# TIFF/EXIF tags of interest
+TIFF_MAKE_TAG = 0x010F
+EXIF_IFD_TAG = 0x8769
+EXIF_COLOR_SPACE_TAG = 0xA001      # 1 = sRGB, 0xFFFF = Uncalibrated
+INTEROP_IFD_TAG = 0xA005
+INTEROP_INDEX_TAG = 0x0001         # "R98" = sRGB, "R03" = Adobe RGB
+MAKERNOTE_TAG = 0x927C
+CANON_CS_TAG = 0x00B4              # Exif.Canon.ColorSpace - 1 = sRGB, 2 = Adobe RGB
+
+# Sizes (in bytes) of each of the TIFF field types
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+
+# Read the EXIF + ICC profile data from the header of a JPEG file
+# > returns: (bytes | None, bytes | None) The EXIF data (starting from the TIFF header), and ICC profile
+def read_jpeg_metadata(fileN):
+	exif = None
+	icc_chunks = {}
+	
+	with open(fileN, 'rb') as f:
+		if f.read(2) != b'\xFF\xD8':
+			# Not a JPEG
+			return (None, None)
+		
+		while True:
+			# Find next marker (skipping any fill bytes)
+			byte = f.read(1)
+			if byte != b'\xFF':
+				break
+			while byte == b'\xFF':
+				byte = f.read(1)
+			if not byte:
+				break
+			marker = byte[0]
+			
+			if marker in (0xD9, 0xDA):
+				# End of image / Start of image data - Nothing more to find
+				break
+			elif marker == 0x01 or 0xD0 <= marker <= 0xD7:
+				# Standalone markers (no length)
+				continue
+			
+			length_bytes = f.read(2)
+			if len(length_bytes) < 2:
+				break
+			length = struct.unpack('>H', length_bytes)[0] - 2
+			
+			if marker == 0xE1 and exif is None:
+				data = f.read(length)
+				if data.startswith(b'Exif\x00\x00'):
+					exif = data[6:]
+			elif marker == 0xE2:
+				data = f.read(length)
+				if data.startswith(b'ICC_PROFILE\x00') and len(data) > 14:
+					# Profiles may be split across several segments - byte 12 is the sequence number
+					icc_chunks[data[12]] = data[14:]
 			else:
-				images.append(path)
-		elif not os.path.exists(path):
-			# Invalid Filename
-			print("  ERROR: '%s' is not a valid path" % (path))
+				f.seek(length, os.SEEK_CUR)
+	
+	icc = b''.join(icc_chunks[k] for k in sorted(icc_chunks)) or None
+	return (exif, icc)
+
+
+# Read the entries of a TIFF IFD
+# < tiff: (bytes) The TIFF data (i.e. EXIF data, after the "Exif\0\0" header)
+# < offset: (int) Offset of the IFD in the TIFF data
+# < endian: (str) Byte order - '<' or '>'
+# > returns: ({ int : (int, int, int) }) Map from tag ids to (type, count, offset_of_value_data)
+def read_tiff_ifd(tiff, offset, endian):
+	entries = {}
+	if offset + 2 > len(tiff):
+		return entries
+	
+	num_entries = struct.unpack_from(endian + 'H', tiff, offset)[0]
+	for i in range(num_entries):
+		entry_offset = offset + 2 + (i * 12)
+		if entry_offset + 12 > len(tiff):
+			break
+		
+		tag, field_type, count = struct.unpack_from(endian + 'HHI', tiff, entry_offset)
+		
+		# Values that fit in 4 bytes are stored inline, otherwise it's an offset to where they are
+		size = TIFF_TYPE_SIZES.get(field_type, 1) * count
+		if size <= 4:
+			value_offset = entry_offset + 8
 		else:
-			# Valid Filename - Assume that this is an image
-			# TODO: Check that it is an image...
-			images.append(path)
-else:
-	# Hunt for picasa exports / camera raw exports
-	print("sys.argv = %s\n\n" % (sys.argv))
-	
-	print("Finding images...")
-	images = find_images('.')
-
-# Report how many were found
-N = len(images)
-print("\n\nFound %d Images" % (N))
-PREVIEW_LIMIT = 30
-
-if N == 0:
-	# Silently exit if nothing found
-	sys.exit(1)
-elif N < PREVIEW_LIMIT:
-	# Show what we found if there aren't too many
-	# (Use this when debugging, to ensure we're culling the right ones)
-	print("   %s\n\n" % (images))
-else:
-	# Don't print all of them (as then we miss the full count)
-	# (Useful when doing production exports on datasets with 100-600 shots)
-	print("   %s\n    + '[... %d more...]\n\n'" % (images[:50], N - 50))
-
-# Process images
-# TODO: Parallelise this to use more cores?
-for i, fileN in enumerate(images):
-	print("[%3d/%3d] Converting ==> '%s'" % (i, N, fileN))
+			value_offset = struct.unpack_from(endian + 'I', tiff, entry_offset + 8)[0]
+		
+		entries[tag] = (field_type, count, value_offset)
+	return entries
+
+# Get an integer value from a TIFF IFD entry (or None if it's not an integer)
+def tiff_int_value(tiff, entry, endian):
+	field_type, _count, value_offset = entry
+	if field_type == 3:
+		return struct.unpack_from(endian + 'H', tiff, value_offset)[0]
+	elif field_type == 4:
+		return struct.unpack_from(endian + 'I', tiff, value_offset)[0]
+	elif field_type in (1, 7):
+		return tiff[value_offset]
+	return None
+
+# Get a string/bytes value from a TIFF IFD entry
+def tiff_bytes_value(tiff, entry):
+	_field_type, count, value_offset = entry
+	return tiff[value_offset : value_offset + count].rstrip(b'\x00')
+
+
+# Get the colour space described by the EXIF data
+# > returns: (str | None) One of the COLOR_SPACE_* values, or None if it couldn't be determined
+def exif_color_space(tiff):
+	if tiff[:2] == b'II':
+		endian = '<'
+	elif tiff[:2] == b'MM':
+		endian = '>'
+	else:
+		return None
+	
+	ifd0 = read_tiff_ifd(tiff, struct.unpack_from(endian + 'I', tiff, 4)[0], endian)
+	if EXIF_IFD_TAG not in ifd0:
+		return None
+	exif_ifd = read_tiff_ifd(tiff, tiff_int_value(tiff, ifd0[EXIF_IFD_TAG], endian), endian)
+	
+	# Canon MakerNote - This is an IFD (with offsets relative to the TIFF header)
+	make = tiff_bytes_value(tiff, ifd0[TIFF_MAKE_TAG]) if TIFF_MAKE_TAG in ifd0 else b''
+	if make.startswith(b'Canon') and MAKERNOTE_TAG in exif_ifd:
+		makernote = read_tiff_ifd(tiff, exif_ifd[MAKERNOTE_TAG][2], endian)
+		if CANON_CS_TAG in makernote:
+			canon_cs = tiff_int_value(tiff, makernote[CANON_CS_TAG], endian)
+			if canon_cs == 1:
+				return COLOR_SPACE_SRGB
+			elif canon_cs == 2:
+				return COLOR_SPACE_ADOBE_RGB
+	
+	# Interop Index (DCF) - "R03" is used to flag Adobe RGB images
+	if INTEROP_IFD_TAG in exif_ifd:
+		interop = read_tiff_ifd(tiff, tiff_int_value(tiff, exif_ifd[INTEROP_IFD_TAG], endian), endian)
+		if INTEROP_INDEX_TAG in interop:
+			index = tiff_bytes_value(tiff, interop[INTEROP_INDEX_TAG])
+			if index == b'R03':
+				return COLOR_SPACE_ADOBE_RGB
+			elif index == b'R98':
+				return COLOR_SPACE_SRGB
+	
+	# Standard EXIF ColorSpace - Only "sRGB" is actually defined
+	if EXIF_COLOR_SPACE_TAG in exif_ifd:
+		if tiff_int_value(tiff, exif_ifd[EXIF_COLOR_SPACE_TAG], endian) == 1:
+			return COLOR_SPACE_SRGB
+	
+	return None
+
+
+# Get the description of an ICC profile
+# > returns: (str | None) The profile description, if it could be found
+def icc_description(icc):
+	if len(icc) < 132:
+		return None
+	
+	num_tags = struct.unpack_from('>I', icc, 128)[0]
+	for i in range(num_tags):
+		tag_offset = 132 + (i * 12)
+		if tag_offset + 12 > len(icc):
+			break
+		
+		signature, offset, size = struct.unpack_from('>4sII', icc, tag_offset)
+		if signature != b'desc':
+			continue
+		
+		data = icc[offset : offset + size]
+		if data[:4] == b'desc':
+			# ICC v2 - textDescriptionType (ASCII)
+			length = struct.unpack_from('>I', data, 8)[0]
+			return data[12 : 12 + length].rstrip(b'\x00').decode('latin-1')
+		elif data[:4] == b'mluc' and len(data) >= 28:
+			# ICC v4 - multiLocalizedUnicodeType (UTF-16). Just use the first record
+			length, str_offset = struct.unpack_from('>II', data, 20)
+			return data[str_offset : str_offset + length].decode('utf-16-be', 'replace')
+	
+	return None
+
+
+# Get the colour space of a JPEG, using only its header data
+# > returns: (str | None) One of the COLOR_SPACE_* values, or None if it couldn't be determined
+def detect_color_space(fileN):
+	try:
+		exif, icc = read_jpeg_metadata(fileN)
+		
+		# An embedded profile trumps anything the EXIF data says
+		if icc:
+			desc = icc_description(icc) or ''
+			if 'Adobe RGB' in desc:
+				return COLOR_SPACE_ADOBE_RGB
+			elif 'sRGB' in desc:
+				return COLOR_SPACE_SRGB
+		
+		if exif:
+			return exif_color_space(exif)
+	except (OSError, struct.error, IndexError, TypeError) as e:
+		print("  WARNING: Could not read colour space of '%s' - %s" % (fileN, e))
+	
+	return None
+
+# Check if the given image needs to be converted to sRGB
+# Note: Images where the colour space can't be determined are assumed to be Adobe RGB
+def is_adobe_rgb(fileN):
+	return detect_color_space(fileN) != COLOR_SPACE_SRGB
+
+
+# -------------------------------------
+
+# Check if the given filename is one of the images we're looking for
+# i.e. raw camera exports and picasa exports
+def is_source_image(filename):
+	return filename.startswith("_MG_") and (filename.endswith(".JPG") or filename.endswith('.jpg'))
+
+# Helper to find files...
+# < path: (str) Directory to search
+# < recursive: (bool) Whether to search subdirectories too
+# > returns: ([str]) Paths to the images found (including the path to their directory)
+def find_images(path, recursive=False):
+	images = []
+	subdirs = []
+	
+	with os.scandir(path) as it:
+		for entry in it:
+			if entry.is_file() and is_source_image(entry.name):
+				images.append(entry.path)
+			elif recursive and entry.is_dir(follow_symlinks=False):
+				subdirs.append(entry.path)
+	
+	# Sort, so that the processing order (and progress output) is stable
+	images.sort()
+	for subdir in sorted(subdirs):
+		images += find_images(subdir, recursive)
 	
+	return images
+
+
+# Get the filename that the converted image gets saved to
+# (i.e. replacing the underscore for a "I", in the same directory as the original)
+# < size: (int | None) Size target that this is the output for, if several are being made
+def output_filename_for(fileN, size=None):
+	dirname, basename = os.path.split(fileN)
+	if size is not None:
+		stem, extn = os.path.splitext(basename)
+		basename = "%s_%dpx%s" % (stem, size, extn)
+	return os.path.join(dirname, "I%s" % (basename[1:]))
+
+# Get the filenames of all the outputs for the given image
+# < sizes: ([int] | None) Size targets being made (see convert_image())
+def output_filenames_for(fileN, sizes=None):
+	if sizes and len(sizes) > 1:
+		return [output_filename_for(fileN, size) for size in sizes]
+	else:
+		return [output_filename_for(fileN)]
+
+
+# Get the dimensions to scale an image to, so that it fits within the given size
+# < size: (int) Maximum length of the longest edge
+# > returns: ((int, int)) New width + height. These will never be larger than the original
+def fit_to_size(image_size, size):
+	width, height = image_size
+	scale = min(1.0, size / max(width, height))
+	return (max(1, round(width * scale)), max(1, round(height * scale)))
+
+
+# Convert a single image, saving the result alongside the original
+# < fileN: (str) Path to the image to convert
+# < backend: (str) Name of the colour conversion backend to use (see COLOR_BACKENDS)
+# < sizes: ([int] | None) Maximum sizes (longest edge, in pixels) to output the image at.
+#                         If None, the image is saved at its original size.
+# > returns: ([str]) Paths to the converted images
+#
+# Note: This is the unit of work for the process pool, so it needs to be a module-level function
+def convert_image(fileN, backend='cms', sizes=None):
 	# Open the file for conversion
 	img = Image.open(fileN)
 	exif = img.info['exif']
+	
+	if sizes:
+		# Let the JPEG decoder do most of the downscaling for us (in the DCT domain),
+		# while keeping the decoded image at least as big as the largest target.
+		# This needs to happen before anything loads the pixel data.
+		draft_size = fit_to_size(img.size, max(sizes))
+		if draft_size != img.size:
+			img.draft('RGB', draft_size)
+	
+	# Only convert the (possibly already reduced) image once, and make all the variants from that
+	img = COLOR_BACKENDS[backend](img)
+	
+	out_filenames = output_filenames_for(fileN, sizes)
+	if sizes:
+		for size, new_fileN in zip(sizes, out_filenames):
+			new_size = fit_to_size(img.size, size)
+			if new_size != img.size:
+				variant = img.resize(new_size, Image.LANCZOS, reducing_gap=3.0)
+			else:
+				variant = img
+			variant.save(new_fileN, exif=exif)
+	else:
+		img.save(out_filenames[0], exif=exif)
+	
+	return out_filenames
+
+
+# Convert a single image, also returning the state of the source file (for the manifest)
+# > returns: ([str], dict) Paths to the converted images, and the describe_source() record for the original
+def convert_image__tracked(fileN, backend='cms', sizes=None):
+	# Describe the source *before* converting it, so that if it gets changed
+	# while we're busy, the next run will pick it up again
+	source_info = describe_source(fileN)
+	out_filenames = convert_image(fileN, backend, sizes)
+	return (out_filenames, source_info)
+
+
+# Convert all the given images, one at a time
+# < work_fn: (fn(fileN) -> result) Function to perform the conversion
+# > yields: (str, result) The filename, and the result of converting it
+def convert_images_serial(images, work_fn):
+	N = len(images)
+	for i, fileN in enumerate(images):
+		print("[%3d/%3d] Converting ==> '%s'" % (i, N, fileN))
+		yield (fileN, work_fn(fileN))
+
+
+# Convert all the given images, spread across a pool of worker processes
+# < jobs: (int) Number of worker processes to use
+# < work_fn: (fn(fileN) -> result) Function to perform the conversion. Must be picklable.
+# > yields: (str, result) The filename, and the result of converting it
+#
+# Note: Results are reported in the same order as the input list, so the
+#       progress output matches that of the serial path.
+def convert_images_parallel(images, jobs, work_fn):
+	N = len(images)
+	
+	with multiprocessing.Pool(jobs) as pool:
+		# chunksize=1, as each image is a sizeable amount of work
+		results = pool.imap(work_fn, images, chunksize=1)
+		for i, (fileN, result) in enumerate(zip(images, results)):
+			print("[%3d/%3d] Converting ==> '%s'" % (i, N, fileN))
+			yield (fileN, result)
+
+
+# -------------------------------------
+# Conversion Manifest
+#
+# For incremental runs, each directory gets a manifest recording the state of
+# each source file when it was last converted, and where it was converted to.
+# Files that are unchanged since then (and still have their output) get skipped.
+
+# Name of the manifest file stored in each directory
+MANIFEST_FILENAME = ".prepare_for_web_manifest.json"
+
+# Minimum number of seconds between manifest saves while a batch is running
+# (so that an interrupted run loses little progress, without rewriting it after every file)
+MANIFEST_SAVE_INTERVAL = 2.0
+
+# Compute a hash of the given file's contents
+def hash_file(fileN, block_size=1 << 20):
+	h = hashlib.sha1()
+	with open(fileN, 'rb') as f:
+		for block in iter(lambda: f.read(block_size), b''):
+			h.update(block)
+	return h.hexdigest()
+
+# Get a record describing the current state of the given source file
+# > returns: ({ str : any }) Size + mtime of the file, and a hash of its contents
+def describe_source(fileN):
+	st = os.stat(fileN)
+	return {
+		'size': st.st_size,
+		'mtime': st.st_mtime_ns,
+		'hash': hash_file(fileN),
+	}
+
+
+# Collection of the manifests for all directories that the images being converted come from
+class ConversionManifest:
+	def __init__(self):
+		self.manifests = {}   # { manifest_path : { source_filename : record } }
+		self.dirty = set()    # manifest_path's with unsaved changes
+		self.last_save = time.monotonic()
+	
+	# Get the manifest path + entry name for the given source file
+	def _key_for(self, fileN):
+		dirname, basename = os.path.split(os.path.abspath(fileN))
+		return (os.path.join(dirname, MANIFEST_FILENAME), basename)
+	
+	# Get the entries of the given manifest, loading it if necessary
+	def _entries(self, manifest_path):
+		if manifest_path not in self.manifests:
+			try:
+				with open(manifest_path) as f:
+					self.manifests[manifest_path] = json.load(f)
+			except FileNotFoundError:
+				self.manifests[manifest_path] = {}
+			except ValueError:
+				print("  WARNING: Ignoring corrupt manifest '%s'" % (manifest_path))
+				self.manifests[manifest_path] = {}
+		return self.manifests[manifest_path]
+	
+	# Get the paths of the given output files, as stored in the manifest
+	def _output_paths(self, manifest_path, out_filenames):
+		manifest_dir = os.path.dirname(manifest_path)
+		return [os.path.relpath(os.path.abspath(out_fileN), manifest_dir)
+		        for out_fileN in out_filenames]
+	
+	# Check whether the given source file needs to be (re)converted
+	# < out_filenames: ([str]) The outputs that are expected for this file (see output_filenames_for())
+	def needs_conversion(self, fileN, out_filenames):
+		manifest_path, name = self._key_for(fileN)
+		entry = self._entries(manifest_path).get(name)
+		if entry is None:
+			return True
+		
+		# The same outputs must have been made, and must all still be there
+		if entry.get('outputs') != self._output_paths(manifest_path, out_filenames):
+			return True
+		elif not all(os.path.exists(out_fileN) for out_fileN in out_filenames):
+			return True
+		
+		# Cheap checks first - If size + mtime match, assume that nothing changed
+		st = os.stat(fileN)
+		if st.st_size != entry['size']:
+			return True
+		elif st.st_mtime_ns == entry['mtime']:
+			return False
+		
+		# Timestamp changed (e.g. copied/touched) - Only reconvert if the contents changed
+		if hash_file(fileN) != entry['hash']:
+			return True
+		
+		entry['mtime'] = st.st_mtime_ns
+		self.dirty.add(manifest_path)
+		return False
+	
+	# Record that the given source file has been converted
+	# < source_info: ({ str : any }) describe_source() record for the source file
+	def record(self, fileN, out_filenames, source_info):
+		manifest_path, name = self._key_for(fileN)
+		
+		entry = dict(source_info)
+		entry['outputs'] = self._output_paths(manifest_path, out_filenames)
+		
+		self._entries(manifest_path)[name] = entry
+		self.dirty.add(manifest_path)
+	
+	# Write out any manifests with unsaved changes
+	# < force: (bool) If False, this only happens if it's been a while since the last save
+	def save(self, force=False):
+		if not force and (time.monotonic() - self.last_save) < MANIFEST_SAVE_INTERVAL:
+			return
+		
+		for manifest_path in sorted(self.dirty):
+			# Write to a tempfile + swap in, so that an interrupted save doesn't lose the whole manifest
+			fd, tmp_filename = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(manifest_path))
+			with os.fdopen(fd, 'w') as f:
+				json.dump(self.manifests[manifest_path], f, indent='\t', sort_keys=True)
+			os.replace(tmp_filename, manifest_path)
+		
+		self.dirty.clear()
+		self.last_save = time.monotonic()
+
+
+# Time the colour conversion backends against each other on synthetic images,
+# and report how far the LUT output strays from the LittleCMS output
+def benchmark_backends(sizes=((640, 480), (1920, 1280), (6000, 4000)), repeats=3):
+	get_color_lut()
+	rng = np.random.default_rng(0)
+	
+	for (w, h) in sizes:
+		# Smooth gradients + noise, so we get a spread of colours similar to photos
+		ys, xs = np.mgrid[0:h, 0:w]
+		base = np.stack([xs * 255 // max(w - 1, 1),
+		                 ys * 255 // max(h - 1, 1),
+		                 (xs + ys) * 255 // max(w + h - 2, 1)], axis=-1)
+		noise = rng.integers(-32, 32, size=(h, w, 3))
+		img = Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), 'RGB')
+		
+		print("%d x %d (%.1f MP):" % (w, h, w * h / 1e6))
+		results = {}
+		for name in sorted(COLOR_BACKENDS.keys()):
+			fn = COLOR_BACKENDS[name]
+			best = None
+			for _ in range(repeats):
+				t0 = time.perf_counter()
+				results[name] = fn(img)
+				dt = time.perf_counter() - t0
+				best = dt if best is None else min(best, dt)
+			print("   %-4s  %8.1f ms" % (name, best * 1000))
+		
+		diff = np.abs(np.asarray(results['lut'], dtype=np.int16) - np.asarray(results['cms'], dtype=np.int16))
+		print("   lut vs cms: max diff = %d, mean diff = %.3f levels\n" % (diff.max(), diff.mean()))
+
+
+###############################################
+
+
+# Handle command-line arguments
+def get_config():
+	parser = argparse.ArgumentParser(
+		description = "Convert aRGB files to sRGB (for upload to web/GPhotos)")
+	
+	parser.add_argument("paths", nargs='*',
+	                    help="Images, directories, or just the digits of a '_MG_xxxx.JPG' filename. "
+	                         "If none are given, the current directory is searched.")
+	
+	parser.add_argument("-j", "--jobs", type=int, default=1,
+	                    help="Number of worker processes to convert images with (0 = one per core)")
+	
+	parser.add_argument("-b", "--backend", choices=sorted(COLOR_BACKENDS.keys()), default='cms',
+	                    help="Colour conversion backend: 'cms' = LittleCMS (exact), "
+	                         "'lut' = cached lookup table (faster, requires NumPy)")
+	
+	parser.add_argument("-r", "--recursive", action='store_true',
+	                    help="Search subdirectories of any directories given too")
+	
+	parser.add_argument("-a", "--all", action='store_true',
+	                    help="Convert all images, instead of skipping those whose headers say they're sRGB already")
+	
+	parser.add_argument("-s", "--max-size", type=int, action='append', dest='sizes', metavar='SIZE',
+	                    help="Scale images down so that their longest edge is at most SIZE pixels. "
+	                         "Can be given several times to output several sizes from a single decode "
+	                         "(in which case each output gets a '_<SIZE>px' suffix)")
+	
+	parser.add_argument("-i", "--incremental", action='store_true',
+	                    help="Only convert images that are new or have changed since the last run "
+	                         "(tracked using a '%s' file in each directory)" % (MANIFEST_FILENAME))
+	
+	parser.add_argument("--benchmark", action='store_true',
+	                    help="Compare the speed + output of the colour conversion backends on synthetic images, then exit")
+	
+	return parser.parse_args()
 
-	#if is_adobe_rgb(img):
-	#img =  adobe_to_srgb(img)
-	img =  adobe_to_srgb__fast(img)
+
+def main():
+	config = get_config()
+	
+	if (config.backend == 'lut' or config.benchmark) and np is None:
+		print("ERROR: NumPy is needed for the 'lut' backend", file=sys.stderr)
+		sys.exit(-1)
+	
+	if config.sizes:
+		if min(config.sizes) <= 0:
+			print("ERROR: Sizes must be positive", file=sys.stderr)
+			sys.exit(-1)
+		
+		# Remove duplicates (as they'd just end up overwriting each other)
+		config.sizes = sorted(set(config.sizes), reverse=True)
+	
+	if config.benchmark:
+		benchmark_backends()
+		return
+	
+	if config.paths:
+		# Check on each path supplied...
+		print("Checking supplied paths...")
+		images = []
+		
+		for path in config.paths:
+			if os.path.isdir(path):
+				# Directory - Find everything interesting there to convert
+				images += find_images(path, config.recursive)
+			elif path.isdigit():
+				# Partial filename - just the digits, for convenience
+				# TODO: Check that a corresponding file actually exists..
+				path = "_MG_%s.JPG" % (path)
+				if not os.path.exists(path):
+					print("   ERROR: '%s' does not exist" % (path))
+				else:
+					images.append(path)
+			elif not os.path.exists(path):
+				# Invalid Filename
+				print("  ERROR: '%s' is not a valid path" % (path))
+			else:
+				# Valid Filename - Assume that this is an image
+				# TODO: Check that it is an image...
+				images.append(path)
+	else:
+		# Hunt for picasa exports / camera raw exports
+		print("sys.argv = %s\n\n" % (sys.argv))
+		
+		print("Finding images...")
+		images = find_images(os.curdir, config.recursive)
+	
+	# Report how many were found
+	N = len(images)
+	print("\n\nFound %d Images" % (N))
+	PREVIEW_LIMIT = 30
+	
+	if N == 0:
+		# Silently exit if nothing found
+		sys.exit(1)
+	elif N < PREVIEW_LIMIT:
+		# Show what we found if there aren't too many
+		# (Use this when debugging, to ensure we're culling the right ones)
+		print("   %s\n\n" % (images))
+	else:
+		# Don't print all of them (as then we miss the full count)
+		# (Useful when doing production exports on datasets with 100-600 shots)
+		print("   %s\n    + '[... %d more...]\n\n'" % (images[:50], N - 50))
+	
+	# Skip images that are sRGB already
+	if not config.all:
+		images = [fileN for fileN in images if is_adobe_rgb(fileN)]
+		print("Skipping %d images that are sRGB already" % (N - len(images)))
+		N = len(images)
 	
-	# Save file again, replacing the underscore for a "I"
-	# FIXME: This breaks if we use a filename with path embedded
-	new_fileN = "I%s" % (fileN[1:])
-	img.save(new_fileN, exif=exif)
+	# Skip images that were already converted on a previous run
+	if config.incremental:
+		manifest = ConversionManifest()
+		images = [fileN for fileN in images
+		          if manifest.needs_conversion(fileN, output_filenames_for(fileN, config.sizes))]
+		print("Skipping %d images that are already up to date" % (N - len(images)))
+		
+		N = len(images)
+		work_fn = functools.partial(convert_image__tracked, backend=config.backend, sizes=config.sizes)
+	else:
+		manifest = None
+		work_fn = functools.partial(convert_image, backend=config.backend, sizes=config.sizes)
 	
+	# Process images
+	if config.backend == 'lut' and N > 0:
+		# Make sure the LUT is baked before any workers go looking for it
+		get_color_lut()
+	
+	jobs = config.jobs or os.cpu_count()
+	if jobs > 1 and N > 1:
+		print("Using %d worker processes...\n" % (jobs))
+		results = convert_images_parallel(images, min(jobs, N), work_fn)
+	else:
+		results = convert_images_serial(images, work_fn)
+	
+	try:
+		for fileN, result in results:
+			if manifest:
+				manifest.record(fileN, *result)
+				manifest.save()
+	finally:
+		# Make sure that everything done so far is recorded, even if interrupted
+		if manifest:
+			manifest.save(force=True)
+
+
+if __name__ == '__main__':
+	main()
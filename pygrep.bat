@@ -1 +1 @@
-grep -irn --include="*.py" %* *
\ No newline at end of file
+@python3 "%~dp0code_search.py" -G --include="*.py" %*
\ No newline at end of file
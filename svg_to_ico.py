@@ -3,47 +3,139 @@
 # Utility to render a Windows ICO file from a given SVG file
 #
 # Uses Python-Qt bindings for rendering the SVG, and Pillow for saving
-# an ICO archive from that image data
+# an ICO archive from that image data. Each of the icon sizes gets
+# rendered separately (straight from the SVG), so small icons stay sharp.
+#
+# Whole folders (or globs) of SVG's can be converted in one go, and with
+# "--watch", this keeps running, re-rendering any SVG's that get changed.
+# This saves having to pay for starting Qt up again for each icon.
 #
 # TODO: Try to use inkscape for rendering if "-inkscape" arg is given instead
 
 import sys
 
+import argparse
+import concurrent.futures
+import glob
+import hashlib
 import importlib.util
 import os
 import pathlib
+import time
+
+# Time taken to import Qt (and create the QApplication) is reported, as that's most of the time for single icons
+IMPORT_START_TIME = time.perf_counter()
 
 # FIXME: Find a way to NOT have to fully repeat these like this.
 #        Unfortunately, cannot get Py3.12 / PySide6 to accept "from QtCore import QSize"
 if importlib.util.find_spec("PySide6") is not None:
 	import PySide6
-	from PySide6.QtCore import QSize
+	from PySide6.QtCore import QRectF, QSize
 	from PySide6.QtWidgets import QApplication
+	from PySide6.QtSvg import QSvgRenderer
 
 	from PySide6.QtGui import (
 		QIcon,
 		QImage,
+		QPainter,
 		QPixmap,
 	)
+
+	QIMAGE_FORMAT_RGBA8888 = QImage.Format.Format_RGBA8888
 elif importlib.util.find_spec("PyQt5") is not None:
 	import PyQt5
-	from PyQt5.QtCore import QSize
+	from PyQt5.QtCore import QRectF, QSize
 	from PyQt5.QtWidgets import QApplication
+	from PyQt5.QtSvg import QSvgRenderer
 
 	from PyQt5.QtGui import (
 		QIcon,
 		QImage,
+		QPainter,
 		QPixmap,
 	)
+
+	QIMAGE_FORMAT_RGBA8888 = QImage.Format_RGBA8888
 else:
 	print("ERROR: Could not import PySide6 or PyQt5 (as checked using importlib.util.find_spec())")
 	sys.exit(-1)
 
 from PIL import Image
 
+QT_IMPORT_TIME = time.perf_counter() - IMPORT_START_TIME
+
 ###############################################
 # SVG to ICO file conversion logic
 
+# Sizes of the images included in the ICO files (i.e. all the standard icon sizes)
+ICON_SIZES = (16, 24, 32, 48, 64, 128, 256)
+
+
+# Render an SVG file at the given size
+# < renderer: (QSvgRenderer) Renderer with the SVG loaded
+# < size: (int) Width/height of the icon
+# > returns: (QImage) The rendered image (RGBA), with the SVG centered in it (keeping its aspect ratio)
+def render_svg_image(renderer, size):
+	qt_image = QImage(size, size, QIMAGE_FORMAT_RGBA8888)
+	qt_image.fill(0)  # Transparent
+	
+	# Fit the SVG within the icon, keeping its proportions
+	view_box = renderer.viewBoxF()
+	if view_box.width() > 0 and view_box.height() > 0:
+		scale = min(size / view_box.width(), size / view_box.height())
+	else:
+		scale = 0
+	
+	if scale:
+		w = view_box.width() * scale
+		h = view_box.height() * scale
+		target = QRectF((size - w) / 2, (size - h) / 2, w, h)
+	else:
+		target = QRectF(0, 0, size, size)
+	
+	painter = QPainter(qt_image)
+	renderer.render(painter, target)
+	painter.end()
+	
+	return qt_image
+
+
+# Wrap a rendered QImage as a PIL image, without copying the pixel data
+# NOTE: The PIL image uses the QImage's memory, so the QImage must be kept around for as long as it's in use
+def qimage_to_pil(qt_image):
+	bits = qt_image.constBits()
+	if hasattr(bits, 'setsize'):
+		# PyQt5 gives back a "sip.voidptr" which needs to be told how big it is first
+		bits.setsize(qt_image.sizeInBytes())
+	
+	return Image.frombuffer('RGBA', (qt_image.width(), qt_image.height()), bits,
+	                        'raw', 'RGBA', qt_image.bytesPerLine(), 1)
+
+
+# Render an SVG file at each of the icon sizes
+# < src_path: (str | pathlib.Path) Input SVG filename
+# < sizes: ([int]) Width/height of each of the images to render
+# > returns: ([QImage], [PIL.Image]) The rendered images (as both QImages, and PIL images sharing their memory)
+def render_svg_frames(src_path, sizes=ICON_SIZES):
+	renderer = QSvgRenderer(str(src_path))
+	if not renderer.isValid():
+		raise ValueError("Could not load SVG file '%s'" % (src_path))
+	
+	qt_images = [render_svg_image(renderer, size) for size in sizes]
+	frames = [qimage_to_pil(qt_image) for qt_image in qt_images]
+	return (qt_images, frames)
+
+
+# Save a set of images (one per icon size) as an ICO file
+# < frames: ([PIL.Image]) Images for each of the sizes included in the ICO
+def save_ico(dst_path, frames):
+	# NOTE: Pillow uses the images given for each size as-is (instead of scaling down the biggest one)
+	frames = sorted(frames, key=lambda frame: frame.size[0], reverse=True)
+	frames[0].save(dst_path, format='ICO',
+	               sizes=[frame.size for frame in frames],
+	               append_images=frames[1:])
+
+
 # Convert the given SVG file to an ICO equivalent
 # < src_path: (str | pathlib.Path) Input SVG filename
 # < dst_path: (str | pathlib.Path) Output SVG filename
@@ -54,51 +146,165 @@ def convert_svg_to_ico(src_path, dst_path):
 	
 	print("Converting '%s' => '%s'..." % (src_path, dst_path))
 	
-	# Load the source image with PyQt's image renderer
-	qt_image = QImage(src_path)
+	# Render each of the icon sizes directly from the SVG
+	# NOTE: "qt_images" needs to stay alive until the ICO is saved, as the frames use their memory
+	qt_images, frames = render_svg_frames(src_path)
 	
-	# Render/save this to a raster image on disk
-	# Note: This is easier than trying to do it with NumPy buffer conversions
-	# TODO: Render this to a higher resolution so the downsampling can work nicer
-	TMP_FILENAME = "svg2ico_tmp_render.png"
+	# Save to ICO
+	save_ico(dst_path, frames)
+
+###############################################
+# Batch Conversion
+
+# Check whether a file is an SVG file (going by its name)
+def is_svg_file(path):
+	return os.fspath(path).lower().endswith(".svg")
+
+
+# Get the paths given on the command-line that name files which aren't SVG's
+# NOTE: find_svg_files() leaves these out, so they need reporting separately (and only once, when watching)
+def find_non_svg_files(paths):
+	return [path for path in paths if not (os.path.isdir(path) or glob.has_magic(path) or is_svg_file(path))]
+
+
+# Find all the SVG files from the given files/folders/globs
+# > returns: ([pathlib.Path]) SVG files found (sorted, without duplicates)
+def find_svg_files(paths):
+	svg_files = set()
+	for path in paths:
+		if os.path.isdir(path):
+			svg_files.update(p for p in pathlib.Path(path).iterdir() if is_svg_file(p))
+		elif glob.has_magic(path):
+			svg_files.update(pathlib.Path(p) for p in glob.glob(path) if is_svg_file(p))
+		elif is_svg_file(path):
+			svg_files.add(pathlib.Path(path))
+	return sorted(svg_files)
+
+
+# Convert an SVG file to an ICO (with the same name), keeping track of how long it took
+# > returns: (pathlib.Path, float, Exception | None) The ICO file, time taken, and any error
+def convert_svg_to_ico__timed(svg_filename):
+	ico_filename = svg_filename.with_suffix('.ico')
+	t0 = time.perf_counter()
+	try:
+		convert_svg_to_ico(svg_filename, ico_filename)
+		return (ico_filename, time.perf_counter() - t0, None)
+	except Exception as e:
+		return (ico_filename, time.perf_counter() - t0, e)
+
+
+# Convert a batch of SVG files, using a pool of threads
+# NOTE: QSvgRenderer + QPainter can render into QImages from any thread
+# > returns: (int) Number of files that couldn't be converted
+def convert_batch(svg_files, jobs):
+	t0 = time.perf_counter()
+	failed = 0
 	
-	qt_image.save(TMP_FILENAME)
+	with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+		for svg_filename, (ico_filename, elapsed, error) in zip(svg_files, executor.map(convert_svg_to_ico__timed, svg_files)):
+			if error:
+				print(f"ERROR: Could not convert '{svg_filename}' - {error}")
+				failed += 1
+			else:
+				print(f"   '{ico_filename}' done in {elapsed * 1000:.1f} ms")
 	
-	# Load tempfile using PIL
-	py_image = Image.open(TMP_FILENAME)
+	elapsed = time.perf_counter() - t0
+	print(f"Converted {len(svg_files) - failed} of {len(svg_files)} icons in {elapsed * 1000:.1f} ms")
+	return failed
+
+
+# Get the hash of a file's contents
+def hash_file(fileN):
+	with open(fileN, 'rb') as f:
+		return hashlib.sha1(f.read()).hexdigest()
+
+
+# Keep watching the given files/folders/globs, and re-render any SVG files whose contents change
+# NOTE: Files are only re-read when their size/mtime change, and only re-rendered if their contents did too
+def watch_for_changes(paths, jobs, interval):
+	known = {}   # Map from SVG files to the (size, mtime_ns, hash) they had when last rendered
 	
-	# Save to ICO
-	py_image.save(dst_path)
+	def find_changed_files():
+		changed = []
+		for svg_filename in find_svg_files(paths):
+			try:
+				st = svg_filename.stat()
+				stamp = (st.st_size, st.st_mtime_ns)
+				
+				old = known.get(svg_filename)
+				if old and old[:2] == stamp:
+					continue
+				
+				content_hash = hash_file(svg_filename)
+			except OSError:
+				# Removed (or still being written)
+				continue
+			
+			known[svg_filename] = stamp + (content_hash,)
+			if not old or old[2] != content_hash:
+				changed.append(svg_filename)
+		return changed
+	
+	# Render everything to start with
+	convert_batch(find_changed_files(), jobs)
 	
-	# Remove the tempfile
-	os.remove(TMP_FILENAME)
+	print(f"\nWatching for changes (every {interval} s)... Press Ctrl+C to stop")
+	try:
+		while True:
+			time.sleep(interval)
+			changed = find_changed_files()
+			if changed:
+				print(f"\n{len(changed)} files changed:")
+				convert_batch(changed, jobs)
+	except KeyboardInterrupt:
+		print("\nStopped watching")
 
 ###############################################
 
+# Handle command-line arguments
+def get_config():
+	parser = argparse.ArgumentParser(
+		description = "Render Windows ICO files from SVG files")
+	
+	parser.add_argument("paths", nargs='+',
+	                    help="SVG files, folders containing SVG files, or globs (e.g. 'icons/*.svg')")
+	
+	parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+	                    help="Number of icons to render at once (default: one per core)")
+	
+	parser.add_argument("-w", "--watch", action="store_true",
+	                    help="Keep running, and re-render any SVG files that change")
+	parser.add_argument("--interval", type=float, default=0.5,
+	                    help="How often to check for changes when watching (in seconds)")
+	
+	return parser.parse_args()
+
 
 if __name__ == '__main__':
+	if len(sys.argv) == 1:
+		print("Usage: svg_to_ico.py <path_to_svg_1.svg> <...>")
+		sys.exit()
+	
+	config = get_config()
+	
 	# QApplication so QPixmap works
-	app = QApplication(sys.argv)
+	# NOTE: Only one of these is created, however many icons get rendered
+	t0 = time.perf_counter()
+	app = QApplication(sys.argv[:1])
+	print(f"Qt startup: {QT_IMPORT_TIME * 1000:.1f} ms importing + {(time.perf_counter() - t0) * 1000:.1f} ms creating QApplication")
 	
-	# Get files to operate on
-	# TODO: Filter out any arguments first, then the rest are files
-	files = sys.argv[1:]
+	jobs = max(1, config.jobs)
 	
-	if len(files) == 0:
-		print("Usage: svg_to_ico.py <path_to_svg_1.svg> <...>")
-		sys.exit()
+	# Validate that we only have SVG's
+	for path in find_non_svg_files(config.paths):
+		print(f"ERROR: '{path}' is not a valid svg file for processing. Skipping...")
 	
-	# Main application icon
-	for fileN in files:
-		# Validate that we have an SVG
-		svg_filename = pathlib.Path(fileN)
-		if not svg_filename.suffix.lower() == '.svg':
-			print(f"ERROR: '{fileN}' is not a valid svg file for processing. Skipping...")
-			continue;
+	if config.watch:
+		watch_for_changes(config.paths, jobs, config.interval)
+	else:
+		# Get files to operate on
+		svg_files = find_svg_files(config.paths)
 		
-		# Convert filename to the output .ico one
-		ico_filename = svg_filename.with_suffix('.ico')
-		
-		# Perform the conversion
-		convert_svg_to_ico(svg_filename, ico_filename)
-
+		failed = convert_batch(svg_files, jobs)
+		if failed:
+			sys.exit(1)
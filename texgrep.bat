@@ -1 +1 @@
-grep -irn --include="*.tex" %* *
+@python3 "%~dp0code_search.py" -G --include="*.tex" %*
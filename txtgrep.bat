@@ -1 +1 @@
-grep -irn --include="*.txt" %* *
+@python3 "%~dp0code_search.py" -G --include="*.txt" %*
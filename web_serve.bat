@@ -1,4 +1,4 @@
 @echo off
 echo Running Python server for %cd%
 start firefox http://localhost:8000
-python3 -m http.server
+python3 "%~dp0web_serve.py"
@@ -0,0 +1,537 @@
+#!/usr/bin/python3 $@
+
+# Static file server for previewing websites / exported photo galleries
+# (a drop-in replacement for "python3 -m http.server", as used by web_serve.bat)
+#
+# Compared to the stdlib server, this:
+#  * Keeps connections open between requests (HTTP/1.1 keep-alive), with each connection
+#    being handled by one of a fixed pool of threads
+#  * Sends files using sendfile() where possible (so the data doesn't go through Python)
+#  * Supports Range requests (e.g. for seeking in videos / resuming downloads)
+#  * Sends ETag + Last-Modified headers, so that browsers can revalidate (304) instead
+#    of downloading everything again
+#  * Keeps small files in an in-memory LRU cache
+#  * Serves precompressed "<file>.gz" files instead of "<file>" where they exist (and the
+#    browser accepts gzip)
+#
+# Use "--benchmark" to compare it against the stdlib server.
+#
+# Date: 16 October 2026
+
+import sys
+import os
+import argparse
+import collections
+import concurrent.futures
+import email.utils
+import functools
+import http.server
+import threading
+import time
+
+from http import HTTPStatus
+
+#######################################
+# Small File Cache
+
+# Files up to this size can be cached in memory
+CACHE_MAX_FILE_SIZE = 256 * 1024
+
+# Default total size of the in-memory cache (0 = disabled)
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+
+# LRU cache for the contents of small files
+# NOTE: Entries are only used while the file's mtime + size still match what got cached
+class SmallFileCache:
+	# < max_size: (int) Max total size (in bytes) of the files kept in the cache
+	def __init__(self, max_size, max_file_size=CACHE_MAX_FILE_SIZE):
+		self.max_size = max_size
+		self.max_file_size = min(max_file_size, max_size)
+		
+		self.entries = collections.OrderedDict()   # path -> (mtime_ns, size, bytes)
+		self.total_size = 0
+		self.lock = threading.Lock()
+	
+	# Get the contents of the given file, if they're in the cache
+	# < st: (os.stat_result) Current stat info for the file
+	# > returns: (bytes | None) File contents
+	def get(self, path, st):
+		with self.lock:
+			entry = self.entries.get(path)
+			if entry is None:
+				return None
+			
+			mtime_ns, size, data = entry
+			if (mtime_ns != st.st_mtime_ns) or (size != st.st_size):
+				# Stale
+				del self.entries[path]
+				self.total_size -= size
+				return None
+			
+			self.entries.move_to_end(path)
+			return data
+	
+	# Check whether a file of the given size should be cached
+	def accepts(self, size):
+		return size <= self.max_file_size
+	
+	# Add a file to the cache, evicting the least recently used files to make space
+	def put(self, path, st, data):
+		if not self.accepts(len(data)):
+			return
+		
+		with self.lock:
+			old = self.entries.pop(path, None)
+			if old is not None:
+				self.total_size -= old[1]
+			
+			self.entries[path] = (st.st_mtime_ns, len(data), data)
+			self.total_size += len(data)
+			
+			while self.total_size > self.max_size:
+				_path, (_mtime_ns, size, _data) = self.entries.popitem(last=False)
+				self.total_size -= size
+
+#######################################
+# Request Handling
+
+# How long (in seconds) to keep idle connections open for
+KEEPALIVE_TIMEOUT = 15
+
+
+# Raised when the requested range doesn't overlap the file at all (i.e. 416)
+class RangeNotSatisfiable(Exception):
+	pass
+
+
+# Parse the "Range" header of a request
+# NOTE: Only single ranges are supported. Anything else just gets the whole file (which is allowed)
+# < header: (str) Value of the "Range" header
+# < size: (int) Size of the file
+# > returns: ((int, int) | None) First + last byte (inclusive) to send. None = send the whole file
+# > throws "RangeNotSatisfiable" if the range is past the end of the file
+def parse_range(header, size):
+	units, _, spec = header.partition('=')
+	if units.strip().lower() != 'bytes' or ',' in spec:
+		return None
+	
+	first, sep, last = spec.strip().partition('-')
+	if not sep:
+		return None
+	
+	try:
+		if not first:
+			# Suffix range (i.e. the last N bytes)
+			n = int(last)
+			if (n <= 0) or (size == 0):
+				raise RangeNotSatisfiable()
+			return (max(0, size - n), size - 1)
+		
+		first = int(first)
+		last = int(last) if last else None
+	except ValueError:
+		return None
+	
+	if (last is not None) and (first > last):
+		return None
+	elif first >= size:
+		raise RangeNotSatisfiable()
+	return (first, size - 1 if last is None else min(last, size - 1))
+
+
+# Make the ETag for a file, from its stat info
+def make_etag(st, suffix=""):
+	return '"%x-%x%s"' % (st.st_mtime_ns, st.st_size, suffix)
+
+
+class StaticFileHandler(http.server.SimpleHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+	server_version = "web_serve/1.0"
+	
+	# Idle keep-alive connections get closed after this (see StreamRequestHandler.setup())
+	timeout = KEEPALIVE_TIMEOUT
+	
+	# Headers + body get sent separately, so with keep-alive, Nagle's algorithm would end up
+	# holding back the body until the client's (delayed) ACK for the headers turns up
+	disable_nagle_algorithm = True
+	
+	# Set by the server
+	cache = None
+	quiet = False
+	
+	def do_GET(self):
+		self.serve_request(send_body=True)
+	
+	def do_HEAD(self):
+		self.serve_request(send_body=False)
+	
+	def log_message(self, format, *args):
+		if not self.quiet:
+			super().log_message(format, *args)
+	
+	# Handle a GET/HEAD request
+	def serve_request(self, send_body):
+		path = self.translate_path(self.path)
+		if os.path.isdir(path) or path.endswith('/'):
+			if not self.path.split('?', 1)[0].endswith('/'):
+				# Let the stdlib deal with redirects (+ 404's for files with trailing slashes)
+				self.copy_stdlib_response(send_body)
+				return
+			
+			for index in ("index.html", "index.htm"):
+				if os.path.isfile(os.path.join(path, index)):
+					path = os.path.join(path, index)
+					break
+			else:
+				# Directory listing
+				self.copy_stdlib_response(send_body)
+				return
+		
+		try:
+			st = os.stat(path)
+		except OSError:
+			self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+			return
+		
+		content_type = self.guess_type(path)
+		
+		# Use the precompressed version of the file instead if there is one
+		content_encoding = None
+		etag_suffix = ""
+		if self.accepts_gzip():
+			try:
+				gz_st = os.stat(path + ".gz")
+				if gz_st.st_mtime_ns >= st.st_mtime_ns:
+					path = path + ".gz"
+					st = gz_st
+					content_encoding = "gzip"
+					etag_suffix = "-gz"
+			except OSError:
+				pass
+		
+		etag = make_etag(st, etag_suffix)
+		last_modified = self.date_time_string(st.st_mtime)
+		
+		if self.is_not_modified(etag, st):
+			self.send_response(HTTPStatus.NOT_MODIFIED)
+			self.send_header("ETag", etag)
+			self.send_header("Last-Modified", last_modified)
+			self.end_headers()
+			return
+		
+		size = st.st_size
+		byte_range = None
+		if "Range" in self.headers and self.is_range_current(etag, st):
+			try:
+				byte_range = parse_range(self.headers["Range"], size)
+			except RangeNotSatisfiable:
+				self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+				self.send_header("Content-Range", "bytes */%d" % (size))
+				self.send_header("Content-Length", "0")
+				self.end_headers()
+				return
+		
+		if byte_range:
+			first, last = byte_range
+			self.send_response(HTTPStatus.PARTIAL_CONTENT)
+			self.send_header("Content-Range", "bytes %d-%d/%d" % (first, last, size))
+		else:
+			first, last = (0, size - 1)
+			self.send_response(HTTPStatus.OK)
+		
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(last - first + 1))
+		self.send_header("Accept-Ranges", "bytes")
+		self.send_header("ETag", etag)
+		self.send_header("Last-Modified", last_modified)
+		self.send_header("Vary", "Accept-Encoding")
+		if content_encoding:
+			self.send_header("Content-Encoding", content_encoding)
+		self.end_headers()
+		
+		if send_body and size:
+			try:
+				self.send_file_data(path, st, first, last - first + 1)
+			except (BrokenPipeError, ConnectionResetError):
+				self.close_connection = True
+	
+	# Send (part of) a file's contents
+	def send_file_data(self, path, st, offset, count):
+		if self.cache:
+			data = self.cache.get(path, st)
+			if data is not None:
+				self.wfile.write(data[offset:offset+count])
+				return
+		
+		with open(path, 'rb') as f:
+			if self.cache and self.cache.accepts(st.st_size):
+				data = f.read()
+				if len(data) == st.st_size:
+					self.cache.put(path, st, data)
+				self.wfile.write(data[offset:offset+count])
+			else:
+				# NOTE: Headers have already been written out (as wfile is unbuffered), so this can go straight to the socket
+				self.connection.sendfile(f, offset, count)
+	
+	# Pass the request through to SimpleHTTPRequestHandler (for directory listings + redirects)
+	def copy_stdlib_response(self, send_body):
+		f = self.send_head()
+		if f:
+			try:
+				if send_body:
+					self.copyfile(f, self.wfile)
+			finally:
+				f.close()
+	
+	# Check whether the client accepts gzip'ed responses
+	def accepts_gzip(self):
+		for coding in self.headers.get("Accept-Encoding", "").split(','):
+			name, _, params = coding.partition(';')
+			if name.strip().lower() == "gzip":
+				return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+		return False
+	
+	# Check the conditional request headers, to see whether the client's copy is still current
+	def is_not_modified(self, etag, st):
+		if "If-None-Match" in self.headers:
+			# NOTE: This takes precedence over If-Modified-Since
+			tags = [tag.strip() for tag in self.headers["If-None-Match"].split(',')]
+			return ("*" in tags) or any(tag.replace("W/", "", 1) == etag for tag in tags)
+		elif "If-Modified-Since" in self.headers:
+			try:
+				since = email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"]).timestamp()
+			except (TypeError, IndexError, OverflowError, ValueError):
+				return False
+			return int(st.st_mtime) <= since
+		return False
+	
+	# Check the "If-Range" header, to see whether a Range request is still for the current version of the file
+	def is_range_current(self, etag, st):
+		if_range = self.headers.get("If-Range")
+		if not if_range:
+			return True
+		elif if_range.startswith('"'):
+			return if_range == etag
+		else:
+			return if_range == self.date_time_string(st.st_mtime)
+
+#######################################
+# Server
+
+# Number of threads handling connections
+# NOTE: Each keep-alive connection ties up a thread until it's closed/times out,
+#       so this needs to be well above the number browsers open (~6 per site)
+DEFAULT_THREADS = 64
+
+
+# HTTP server that handles connections using a fixed pool of threads
+# (instead of ThreadingHTTPServer's new thread for each connection)
+class ThreadPoolHTTPServer(http.server.HTTPServer):
+	# < n_threads: (int) Number of connections which can be handled at once
+	def __init__(self, server_address, handler_class, n_threads=DEFAULT_THREADS):
+		super().__init__(server_address, handler_class)
+		self.executor = concurrent.futures.ThreadPoolExecutor(n_threads, thread_name_prefix="web_serve")
+	
+	def process_request(self, request, client_address):
+		self.executor.submit(self.process_request_thread, request, client_address)
+	
+	def process_request_thread(self, request, client_address):
+		try:
+			self.finish_request(request, client_address)
+		except Exception:
+			self.handle_error(request, client_address)
+		finally:
+			self.shutdown_request(request)
+	
+	def server_close(self):
+		super().server_close()
+		self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Create the server for the given directory
+# < config: (Namespace) Settings from get_config()
+def make_server(config):
+	handler_class = type("Handler", (StaticFileHandler,), {
+		'cache': SmallFileCache(config.cache_size) if config.cache_size > 0 else None,
+		'quiet': config.quiet,
+	})
+	handler = functools.partial(handler_class, directory=os.path.abspath(config.directory))
+	
+	return ThreadPoolHTTPServer((config.bind, config.port), handler, config.threads)
+
+#######################################
+# Benchmarking
+#
+# Runs the stdlib server and this one (each in their own process) on a temp dir of
+# fake photos, and has a bunch of client threads hammer them with requests
+# (using keep-alive wherever the server allows it).
+
+# Sets of files to request: (name, number of files, size of each file)
+BENCHMARK_SETS = [
+	("thumbnails", 200, 16 * 1024),
+	("photos", 20, 4 * 1024 * 1024),
+]
+
+# Number of clients making requests at once
+BENCHMARK_CLIENTS = 8
+
+# How long to spend on each test (in seconds)
+BENCHMARK_DURATION = 5.0
+
+
+# Have a bunch of clients repeatedly request the given paths for a while
+# > returns: (int, int, int) Number of requests completed, number of bytes received, and number of errors
+def run_load_test(port, paths, n_clients=BENCHMARK_CLIENTS, duration=BENCHMARK_DURATION):
+	import http.client
+	
+	deadline = time.perf_counter() + duration
+	totals = [0, 0, 0]
+	lock = threading.Lock()
+	
+	def client(offset):
+		n_requests = n_bytes = n_errors = 0
+		conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+		i = offset
+		while time.perf_counter() < deadline:
+			try:
+				# NOTE: HTTPConnection reconnects by itself when the server closes the connection
+				conn.request("GET", paths[i % len(paths)])
+				response = conn.getresponse()
+				n_bytes += len(response.read())
+				if response.status == 200:
+					n_requests += 1
+				else:
+					n_errors += 1
+			except (OSError, http.client.HTTPException):
+				n_errors += 1
+				conn.close()
+			i += 1
+		conn.close()
+		
+		with lock:
+			totals[0] += n_requests
+			totals[1] += n_bytes
+			totals[2] += n_errors
+	
+	threads = [threading.Thread(target=client, args=(i * 7,)) for i in range(n_clients)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	
+	return tuple(totals)
+
+
+# Wait for a server to start accepting connections
+def wait_for_server(port, timeout=10):
+	import socket
+	
+	deadline = time.time() + timeout
+	while time.time() < deadline:
+		try:
+			socket.create_connection(("127.0.0.1", port), timeout=1).close()
+			return True
+		except OSError:
+			time.sleep(0.1)
+	return False
+
+
+# Find a port that nothing is listening on
+def find_free_port():
+	import socket
+	
+	with socket.socket() as s:
+		s.bind(("127.0.0.1", 0))
+		return s.getsockname()[1]
+
+
+# Compare this server against the stdlib one
+def run_benchmark():
+	import subprocess
+	import tempfile
+	
+	servers = [
+		("http.server", [sys.executable, "-m", "http.server", "--bind", "127.0.0.1"]),
+		("web_serve", [sys.executable, os.path.abspath(__file__), "--quiet", "--bind", "127.0.0.1"]),
+	]
+	
+	with tempfile.TemporaryDirectory(prefix="web_serve_benchmark_") as root:
+		file_sets = {}
+		for name, n_files, size in BENCHMARK_SETS:
+			os.makedirs(os.path.join(root, name))
+			file_sets[name] = []
+			for i in range(n_files):
+				fileN = "%s/%04d.jpg" % (name, i)
+				with open(os.path.join(root, fileN), 'wb') as f:
+					f.write(os.urandom(size))
+				file_sets[name].append("/" + fileN)
+		
+		print("%d clients, %.0f s per test" % (BENCHMARK_CLIENTS, BENCHMARK_DURATION))
+		for server_name, cmd in servers:
+			port = find_free_port()
+			proc = subprocess.Popen(cmd + ["--directory", root, str(port)],
+			                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+			try:
+				if not wait_for_server(port):
+					print("! %s didn't start" % (server_name), file=sys.stderr)
+					continue
+				
+				for set_name, paths in file_sets.items():
+					n_requests, n_bytes, n_errors = run_load_test(port, paths)
+					print("   %-12s %-12s %8.0f req/s  %8.1f MB/s  %s" % (
+					      server_name, set_name,
+					      n_requests / BENCHMARK_DURATION,
+					      n_bytes / 1e6 / BENCHMARK_DURATION,
+					      ("(%d errors)" % (n_errors)) if n_errors else ""))
+			finally:
+				proc.terminate()
+				proc.wait()
+
+#######################################
+
+# Handle command-line arguments
+# NOTE: These are the same as for "python3 -m http.server"
+def get_config():
+	parser = argparse.ArgumentParser(
+		description = "Serve the files in a directory over HTTP (for previewing websites)")
+	
+	parser.add_argument("port", nargs='?', type=int, default=8000,
+	                    help="Port to listen on (default: %(default)s)")
+	parser.add_argument("-b", "--bind", default="",
+	                    help="Address to listen on (default: all interfaces)")
+	parser.add_argument("-d", "--directory", default=os.getcwd(),
+	                    help="Directory to serve (default: current directory)")
+	
+	parser.add_argument("-t", "--threads", type=int, default=DEFAULT_THREADS,
+	                    help="Number of connections to handle at once (default: %(default)s)")
+	parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+	                    help="Size of the in-memory cache for small files, in MB (0 = disabled, default: %(default)s)")
+	parser.add_argument("-q", "--quiet", action="store_true",
+	                    help="Don't log each request")
+	
+	parser.add_argument("--benchmark", action="store_true",
+	                    help="Compare the speed of this server against 'python3 -m http.server'")
+	
+	config = parser.parse_args()
+	config.cache_size *= 1024 * 1024
+	return config
+
+
+def main():
+	config = get_config()
+	
+	if config.benchmark:
+		run_benchmark()
+		return
+	
+	with make_server(config) as server:
+		host, port = server.server_address[:2]
+		print("Serving %s on http://%s:%d/" % (config.directory, host or "localhost", port))
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			print("\nStopping...")
+
+if __name__ == '__main__':
+	main()